@@ -10,10 +10,58 @@
 #include "fblas.h"
 //#include "fci.h"
 
+static void _ddstr2csdstr (uint64_t * npair, uint64_t * dconf_str, uint64_t * sconf_str,
+                           uint64_t * spins_str, uint64_t astr, uint64_t bstr, int norb)
+{
+    int iorb;
+    int isorb = 0;
+    int ispin = 0;
+    *npair = 0;
+    *dconf_str = 0;
+    *sconf_str = 0;
+    *spins_str = 0;
+    for (iorb = 0; iorb < norb; iorb++){
+        if ((1ULL << iorb) & astr & bstr) { /* DOUBLY OCCUPIED */
+            (*npair)++;
+            *dconf_str |= 1ULL << iorb; /* This is adding 2 electrons at position iorb */
+        } else if ((1ULL << iorb) & (astr | bstr)) { /* SINGLY OCCUPIED */
+            *sconf_str |= 1ULL << isorb; /* This is adding 1 electron at non-double position isorb */
+            isorb++;
+            if ((1ULL << iorb) & astr) { *spins_str |= 1ULL << ispin ; } /* This is adding 1 alpha spin state at spin ispin */
+            ispin++;
+        } else { isorb++; } /* VIRTUAL */
+    }
+}
+
+static void _csdstr2ddstr (uint64_t * astr, uint64_t * bstr, uint64_t dconf_str, uint64_t sconf_str,
+                           uint64_t spins_str, int norb)
+{
+    int iorb;
+    int isorb = 0;
+    int ispin = 0;
+    *astr = 0;
+    *bstr = 0;
+    for (iorb = 0; iorb < norb; iorb++){
+        if ((1ULL << iorb) & dconf_str){
+            *astr |= 1ULL << iorb;
+            *bstr |= 1ULL << iorb;
+        } else {
+            if ((1ULL << isorb) & sconf_str){
+                if ((1ULL << ispin) & spins_str){
+                    *astr |= 1ULL << iorb;
+                } else {
+                    *bstr |= 1ULL << iorb;
+                }
+                ispin++;
+            }
+            isorb++;
+        }
+    }
+}
+
 void FCICSFddstrs2csdstrs (uint64_t * csdstrs, uint64_t * ddstrs, int nstr, int norb, int neleca, int nelecb)
 {
 
-    int i, iorb, isorb, ispin;
     uint64_t * astrs = ddstrs;
     uint64_t * bstrs = & ddstrs[nstr];
     uint64_t * npairs = csdstrs;
@@ -21,67 +69,271 @@ void FCICSFddstrs2csdstrs (uint64_t * csdstrs, uint64_t * ddstrs, int nstr, int
     uint64_t * sconf_strs = & csdstrs[2*nstr];
     uint64_t * spins_strs = & csdstrs[3*nstr];
 
-    for (i = 0; i < nstr; i++){
-        npairs[i] = 0;
-        dconf_strs[i] = 0;
-        sconf_strs[i] = 0;
-        spins_strs[i] = 0;
-
-        isorb = 0;
-        ispin = 0;
-
-        for (iorb = 0; iorb < norb; iorb++){
-            if ((1ULL << iorb) & astrs[i] & bstrs[i]) { /* DOUBLY OCCUPIED */
-                npairs[i]++;
-                dconf_strs[i] |= 1ULL << iorb; /* This is adding 2 electrons at position iorb */
-            } else if ((1ULL << iorb) & (astrs[i] | bstrs[i])) { /* SINGLY OCCUPIED */
-                sconf_strs[i] |= 1ULL << isorb; /* This is adding 1 electron at non-double position isorb */
-                isorb++;
-                if ((1ULL << iorb) & astrs[i]) { spins_strs[i] |= 1ULL << ispin ; } /* This is adding 1 alpha spin state at spin ispin */
-                ispin++;
-            } else { isorb++; } /* VIRTUAL */
-        }
+#pragma omp parallel for schedule(static)
+    for (int i = 0; i < nstr; i++){
+        _ddstr2csdstr (npairs+i, dconf_strs+i, sconf_strs+i, spins_strs+i, astrs[i], bstrs[i], norb);
     }
 }
 
 void FCICSFcsdstrs2ddstrs (uint64_t * ddstrs, uint64_t * csdstrs, int nstr, int norb, int neleca, int nelecb)
 {
 
-    int i, iorb, isorb, ispin;
     uint64_t * astrs = ddstrs;
     uint64_t * bstrs = & ddstrs[nstr];
+    uint64_t * dconf_strs = & csdstrs[nstr];
+    uint64_t * sconf_strs = & csdstrs[2*nstr];
+    uint64_t * spins_strs = & csdstrs[3*nstr];
+
+#pragma omp parallel for schedule(static)
+    for (int i = 0; i < nstr; i++){
+        _csdstr2ddstr (astrs+i, bstrs+i, dconf_strs[i], sconf_strs[i], spins_strs[i], norb);
+    }
+}
+
+/* Address <-> string conversions for bit strings of nelec electrons in norb orbitals, in the same
+   order as pyscf.fci.cistring. binom is a (65,65) table of binomial coefficients. */
+
+static void _make_binom (int64_t * binom)
+{
+    int n, k;
+    for (n = 0; n < 65; n++){
+        binom[n*65] = 1;
+        for (k = 1; k < 65; k++){
+            binom[n*65+k] = (n == 0) ? 0 : binom[(n-1)*65+k-1] + binom[(n-1)*65+k];
+        }
+    }
+}
+
+static int64_t _str2addr (int64_t * binom, int norb, int nelec, uint64_t str)
+{
+    /* Sum of binom[iorb][nelec_left] over the occupied orbitals, from the top down */
+    int64_t addr = 0;
+    int nelec_left = nelec;
+    int iorb;
+    while (str && nelec_left > 0){
+        iorb = 63 - __builtin_clzll (str);
+        addr += binom[iorb*65+nelec_left];
+        nelec_left--;
+        str &= ~(1ULL << iorb);
+    }
+    return addr;
+}
+
+static uint64_t _addr2str (int64_t * binom, int norb, int nelec, int64_t addr)
+{
+    if (addr == 0 || nelec == norb || nelec == 0){ return (1ULL << nelec) - 1ULL; }
+    uint64_t str = 0;
+    int nelec_left = nelec;
+    int norb_left;
+    int64_t addrcum;
+    for (norb_left = norb-1; norb_left >= 0; norb_left--){
+        addrcum = binom[norb_left*65+nelec_left];
+        if (nelec_left == 0){ break; }
+        else if (addr == 0){
+            str |= (1ULL << nelec_left) - 1ULL;
+            break;
+        } else if (addrcum <= addr){
+            str |= 1ULL << norb_left;
+            addr -= addrcum;
+            nelec_left--;
+        }
+    }
+    return str;
+}
+
+/* Shape of the CSD-ordered vector: for each ipair = npair - min_npair, the offset and the sizes
+   of the sconf and spins sub-blocks. The npair blocks are at most 33, for 64 orbitals. */
+
+typedef struct {
+    int min_npair;
+    int max_npair;
+    int64_t offset[34];
+    int64_t sconf_size[34];
+    int64_t spins_size[34];
+} _csdshape_t;
+
+static void _make_csdshape (_csdshape_t * shape, int64_t * binom, int norb, int neleca, int nelecb)
+{
+    int npair, ipair, nspin, nup;
+    int64_t offset = 0;
+    shape->min_npair = (neleca + nelecb > norb) ? (neleca + nelecb - norb) : 0;
+    shape->max_npair = (neleca < nelecb) ? neleca : nelecb;
+    for (npair = shape->min_npair; npair <= shape->max_npair; npair++){
+        ipair = npair - shape->min_npair;
+        nspin = neleca + nelecb - 2*npair;
+        nup = (nspin + neleca - nelecb) / 2;
+        shape->offset[ipair] = offset;
+        shape->sconf_size[ipair] = binom[(norb-npair)*65+nspin];
+        shape->spins_size[ipair] = binom[nspin*65+nup];
+        offset += binom[norb*65+npair] * shape->sconf_size[ipair] * shape->spins_size[ipair];
+    }
+    shape->offset[shape->max_npair - shape->min_npair + 1] = offset;
+}
+
+static int64_t _csdstr2csdaddr (_csdshape_t * shape, int64_t * binom, int norb, int neleca, int nelecb,
+                                uint64_t npair, uint64_t dconf_str, uint64_t sconf_str, uint64_t spins_str)
+{
+    int ipair = (int) npair - shape->min_npair;
+    int nspin = neleca + nelecb - 2*((int) npair);
+    int nup = (nspin + neleca - nelecb) / 2;
+    int64_t dconf_addr = _str2addr (binom, norb, (int) npair, dconf_str);
+    int64_t sconf_addr = _str2addr (binom, norb - (int) npair, nspin, sconf_str);
+    int64_t spins_addr = _str2addr (binom, nspin, nup, spins_str);
+    return (shape->offset[ipair] + (dconf_addr * shape->sconf_size[ipair] * shape->spins_size[ipair])
+            + (sconf_addr * shape->spins_size[ipair]) + spins_addr);
+}
+
+static void _csdaddr2csdstr (_csdshape_t * shape, int64_t * binom, int norb, int neleca, int nelecb,
+                             int64_t csdaddr, uint64_t * npair, uint64_t * dconf_str,
+                             uint64_t * sconf_str, uint64_t * spins_str)
+{
+    int ipair = 0;
+    while (ipair < shape->max_npair - shape->min_npair && csdaddr >= shape->offset[ipair+1]){ ipair++; }
+    int np = shape->min_npair + ipair;
+    int nspin = neleca + nelecb - 2*np;
+    int nup = (nspin + neleca - nelecb) / 2;
+    int64_t conf_size = shape->sconf_size[ipair] * shape->spins_size[ipair];
+    int64_t rem = csdaddr - shape->offset[ipair];
+    *npair = (uint64_t) np;
+    *dconf_str = _addr2str (binom, norb, np, rem / conf_size);
+    rem = rem % conf_size;
+    *sconf_str = _addr2str (binom, norb - np, nspin, rem / shape->spins_size[ipair]);
+    *spins_str = _addr2str (binom, nspin, nup, rem % shape->spins_size[ipair]);
+}
+
+void FCICSFcsdstrs2csdaddrs (int64_t * csdaddrs, uint64_t * csdstrs, int64_t nstr, int norb, int neleca, int nelecb)
+{
+    int64_t binom[65*65];
+    _csdshape_t shape;
+    _make_binom (binom);
+    _make_csdshape (&shape, binom, norb, neleca, nelecb);
     uint64_t * npairs = csdstrs;
     uint64_t * dconf_strs = & csdstrs[nstr];
     uint64_t * sconf_strs = & csdstrs[2*nstr];
     uint64_t * spins_strs = & csdstrs[3*nstr];
 
-    for (i = 0; i < nstr; i++){
-        astrs[i] = 0;
-        bstrs[i] = 0;
+#pragma omp parallel for schedule(static)
+    for (int64_t i = 0; i < nstr; i++){
+        csdaddrs[i] = _csdstr2csdaddr (&shape, binom, norb, neleca, nelecb,
+                                       npairs[i], dconf_strs[i], sconf_strs[i], spins_strs[i]);
+    }
+}
+
+void FCICSFcsdaddrs2csdstrs (uint64_t * csdstrs, int64_t * csdaddrs, int64_t nstr, int norb, int neleca, int nelecb)
+{
+    int64_t binom[65*65];
+    _csdshape_t shape;
+    _make_binom (binom);
+    _make_csdshape (&shape, binom, norb, neleca, nelecb);
+    uint64_t * npairs = csdstrs;
+    uint64_t * dconf_strs = & csdstrs[nstr];
+    uint64_t * sconf_strs = & csdstrs[2*nstr];
+    uint64_t * spins_strs = & csdstrs[3*nstr];
 
-        isorb = 0;
-        ispin = 0;
+#pragma omp parallel for schedule(static)
+    for (int64_t i = 0; i < nstr; i++){
+        _csdaddr2csdstr (&shape, binom, norb, neleca, nelecb, csdaddrs[i],
+                         npairs+i, dconf_strs+i, sconf_strs+i, spins_strs+i);
+    }
+}
 
-        for (iorb = 0; iorb < norb; iorb++){
-            if ((1ULL << iorb) & dconf_strs[i]){
-                astrs[i] |= 1ULL << iorb;
-                bstrs[i] |= 1ULL << iorb;
-            } else {
-                if ((1ULL << isorb) & sconf_strs[i]){
-                    if ((1ULL << ispin) & spins_strs[i]){
-                        astrs[i] |= 1ULL << iorb;
-                    } else {
-                        bstrs[i] |= 1ULL << iorb;
+void FCICSFddaddrs2csdaddrs (int64_t * csdaddrs, int64_t * ddaddrs, int64_t nstr, int norb, int neleca, int nelecb)
+{
+    /* ddaddrs is (2,nstr): alpha addresses followed by beta addresses */
+    int64_t binom[65*65];
+    _csdshape_t shape;
+    _make_binom (binom);
+    _make_csdshape (&shape, binom, norb, neleca, nelecb);
+    int64_t * aaddrs = ddaddrs;
+    int64_t * baddrs = & ddaddrs[nstr];
+
+#pragma omp parallel for schedule(static)
+    for (int64_t i = 0; i < nstr; i++){
+        uint64_t npair, dconf_str, sconf_str, spins_str;
+        _ddstr2csdstr (&npair, &dconf_str, &sconf_str, &spins_str,
+                       _addr2str (binom, norb, neleca, aaddrs[i]),
+                       _addr2str (binom, norb, nelecb, baddrs[i]), norb);
+        csdaddrs[i] = _csdstr2csdaddr (&shape, binom, norb, neleca, nelecb,
+                                       npair, dconf_str, sconf_str, spins_str);
+    }
+}
+
+void FCICSFcsdaddrs2ddaddrs (int64_t * ddaddrs, int64_t * csdaddrs, int64_t nstr, int norb, int neleca, int nelecb)
+{
+    /* ddaddrs is (2,nstr): alpha addresses followed by beta addresses */
+    int64_t binom[65*65];
+    _csdshape_t shape;
+    _make_binom (binom);
+    _make_csdshape (&shape, binom, norb, neleca, nelecb);
+    int64_t * aaddrs = ddaddrs;
+    int64_t * baddrs = & ddaddrs[nstr];
+
+#pragma omp parallel for schedule(static)
+    for (int64_t i = 0; i < nstr; i++){
+        uint64_t npair, dconf_str, sconf_str, spins_str, astr, bstr;
+        _csdaddr2csdstr (&shape, binom, norb, neleca, nelecb, csdaddrs[i],
+                         &npair, &dconf_str, &sconf_str, &spins_str);
+        _csdstr2ddstr (&astr, &bstr, dconf_str, sconf_str, spins_str, norb);
+        aaddrs[i] = _str2addr (binom, norb, neleca, astr);
+        baddrs[i] = _str2addr (binom, norb, nelecb, bstr);
+    }
+}
+
+void FCICSFmakecsdmask (uint32_t * mask, int norb, int neleca, int nelecb)
+{
+    /* mask[csdaddr] = ideta*ndetb + idetb for all determinants. The CSD addresses are visited in
+       order, so each dconf, sconf, and spins string is generated only once. */
+    int64_t binom[65*65];
+    _csdshape_t shape;
+    _make_binom (binom);
+    _make_csdshape (&shape, binom, norb, neleca, nelecb);
+    int64_t ndetb = binom[norb*65+nelecb];
+    int npair;
+
+    for (npair = shape.min_npair; npair <= shape.max_npair; npair++){
+        int ipair = npair - shape.min_npair;
+        int nspin = neleca + nelecb - 2*npair;
+        int nup = (nspin + neleca - nelecb) / 2;
+        int64_t ndconf = binom[norb*65+npair];
+        int64_t nsconf = shape.sconf_size[ipair];
+        int64_t nspins = shape.spins_size[ipair];
+        uint32_t * mask_npair = mask + shape.offset[ipair];
+        uint64_t * spins_strs = malloc (nspins * sizeof (uint64_t));
+        for (int64_t k = 0; k < nspins; k++){ spins_strs[k] = _addr2str (binom, nspin, nup, k); }
+#pragma omp parallel for schedule(dynamic)
+        for (int64_t i = 0; i < ndconf; i++){
+            uint64_t dconf_str = _addr2str (binom, norb, npair, i);
+            uint64_t sconf_str, astr, bstr, somo_str;
+            uint64_t somo_bits[64];
+            int iorb, isorb, ispin;
+            uint32_t * mask_i = mask_npair + i*nsconf*nspins;
+            for (int64_t j = 0; j < nsconf; j++){
+                /* Orbital bit of each singly-occupied orbital */
+                sconf_str = _addr2str (binom, norb-npair, nspin, j);
+                somo_str = 0;
+                for (iorb = isorb = ispin = 0; iorb < norb; iorb++){
+                    if ((1ULL << iorb) & dconf_str){ continue; }
+                    if ((1ULL << isorb) & sconf_str){
+                        somo_bits[ispin++] = 1ULL << iorb;
+                        somo_str |= 1ULL << iorb;
                     }
-                    ispin++;
+                    isorb++;
+                }
+                for (int64_t k = 0; k < nspins; k++){
+                    astr = dconf_str;
+                    for (ispin = 0; ispin < nspin; ispin++){
+                        if ((1ULL << ispin) & spins_strs[k]){ astr |= somo_bits[ispin]; }
+                    }
+                    bstr = dconf_str | (somo_str & ~astr);
+                    mask_i[j*nspins+k] = (uint32_t) (_str2addr (binom, norb, neleca, astr) * ndetb
+                                                     + _str2addr (binom, norb, nelecb, bstr));
                 }
-                isorb++;
             }
         }
+        free (spins_strs);
     }
 }
 
-
 void FCICSFmakecsf (double * umat, uint64_t * detstr, uint64_t * coupstr, int nspin, int ndet, int ncoup, int twoS, int twoMS)
 {
 
@@ -293,67 +545,49 @@ void FCICSFaddrs2str (uint64_t * strings, int * addrs, int nstr, int * gentable_
 
 void FCICSFhdiag (double * hdiag, double * hdiag_det, double * eri, uint64_t * astrs, uint64_t * bstrs, unsigned int norb, unsigned int nconf, unsigned int ndet)
 {
-
-    unsigned int ndet_lt = ndet * (ndet+1) / 2;
+    /* Parallel over configurations; each thread fills whole (ndet,ndet) blocks of hdiag, so the
+       caller can pass any number of configurations (e.g., a chunk of them) without changing the
+       threading behavior. All offsets are computed in 64-bit arithmetic. */
 
 #pragma omp parallel default(shared)
 {
 
-    unsigned int idetconf, iconf, idet_lt, idetx, idety, iorb, nexc;
-    uint64_t exc_str, somo_str, big_idx1, big_idx2, hdiag_idx_lt, hdiag_idx_ut;
+    unsigned int iconf, idetx, idety, iorb, nexc;
+    uint64_t exc_str, somo_str, conf_off, det_off, big_idx1;
+    uint64_t ndet2 = ((uint64_t) ndet) * ((uint64_t) ndet);
     unsigned int exc[2];
     int sgn, esgn;
+    double * hconf;
 
 #pragma omp for schedule(static) 
 
-    for (idetconf = 0; idetconf < nconf * ndet_lt; idetconf++){
-        iconf = idetconf / ndet_lt;
-        idety = idetconf % ndet_lt;
+    for (iconf = 0; iconf < nconf; iconf++){
+        conf_off = ndet2 * iconf;
+        det_off = ((uint64_t) ndet) * iconf;
+        hconf = hdiag + conf_off;
         for (idetx = 0; idetx < ndet; idetx++){
-            if (idetx < idety){ idety -= idetx + 1; }
-            else { break; }
-        }
-        // Careful with possible integer overflow
-        hdiag_idx_lt = ndet;
-        hdiag_idx_lt *= ndet;
-        hdiag_idx_lt *= iconf;
-        hdiag_idx_ut = hdiag_idx_lt;
-        big_idx1 = ndet;
-        big_idx1 *= idety;
-        big_idx2 = ndet;
-        big_idx2 *= idetx;
-        hdiag_idx_lt += big_idx1;
-        hdiag_idx_ut += big_idx2;
-        hdiag_idx_lt += idetx;
-        hdiag_idx_ut += idety;
-        if (idetx == idety){ 
-            hdiag[hdiag_idx_lt] = hdiag_det[(iconf*ndet)+idetx];
-            continue;
-        }
-        // Fear of integer overflow is only reasonable for off-diagonal elements of a Hamiltonian matrix
-        // It's not reasonable for anything else
-        big_idx1 = (ndet*iconf) + idetx;
-        big_idx2 = (ndet*iconf) + idety;
-        exc_str  = astrs[big_idx1] ^ astrs[big_idx2];
-        somo_str = astrs[big_idx1] ^ bstrs[big_idx1];
-        nexc = 0; esgn = 1; sgn = -1;
-        for (iorb = 0; iorb < norb; iorb++){
-            if (somo_str & 1ULL << iorb){ esgn *= -1; }
-            if (exc_str & 1ULL << iorb){
-                if (nexc < 2){ exc[nexc] = iorb; }
-                nexc++;
-                if (nexc > 2){ break; }
-                sgn *= esgn;
+            hconf[(((uint64_t) ndet)*idetx) + idetx] = hdiag_det[det_off+idetx];
+            somo_str = astrs[det_off+idetx] ^ bstrs[det_off+idetx];
+            for (idety = 0; idety < idetx; idety++){
+                exc_str  = astrs[det_off+idetx] ^ astrs[det_off+idety];
+                nexc = 0; esgn = 1; sgn = -1;
+                for (iorb = 0; iorb < norb; iorb++){
+                    if (somo_str & 1ULL << iorb){ esgn *= -1; }
+                    if (exc_str & 1ULL << iorb){
+                        if (nexc < 2){ exc[nexc] = iorb; }
+                        nexc++;
+                        if (nexc > 2){ break; }
+                        sgn *= esgn;
+                    }
+                } 
+                if (nexc > 2){ continue; }
+                assert (nexc == 2);
+                big_idx1 = norb;
+                big_idx1 = exc[0]*big_idx1*big_idx1*big_idx1 + exc[1]*big_idx1*big_idx1 + exc[1]*big_idx1 + exc[0];
+                hconf[(((uint64_t) ndet)*idetx) + idety] = sgn * eri[big_idx1];
+                hconf[(((uint64_t) ndet)*idety) + idetx] = sgn * eri[big_idx1];
             }
-        } 
-        if (nexc > 2){ continue; }
-        assert (nexc == 2);
-
-        // Fear of integer overflow is only reasonable for off-diagonal elements of a Hamiltonian matrix
-        // It's not reasonable for anything else
-        big_idx1 = exc[0]*norb*norb*norb + exc[1]*norb*norb + exc[1]*norb + exc[0];
-        hdiag[hdiag_idx_lt] = sgn * eri[big_idx1];
-        hdiag[hdiag_idx_ut] = hdiag[hdiag_idx_lt];
+        }
     }
 
 }
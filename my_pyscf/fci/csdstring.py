@@ -30,18 +30,12 @@ def make_csd_mask (norb, neleca, nelecb):
 
     mask[idx_csd] = idx_dd '''
 
-    t_start = logger.perf_counter ()
     ndeta = int (special.comb (norb, neleca))
     ndetb = int (special.comb (norb, nelecb))
+    check_csd_mask_size (norb, neleca, nelecb)
     mask = np.empty (ndeta*ndetb, dtype=np.uint32)
-    min_npair, npair_offset, npair_dconf_size, npair_sconf_size, npair_spins_size = get_csdaddrs_shape (norb, neleca, nelecb)
-    pair_size = npair_dconf_size * npair_sconf_size * npair_spins_size
-    for npair in range (min_npair, min (neleca, nelecb)+1):
-        ipair = npair - min_npair
-        nspin = neleca + nelecb - 2*npair
-        mask[npair_offset[ipair]:][:pair_size[ipair]] = get_nspin_dets (norb, neleca, nelecb, nspin).flat
-    #print ("Time to make csf mask index array: {:.2f} seconds, memory: {:.2f} MB".format (
-    #        logger.perf_counter () - t_start, mask.nbytes / 1e6, ndeta*ndetb*4 / 1e6))
+    libcsf.FCICSFmakecsdmask (mask.ctypes.data_as (ctypes.c_void_p), ctypes.c_int (norb),
+                              ctypes.c_int (neleca), ctypes.c_int (nelecb))
     return mask
 
 def make_econf_det_mask (norb, neleca, nelecb, csd_mask):
@@ -58,7 +52,10 @@ def make_econf_det_mask (norb, neleca, nelecb, csd_mask):
         irange = np.arange (iconf, iconf+npair_conf_size[ipair], dtype=np.uint32)
         iconf += npair_conf_size[ipair]
         mask[npair_offset[ipair]:][:npair_det_size[ipair]] = np.repeat (irange, npair_spins_size[ipair])
-    return mask[np.argsort (csd_mask)]
+    # csd_mask is a permutation, so scattering through it is the same as gathering through its inverse
+    econf_det_mask = np.empty_like (mask)
+    econf_det_mask[csd_mask] = mask
+    return econf_det_mask
 
 def get_nspin_dets (norb, neleca, nelecb, nspin):
     ''' Grab all determinant pair addresses corresponding to nspin unpaired electrons, sorted by spin configuration
@@ -79,7 +76,7 @@ def get_nspin_dets (norb, neleca, nelecb, nspin):
     conf_size = npair_dconf_size[npair-min_npair] * npair_sconf_size[npair-min_npair]
     spin_size = npair_spins_size[npair-min_npair]
     t_ref = logger.perf_counter ()
-    ddaddrs = csdaddrs2ddaddrs (norb, neleca, nelecb, list (range (offset, offset+(conf_size*spin_size))))
+    ddaddrs = csdaddrs2ddaddrs (norb, neleca, nelecb, np.arange (offset, offset+(conf_size*spin_size), dtype=np.int64))
     t_sub = logger.perf_counter () - t_ref
     ddaddrs = ddaddrs[0,:] * int (round (special.binom (norb, nelecb))) + ddaddrs[1,:]
     ddaddrs = ddaddrs.reshape (conf_size, spin_size)
@@ -108,123 +105,61 @@ def ddaddrs2csdaddrs (norb, neleca, nelecb, ddaddrs):
             If 2d, interpreted as row/column i is interpreted as the ith index pair [deta, detb], if there are 2 columns/rows
 
         Returns:
-        csdaddrs, list of integers for the CI vector in the form of a 1d array
+        csdaddrs, 1d ndarray of int64 addresses for the CI vector in CSD order
 
     '''
 
-    ddaddrs = format_ddaddrs (norb, neleca, nelecb, ddaddrs)
-    ddstrs = np.asarray ([cistring.addrs2str (norb, neleca, ddaddrs[0]), cistring.addrs2str (norb, nelecb, ddaddrs[1])], dtype=np.int64)
-    csdstrs = ddstrs2csdstrs (norb, neleca, nelecb, ddstrs)
-    csdaddrs = csdstrs2csdaddrs (norb, neleca, nelecb, csdstrs)
+    ddaddrs = np.ascontiguousarray (format_ddaddrs (norb, neleca, nelecb, ddaddrs), dtype=np.int64)
+    nstr = ddaddrs.shape[1]
+    csdaddrs = np.empty (nstr, dtype=np.int64)
+    libcsf.FCICSFddaddrs2csdaddrs (csdaddrs.ctypes.data_as (ctypes.c_void_p),
+                                   ddaddrs.ctypes.data_as (ctypes.c_void_p),
+                                   ctypes.c_int64 (nstr), ctypes.c_int (norb),
+                                   ctypes.c_int (neleca), ctypes.c_int (nelecb))
     return csdaddrs
 
 def csdaddrs2ddaddrs (norb, neleca, nelecb, csdaddrs):
     ''' Inverse operation of ddaddrs2csdaddrs 
-        ddaddrs is returned in the format of a contiguous 2d ndarray with shape (naddrs,2), where naddrs is the length of csdaddrs
+        ddaddrs is returned in the format of a contiguous 2d ndarray with shape (2,naddrs), where naddrs is the length of csdaddrs
     '''
-    t_start = logger.perf_counter ()
-    csdaddrs = np.asarray (csdaddrs)
-    if not csdaddrs.flags['C_CONTIGUOUS']:
-        csdaddrs = np.ravel (csdaddrs, order='C')
-    t0 = logger.perf_counter ()
-    csdstrs = csdaddrs2csdstrs (norb, neleca, nelecb, csdaddrs)
-    t1 = logger.perf_counter ()
-    ddstrs = csdstrs2ddstrs (norb, neleca, nelecb, csdstrs)
-    t2 = logger.perf_counter ()
-    ddaddrs = np.ascontiguousarray ([cistring.strs2addr (norb, neleca, ddstrs[0]), cistring.strs2addr (norb, nelecb, ddstrs[1])], dtype=np.int32)
-    t3 = logger.perf_counter ()
-    t_tot = logger.perf_counter () - t_start
+    csdaddrs = _format_csdaddrs (norb, neleca, nelecb, csdaddrs)
+    nstr = len (csdaddrs)
+    ddaddrs = np.empty ((2, nstr), dtype=np.int64)
+    libcsf.FCICSFcsdaddrs2ddaddrs (ddaddrs.ctypes.data_as (ctypes.c_void_p),
+                                   csdaddrs.ctypes.data_as (ctypes.c_void_p),
+                                   ctypes.c_int64 (nstr), ctypes.c_int (norb),
+                                   ctypes.c_int (neleca), ctypes.c_int (nelecb))
     return ddaddrs
 
 def csdstrs2csdaddrs (norb, neleca, nelecb, csdstrs):
-    assert (len (csdstrs[0]) == len (csdstrs[1]))
-    assert (len (csdstrs[0]) == len (csdstrs[2]))
-    assert (len (csdstrs[0]) == len (csdstrs[3]))
-    min_npair, npair_offset, npair_dconf_size, npair_sconf_size, npair_spins_size = get_csdaddrs_shape (norb, neleca, nelecb)
-    csdaddrs = np.empty (len (csdstrs[0]), dtype=np.int32)
-    for npair, offset, dconf_size, sconf_size, spins_size in zip (range (min_npair, min (neleca, nelecb)+1), 
-            npair_offset, npair_dconf_size, npair_sconf_size, npair_spins_size):
-        nspins = neleca + nelecb - 2*npair
-        nup = (nspins + neleca - nelecb) // 2
-        assert ((nspins + neleca - nelecb) % 2 == 0)
-
-        idx = (csdstrs[0] == npair)
-        dconf_addr = cistring.strs2addr (norb, npair, csdstrs[1,idx])
-        sconf_addr = cistring.strs2addr (norb - npair, nspins, csdstrs[2,idx])
-        spins_addr = cistring.strs2addr (nspins, nup, csdstrs[3,idx])
-        
-        csdaddrs[idx] = np.asarray ([offset + (dconf * sconf_size * spins_size)
-                                            + (sconf * spins_size)
-                                            + spins for dconf, sconf, spins in zip (
-                                            dconf_addr, sconf_addr, spins_addr)],
-                                            dtype=np.int32)
+    csdstrs = np.ascontiguousarray (csdstrs, dtype=np.int64)
+    assert (csdstrs.ndim == 2 and csdstrs.shape[0] == 4), csdstrs.shape
+    nstr = csdstrs.shape[1]
+    min_npair = max (0, neleca + nelecb - norb)
+    assert (np.all ((csdstrs[0] >= min_npair) & (csdstrs[0] <= min (neleca, nelecb))))
+    csdaddrs = np.empty (nstr, dtype=np.int64)
+    libcsf.FCICSFcsdstrs2csdaddrs (csdaddrs.ctypes.data_as (ctypes.c_void_p),
+                                   csdstrs.ctypes.data_as (ctypes.c_void_p),
+                                   ctypes.c_int64 (nstr), ctypes.c_int (norb),
+                                   ctypes.c_int (neleca), ctypes.c_int (nelecb))
     return csdaddrs
 
-
 def csdaddrs2csdstrs (norb, neleca, nelecb, csdaddrs):
-    ''' This is extremely slow because of the amount of repetition in dconf_addr, sconf_addr, and spins_addr! '''
-    t_start = logger.perf_counter ()
-    min_npair, npair_offset, npair_dconf_size, npair_sconf_size, npair_spins_size = get_csdaddrs_shape (norb, neleca, nelecb)
-    csdstrs = np.empty ((4, len (csdaddrs)), dtype=np.int64)
-    for npair, offset, dconf_size, sconf_size, spins_size in zip (range (min_npair, min (neleca, nelecb)+1), 
-            npair_offset, npair_dconf_size, npair_sconf_size, npair_spins_size):
-        nspins = neleca + nelecb - 2*npair
-        nup = (nspins + neleca - nelecb) // 2
-        assert ((nspins + neleca - nelecb) % 2 == 0)
-        next_offset = offset + (dconf_size * sconf_size * spins_size)
-
-        idx = (csdaddrs >= offset) & (csdaddrs < next_offset)
-        if len (idx) == 1:
-            if not idx[0]:
-                continue
-            else:
-                idx = 0
-        try:
-            dconf_addr = (csdaddrs[idx] - offset) // (sconf_size * spins_size)
-        except:
-            print (idx)
-            assert (False)
-        dconf_rem  = (csdaddrs[idx] - offset)  % (sconf_size * spins_size)
-        sconf_addr = dconf_rem // spins_size
-        spins_addr = dconf_rem  % spins_size
-        csdstrs[0,idx] = npair
-       
-        t_ref = logger.perf_counter ()
-        dconf_addr_uniq, dconf_addr_uniq2full = np.unique (dconf_addr, return_inverse=True)
-        try:
-            csdstrs[1,idx] = cistring.addrs2str (norb, npair, dconf_addr_uniq)[dconf_addr_uniq2full]
-        except TypeError:
-            csdstrs[1,idx] = cistring.addr2str (norb, npair, dconf_addr_uniq)
-        
-        sconf_addr_uniq, sconf_addr_uniq2full = np.unique (sconf_addr, return_inverse=True)
-        try:
-            csdstrs[2,idx] = cistring.addrs2str (norb - npair, nspins, sconf_addr_uniq)[sconf_addr_uniq2full]
-        except TypeError:
-            csdstrs[2,idx] = cistring.addr2str (norb - npair, nspins, sconf_addr_uniq)
-
-        spins_addr_uniq, spins_addr_uniq2full = np.unique (spins_addr, return_inverse=True)
-        try:
-            csdstrs[3,idx] = cistring.addrs2str (nspins, nup, spins_addr_uniq)[spins_addr_uniq2full]
-        except TypeError:
-            csdstrs[3,idx] = cistring.addr2str (nspins, nup, spins_addr_uniq)
-        #print ("{:.2f} seconds in cistring".format (logger.perf_counter () - t_ref))
-
-        '''
-        t_ref = logger.perf_counter ()
-        try:
-            csdstrs[1,idx] = cistring.addrs2str (norb, npair, dconf_addr)
-            csdstrs[2,idx] = cistring.addrs2str (norb - npair, nspins, sconf_addr)
-            csdstrs[3,idx] = cistring.addrs2str (nspins, nup, spins_addr)
-        except TypeError:
-            csdstrs[1,idx] = cistring.addr2str (norb, npair, dconf_addr)
-            csdstrs[2,idx] = cistring.addr2str (norb - npair, nspins, sconf_addr)
-            csdstrs[3,idx] = cistring.addr2str (nspins, nup, spins_addr)
-        print ("{:.2f} seconds in cistring".format (logger.perf_counter () - t_ref))
-        '''
-
-    #print ("{:.2f} seconds spent in csdaddrs2csdstrs".format (logger.perf_counter () - t_start))
+    csdaddrs = _format_csdaddrs (norb, neleca, nelecb, csdaddrs)
+    nstr = len (csdaddrs)
+    csdstrs = np.empty ((4, nstr), dtype=np.int64)
+    libcsf.FCICSFcsdaddrs2csdstrs (csdstrs.ctypes.data_as (ctypes.c_void_p),
+                                   csdaddrs.ctypes.data_as (ctypes.c_void_p),
+                                   ctypes.c_int64 (nstr), ctypes.c_int (norb),
+                                   ctypes.c_int (neleca), ctypes.c_int (nelecb))
     return csdstrs
 
+def _format_csdaddrs (norb, neleca, nelecb, csdaddrs):
+    csdaddrs = np.ascontiguousarray (np.ravel (csdaddrs), dtype=np.int64)
+    ncsd = int (round (special.binom (norb, neleca) * special.binom (norb, nelecb)))
+    assert (np.all ((csdaddrs >= 0) & (csdaddrs < ncsd)))
+    return csdaddrs
+
 def get_csdaddrs_shape (norb, neleca, nelecb):
     ''' For a system of neleca + nelecb electrons with MS = (neleca - nelecb) occupying norb orbitals,
         get shape information about the irregular csdaddrs-type CI vector array (number of pairs, pair config, unpair config, spin state)
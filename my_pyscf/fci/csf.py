@@ -66,7 +66,11 @@ def make_hdiag_det (fci, h1e, eri, norb, nelec):
     return direct_uhf.make_hdiag (unpack_h1e_ab (h1e), [eri, eri, eri], norb, nelec)
 
 def make_hdiag_csf (h1e, eri, norb, nelec, transformer, hdiag_det=None, max_memory=None):
+    ''' The diagonal of the Hamiltonian in the CSF basis, from the (ndet,ndet) diagonal blocks of
+    each electron configuration. The configurations are processed in chunks sized to fit in the
+    remaining memory, so only the memory for a single configuration is strictly required. '''
     smult = transformer.smult
+    if max_memory is None: max_memory = lib.param.MAX_MEMORY
     if hdiag_det is None:
         hdiag_det = make_hdiag_det (None, h1e, eri, norb, nelec)
     eri = ao2mo.restore(1, eri, norb)
@@ -90,7 +94,15 @@ def make_hdiag_csf (h1e, eri, norb, nelec, transformer, hdiag_det=None, max_memo
         if ncsf == 0:
             continue
         csd_offset = npair_csd_offset[ipair]
-        det_addr = transformer.csd_mask[csd_offset:][:nconf*ndet]
+        det_addr = transformer.csd_mask[csd_offset:][:nconf*ndet].reshape (nconf, ndet, order='C')
+        nspin = neleca + nelecb - 2*npair
+        csf_offset = npair_csf_offset[ipair]
+        if ndet == 1:
+            # Closed-shell singlets
+            assert (ncsf == 1)
+            hdiag_csf[csf_offset:][:nconf] = hdiag_det[det_addr.flat]
+            hdiag_csf_check[csf_offset:][:nconf] = False
+            continue
         # mem safety
         # Issue #54: PySCF wants "max_memory" on entrance to FCI to be "remaining memory". However,
         # the first few lines of this function consume some memory, so that's difficult to
@@ -98,47 +110,44 @@ def make_hdiag_csf (h1e, eri, norb, nelec, transformer, hdiag_det=None, max_memo
         # calculation.
         mem_remaining = max_memory - lib.current_memory ()[0]
         safety_factor = 1.2
-        nfloats = nconf*ndet*ndet + det_addr.size 
+        nfloats = ndet*ndet + ndet*ncsf + ndet
         mem_floats = nfloats * np.dtype (float).itemsize / 1e6
-        mem_ints = det_addr.dtype.itemsize * det_addr.size * 3 / 1e6
-        mem = safety_factor * (mem_floats + mem_ints)
+        mem_ints = det_addr.dtype.itemsize * ndet * 3 / 1e6
+        mem_conf = safety_factor * (mem_floats + mem_ints)
+        blksize = min (nconf, int (mem_remaining // mem_conf))
         memstr = ("hdiag_csf of {} orbitals, ({},{}) electrons and smult={} with {} "
                   "doubly-occupied orbitals ({} configurations and {} determinants) requires {} "
-                  "MB > {} MB remaining of {} MB max").format (
-            norb, neleca, nelecb, smult, npair, nconf, ndet, mem, mem_remaining, max_memory)
-        if mem > mem_remaining:
+                  "MB per configuration > {} MB remaining of {} MB max").format (
+            norb, neleca, nelecb, smult, npair, nconf, ndet, mem_conf, mem_remaining, max_memory)
+        if blksize < 1:
             raise MemoryError (memstr)
         # end mem safety
-        nspin = neleca + nelecb - 2*npair
-        csf_offset = npair_csf_offset[ipair]
-        hdiag_conf = np.ascontiguousarray (np.zeros ((nconf, ndet, ndet), dtype=np.float64))
-        if ndet == 1:
-            # Closed-shell singlets
-            assert (ncsf == 1)
-            hdiag_csf[csf_offset:][:nconf] = hdiag_det[det_addr.flat]
-            hdiag_csf_check[csf_offset:][:nconf] = False
-            continue
-        det_addra, det_addrb = divmod (det_addr, ndetb_all)
-        det_stra = np.ascontiguousarray (cistring.addrs2str (norb, neleca, det_addra).reshape (nconf, ndet, order='C'))
-        det_strb = np.ascontiguousarray (cistring.addrs2str (norb, nelecb, det_addrb).reshape (nconf, ndet, order='C'))
-        det_addr = det_addr.reshape (nconf, ndet, order='C')
-        hdiag_conf = np.ascontiguousarray (np.zeros ((nconf, ndet, ndet), dtype=np.float64))
-        hdiag_conf_det = np.ascontiguousarray (hdiag_det[det_addr], dtype=np.float64)
-        t1 = lib.logger.process_clock ()
-        w1 = lib.logger.perf_counter ()
-        libcsf.FCICSFhdiag (hdiag_conf.ctypes.data_as (ctypes.c_void_p),
-                            hdiag_conf_det.ctypes.data_as (ctypes.c_void_p),
-                            eri.ctypes.data_as (ctypes.c_void_p),
-                            det_stra.ctypes.data_as (ctypes.c_void_p),
-                            det_strb.ctypes.data_as (ctypes.c_void_p),
-                            ctypes.c_uint (norb), ctypes.c_uint (nconf), ctypes.c_uint (ndet))
-        tlib += lib.logger.process_clock () - t1
-        wlib += lib.logger.perf_counter () - w1
         umat = get_spin_evecs (nspin, neleca, nelecb, smult)
-        hdiag_conf = np.tensordot (hdiag_conf, umat, axes=1)
-        hdiag_conf *= umat[np.newaxis,:,:]
-        hdiag_csf[csf_offset:][:nconf*ncsf] = hdiag_conf.sum (1).ravel (order='C')
-        hdiag_csf_check[csf_offset:][:nconf*ncsf] = False
+        for c0, c1 in lib.prange (0, nconf, blksize):
+            nconf_blk = c1 - c0
+            det_addra, det_addrb = divmod (det_addr[c0:c1], ndetb_all)
+            det_stra = np.ascontiguousarray (cistring.addrs2str (norb, neleca, det_addra.ravel ()))
+            det_strb = np.ascontiguousarray (cistring.addrs2str (norb, nelecb, det_addrb.ravel ()))
+            hdiag_conf = np.zeros ((nconf_blk, ndet, ndet), dtype=np.float64)
+            hdiag_conf_det = np.ascontiguousarray (hdiag_det[det_addr[c0:c1]], dtype=np.float64)
+            t1 = lib.logger.process_clock ()
+            w1 = lib.logger.perf_counter ()
+            libcsf.FCICSFhdiag (hdiag_conf.ctypes.data_as (ctypes.c_void_p),
+                                hdiag_conf_det.ctypes.data_as (ctypes.c_void_p),
+                                eri.ctypes.data_as (ctypes.c_void_p),
+                                det_stra.ctypes.data_as (ctypes.c_void_p),
+                                det_strb.ctypes.data_as (ctypes.c_void_p),
+                                ctypes.c_uint (norb), ctypes.c_uint (nconf_blk),
+                                ctypes.c_uint (ndet))
+            tlib += lib.logger.process_clock () - t1
+            wlib += lib.logger.perf_counter () - w1
+            hdiag_conf = np.tensordot (hdiag_conf, umat, axes=1)
+            hdiag_conf *= umat[np.newaxis,:,:]
+            i = csf_offset + c0*ncsf
+            j = csf_offset + c1*ncsf
+            hdiag_csf[i:j] = hdiag_conf.sum (1).ravel (order='C')
+            hdiag_csf_check[i:j] = False
+            hdiag_conf = None
     assert (np.count_nonzero (hdiag_csf_check) == 0), np.count_nonzero (hdiag_csf_check)
     #print ("Time in hdiag_csf library: {}, {}".format (tlib, wlib))
     return hdiag_csf
@@ -243,6 +252,12 @@ def _debug_g2e (fci, g2e, eri, norb):
     raise ValueError ('g2e has {} infs and {} nans (norb = {}; shape = {})'.format (g2e_ninf, g2e_nnan, norb, g2e.shape))
     return
 
+def _max_abs_change (a, b):
+    a, b = np.asarray (a), np.asarray (b)
+    if a.shape != b.shape: return np.inf
+    if a.size == 0: return 0
+    return np.amax (np.abs (a - b))
+
 def pspace (fci, h1e, eri, norb, nelec, transformer, hdiag_det=None, hdiag_csf=None, npsp=200, max_memory=None):
     ''' Note that getting pspace for npsp CSFs is substantially more costly than getting it for npsp determinants,
     until I write code than can evaluate Hamiltonian matrix elements of CSFs directly. On the other hand
@@ -276,8 +291,7 @@ def pspace (fci, h1e, eri, norb, nelec, transformer, hdiag_det=None, hdiag_csf=N
 
     # To build 
     econf_addr = np.unique (transformer.econf_csf_mask[csf_addr])
-    det_addr = np.concatenate ([np.nonzero (transformer.econf_det_mask == conf)[0]
-        for conf in econf_addr])
+    det_addr = transformer.confspace_addrs (econf_addr)[0]
     lib.logger.debug (fci, ("csf.pspace: Lowest-energy %s CSFs correspond to %s configurations"
         " which are spanned by %s determinants"), npsp, econf_addr.size, det_addr.size)
 
@@ -316,12 +330,12 @@ def pspace (fci, h1e, eri, norb, nelec, transformer, hdiag_det=None, hdiag_csf=N
                                 ctypes.c_int(norb), ctypes.c_int(npsp_det))
     t0 = lib.logger.timer_debug1 (fci, "csf.pspace: pspace Hamiltonian in determinant basis", *t0)
 
-    for i in range(npsp_det):
-        h0[i,i] = hdiag_det[det_addr[i]]
-    h0 = lib.hermi_triu(h0)
+    # Only the lower triangle is filled. With half the diagonal, the full matrix is h0 + h0.T, and
+    # since the transformation is linear, it is cheaper to symmetrize in the smaller CSF basis.
+    h0[np.diag_indices (npsp_det)] = .5 * hdiag_det[det_addr]
 
     try:
-        if fci.verbose > lib.logger.DEBUG1: evals_before = scipy.linalg.eigh (h0)[0]
+        if fci.verbose > lib.logger.DEBUG1: evals_before = scipy.linalg.eigh (h0 + h0.T)[0]
     except ValueError as e:
         lib.logger.debug1 (fci, ("ERROR: h0 has {} infs, {} nans; h1e_a has {} infs, {} nans; "
             "h1e_b has {} infs, {} nans; g2e has {} infs, {} nans, norb = {}, npsp_det = {}").format (
@@ -333,6 +347,7 @@ def pspace (fci, h1e, eri, norb, nelec, transformer, hdiag_det=None, hdiag_csf=N
         evals_before = np.zeros (npsp_det)
 
     h0, csf_addr = transformer.mat_det2csf_confspace (h0, econf_addr)
+    h0 += h0.T
     t0 = lib.logger.timer_debug1 (fci, "csf.pspace: transform pspace Hamiltonian into CSF basis", *t0)
 
     if fci.verbose > lib.logger.DEBUG1:
@@ -397,7 +412,9 @@ def kernel(fci, h1e, eri, norb, nelec, smult=None, idx_sym=None, ci0=None,
     addr, h0 = fci.pspace(h1e, eri, norb, nelec, idx_sym=idx_sym, hdiag_det=hdiag_det, hdiag_csf=hdiag_csf, npsp=max(pspace_size,nroots))
     lib.logger.debug1 (fci, 'csf.kernel: error of hdiag_csf: %s', np.amax (np.abs (hdiag_csf[addr]-np.diag (h0))))
     t0 = lib.logger.timer_debug1 (fci, "csf.kernel: make pspace", *t0)
-    if pspace_size > 0:
+    if pspace_size > 0 and hasattr (h0, 'pspace_eig'):
+        pw, pv = h0.pspace_eig
+    elif pspace_size > 0:
         pw, pv = fci.eig (h0)
     else:
         pw = pv = None
@@ -488,13 +505,15 @@ def kernel(fci, h1e, eri, norb, nelec, smult=None, idx_sym=None, ci0=None,
         return e+ecore, c.reshape(na,nb)
 
 class CSFFCISolver: # parent class
-    _keys = {'smult', 'transformer'}
+    _keys = {'smult', 'transformer', 'pspace_reuse_tol'}
     pspace_size = getattr(__config__, 'fci_csf_FCI_pspace_size', 200)
+    pspace_reuse_tol = getattr(__config__, 'fci_csf_FCI_pspace_reuse_tol', 0)
     make_hdiag = make_hdiag_det
 
     def __init__(self, mol=None, smult=None):
         self.smult = smult
         self.transformer = None
+        self._pspace_cache = None
         super().__init__(mol)
 
     def make_hdiag_csf (self, h1e, eri, norb, nelec, hdiag_det=None, smult=None, max_memory=None):
@@ -527,8 +546,26 @@ class CSFFCISolver: # parent class
             kwargs.pop ('smult')
         self.check_transformer_cache ()
         max_memory = kwargs.get ('max_memory', self.max_memory)
-        return pspace (self, h1e, eri, norb, nelec, self.transformer, hdiag_det=hdiag_det,
+        if not self.pspace_reuse_tol > 0:
+            return pspace (self, h1e, eri, norb, nelec, self.transformer, hdiag_det=hdiag_det,
+                hdiag_csf=hdiag_csf, npsp=npsp, max_memory=max_memory)
+        # Reuse the pspace basis, Hamiltonian, and eigenvectors of the previous call if the
+        # integrals have changed by less than pspace_reuse_tol (e.g., between late macrocycles)
+        t = self.transformer
+        orbsym = None if t._orbsym is None else tuple (t._orbsym)
+        key = (norb, t._neleca, t._nelecb, t._smult, orbsym, t.wfnsym, npsp)
+        cache = getattr (self, '_pspace_cache', None)
+        if cache is not None and cache[0] == key:
+            dh = max (_max_abs_change (h1e, cache[1]), _max_abs_change (eri, cache[2]))
+            if dh < self.pspace_reuse_tol:
+                lib.logger.debug (self, 'csf.pspace: reusing pspace (integrals changed by %g)', dh)
+                return cache[3], cache[4]
+        addr, h0 = pspace (self, h1e, eri, norb, nelec, t, hdiag_det=hdiag_det,
             hdiag_csf=hdiag_csf, npsp=npsp, max_memory=max_memory)
+        if addr.size < t.ncsf: # otherwise the kernel returns the pspace eigenvectors themselves
+            h0 = tag_array (h0, pspace_eig=scipy.linalg.eigh (h0))
+            self._pspace_cache = (key, np.array (h1e), np.array (eri), addr, h0)
+        return addr, h0
 
 class FCISolver (CSFFCISolver, direct_spin1.FCISolver):
     r''' get_init_guess uses csfstring.py and csdstring.py to construct a spin-symmetry-adapted initial guess, and the Davidson algorithm is carried
@@ -1,6 +1,12 @@
 import numpy as np
 import sys, os, time
 import ctypes
+import abc
+import collections
+import threading
+import warnings
+import hashlib
+import tempfile
 from mrh.my_pyscf.fci import csdstring
 from pyscf.fci import cistring
 from pyscf.fci.spin_op import spin_square0
@@ -12,6 +18,17 @@ from functools import reduce
 from mrh.lib.helper import load_library
 from pyscf.fci.direct_spin1_symm import _gen_strs_irrep
 libcsf = load_library ('libcsf')
+from pyscf import __config__
+
+# Maximum size in MB of each process-wide cache derived from LRUCache: spin_evecs_cache below and
+# spin_op.sladder_map_cache. 0 disables them.
+CACHE_MAX_MEMORY = getattr (__config__, 'fci_csfstring_cache_max_memory', 500)
+# Directory in which to keep csd_mask, econf_det_mask, econf_csf_mask, and confsym tables between
+# runs. None (the default) disables the on-disk cache.
+TABLE_CACHE_DIR = getattr (__config__, 'fci_csfstring_table_cache_dir', None)
+# Format of the cached tables; increment whenever the layout or meaning of any of them changes, so
+# that files written by older code are not used
+TABLE_CACHE_VERSION = 1
 
 class ImpossibleCIvecError (RuntimeError):
     def __init__(self, message, ndet=None, ncsf=None, norb=None, neleca=None, nelecb=None):
@@ -41,29 +58,52 @@ class CSFTransformer (lib.StreamObject):
     def project_civec (self, detarr, order='C', normalize=True, return_norm=False):
         pass
 
-    def vec_det2csf (self, civec, order='C', normalize=True, return_norm=False):
+    def vec_det2csf (self, civec, order='C', normalize=True, return_norm=False, out=None):
+        ''' If out is provided, the result is written into it and out is returned; the
+        transformation then writes directly into out unless point-group symmetry packing is
+        required. '''
         vec_on_cols = (order.upper () == 'F')
+        packed = not (self.wfnsym is None or self._orbsym is None)
         civec, norm = transform_civec_det2csf (civec, self._norb, self._neleca, 
             self._nelecb, self._smult, csd_mask=self.csd_mask, do_normalize=normalize,
-            vec_on_cols=vec_on_cols)
+            vec_on_cols=vec_on_cols, plan=self.transform_plan, out=(None if packed else out))
         civec = self.pack_csf (civec, order=order)
+        civec = _copy_to_out (civec, out)
         if return_norm: return civec, norm
         return civec
 
-    def vec_csf2det (self, civec, order='C', normalize=True, return_norm=False):
+    def vec_csf2det (self, civec, order='C', normalize=True, return_norm=False, out=None):
+        ''' If out is provided, the result is written into it and out is returned. '''
         vec_on_cols = (order.upper () == 'F')
         civec, norm = transform_civec_csf2det (self.unpack_csf (civec), self._norb, self._neleca, 
             self._nelecb, self._smult, csd_mask=self.csd_mask, do_normalize=normalize,
-            vec_on_cols=vec_on_cols)
+            vec_on_cols=vec_on_cols, plan=self.transform_plan, out=out)
+        civec = _copy_to_out (civec, out)
         if return_norm: return civec, norm
         return civec
 
+    @property
+    def transform_plan (self):
+        ''' Precomputed gather/scatter plan for vec_det2csf and vec_csf2det (see
+        make_transform_plan), built on first use and cached until norb, nelec, or smult change '''
+        if self._transform_plan is None:
+            self._transform_plan = make_transform_plan (self._norb, self._neleca, self._nelecb,
+                                                        self._smult, csd_mask=self.csd_mask)
+        return self._transform_plan
+
     def mat_det2csf (self, mat):
         pass
 
     def mat_csf2det (self, mat):
         pass
 
+    def confspace_addrs (self, confs):
+        ''' Determinant and CSF addresses spanning the sorted electron configurations confs, with
+        the determinants in the order expected by mat_det2csf_confspace '''
+        csd_addr, csf_addr = get_confspace_addrs (self._norb, self._neleca, self._nelecb,
+                                                  self._smult, confs)[:2]
+        return self.csd_mask[csd_addr], csf_addr
+
     def mat_det2csf_confspace (self, mat, confs):
         mat, csf_addr = transform_opmat_det2csf_pspace (mat, confs, self._norb, self._neleca,
             self._nelecb, self._smult, self.csd_mask, self.econf_det_mask, self.econf_csf_mask) 
@@ -102,9 +142,18 @@ class CSFTransformer (lib.StreamObject):
 
     def _update_spin_cache (self, norb, neleca, nelecb, smult):
         if any ([self._norb != norb, self._neleca != neleca, self._nelecb != nelecb, self._smult != smult]):
-            self.csd_mask = csdstring.make_csd_mask (norb, neleca, nelecb)
-            self.econf_det_mask = csdstring.make_econf_det_mask (norb, neleca, nelecb, self.csd_mask)
-            self.econf_csf_mask = make_econf_csf_mask (norb, neleca, nelecb, smult)
+            key = (norb, neleca, nelecb)
+            self.csd_mask = load_or_make_table ('csd_mask', key, csdstring.make_csd_mask,
+                                                norb, neleca, nelecb, dtype=np.uint32)
+            self.econf_det_mask = load_or_make_table ('econf_det_mask', key,
+                                                      csdstring.make_econf_det_mask,
+                                                      norb, neleca, nelecb, self.csd_mask,
+                                                      dtype=np.uint32)
+            self.econf_csf_mask = load_or_make_table ('econf_csf_mask', key + (smult,),
+                                                      make_econf_csf_mask,
+                                                      norb, neleca, nelecb, smult,
+                                                      dtype=np.uint32)
+            self._transform_plan = None
             self._norb = norb
             self._neleca = neleca
             self._nelecb = nelecb
@@ -112,7 +161,11 @@ class CSFTransformer (lib.StreamObject):
 
     def _update_symm_cache (self, orbsym):
         if (orbsym is not None) and (self._orbsym is None or np.any (orbsym != self._orbsym)):
-            self.confsym = make_confsym (self.norb, self.neleca, self.nelecb, self.econf_det_mask, orbsym)
+            orbsym = np.asarray (orbsym)
+            symkey = hashlib.sha1 (orbsym.astype (np.int64).tobytes ()).hexdigest ()[:16]
+            self.confsym = load_or_make_table ('confsym', (self.norb, self.neleca, self.nelecb, symkey),
+                                               make_confsym, self.norb, self.neleca, self.nelecb,
+                                               self.econf_det_mask, orbsym, dtype=np.int32)
         self._orbsym = orbsym
 
     def printable_largest_csf (self, csfvec, npr, order='C', isdet=False, normalize=True):
@@ -209,6 +262,12 @@ class CSFTransformer (lib.StreamObject):
         if self.wfnsym is None or self._orbsym is None: return self.econf_csf_mask.size
         return (np.count_nonzero (self.confsym[self.econf_csf_mask] == self.wfnsym))
 
+def _copy_to_out (arr, out):
+    if out is None: return arr
+    if isinstance (arr, np.ndarray) and np.shares_memory (arr, out): return out
+    out[...] = np.asarray (arr).reshape (out.shape)
+    return out
+
 def unpack_sym_ci (ci, idx, vec_on_cols=False):
     if idx is None: return ci
     tot_len = idx.size
@@ -324,7 +383,7 @@ def project_civec_csf (detarr, norb, neleca, nelecb, smult, csd_mask=None):
     '''
     return detarr / detnorm, detnorm
 
-def transform_civec_det2csf (detarr, norb, neleca, nelecb, smult, csd_mask=None, vec_on_cols=False, do_normalize=True):
+def transform_civec_det2csf (detarr, norb, neleca, nelecb, smult, csd_mask=None, vec_on_cols=False, do_normalize=True, plan=None, out=None):
     ''' Express CI vector in terms of CSFs for spin s
 
     Args
@@ -340,6 +399,10 @@ def transform_civec_det2csf (detarr, norb, neleca, nelecb, smult, csd_mask=None,
         (i.e., an eigenvector matrix) (requires 2d ndarray for detarr)
     do_normalize: bool
         If false, do NOT normalize the vector (i.e., if it is a matrix-vector product
+    plan: tuple
+        Output of make_transform_plan. If provided, csd_mask is ignored.
+    out: C-contiguous ndarray of size ncsf * nvec
+        If provided (and vec_on_cols is False), the CSF vectors are written into out
 
     Returns
     csfarr: same data type as detarr
@@ -371,7 +434,12 @@ def transform_civec_det2csf (detarr, norb, neleca, nelecb, smult, csd_mask=None,
      
 
     # Driver needs an ndarray of explicit shape (*, ndet)        
-    csfarr = _transform_detcsf_vec_or_mat (detarr, norb, neleca, nelecb, smult, reverse=False, op_matrix=False, csd_mask=csd_mask, project=False)
+    if plan is not None:
+        if vec_on_cols or not _is_out_ok (out, nvec*plan[1]): out = None
+        if out is not None: out = out.reshape (nvec, plan[1])
+        csfarr = _transform_det2csf_plan (detarr, plan, reverse=False, out=out)
+    else:
+        csfarr = _transform_detcsf_vec_or_mat (detarr, norb, neleca, nelecb, smult, reverse=False, op_matrix=False, csd_mask=csd_mask, project=False)
     if csfarr.size == 0:
         assert (False)
         return np.zeros (0, dtype=detarr.dtype), 0.0
@@ -385,7 +453,7 @@ def transform_civec_det2csf (detarr, norb, neleca, nelecb, smult, csd_mask=None,
         csfarr = csfarr.T
     csfarr = np.ascontiguousarray (csfarr)
     if is_flat:
-        csfarr = csfarr.ravel ()
+        csfarr = csfarr.reshape (-1)
     elif is_list:
         csfarr = list (csfarr)
     elif is_tuple:
@@ -397,7 +465,7 @@ def transform_civec_det2csf (detarr, norb, neleca, nelecb, smult, csd_mask=None,
         csfnorm = 0.0
     return csfarr, csfnorm
 
-def transform_civec_csf2det (csfarr, norb, neleca, nelecb, smult, csd_mask=None, vec_on_cols=False, do_normalize=True):
+def transform_civec_csf2det (csfarr, norb, neleca, nelecb, smult, csd_mask=None, vec_on_cols=False, do_normalize=True, plan=None, out=None):
     ''' Transform CI vector in terms of CSFs back into determinants
 
     Args
@@ -412,7 +480,10 @@ def transform_civec_csf2det (csfarr, norb, neleca, nelecb, smult, csd_mask=None,
         (i.e., an eigenvector matrix) (requires 2d ndarray for detarr)
     do_normalize: bool
         If false, do NOT normalize the vector (i.e., if it is a matrix-vector product
-        
+    plan: tuple
+        Output of make_transform_plan. If provided, csd_mask is ignored.
+    out: C-contiguous ndarray of size ndet * nvec
+        If provided (and vec_on_cols is False), the determinant vectors are written into out
 
     Returns
     detarr: same data type as csfarr. Last dimension is of length ndeta*ndetb
@@ -445,18 +516,23 @@ def transform_civec_csf2det (csfarr, norb, neleca, nelecb, smult, csd_mask=None,
     else:
         csfarr = np.ascontiguousarray (csfarr.reshape (nvec, ncsf))
 
-    detarr = _transform_detcsf_vec_or_mat (csfarr, norb, neleca, nelecb, smult, reverse=True, op_matrix=False, csd_mask=csd_mask, project=False)
+    if plan is not None:
+        if vec_on_cols or not _is_out_ok (out, nvec*ndet): out = None
+        if out is not None: out = out.reshape (nvec, ndet)
+        detarr = _transform_det2csf_plan (csfarr, plan, reverse=True, out=out)
+    else:
+        detarr = _transform_detcsf_vec_or_mat (csfarr, norb, neleca, nelecb, smult, reverse=True, op_matrix=False, csd_mask=csd_mask, project=False)
 
     # Manipulate detarr back into the original shape
     detnorm = linalg.norm (detarr, axis=1)
     if do_normalize:
-        detarr = detarr / detnorm[:,np.newaxis]
+        detarr /= detnorm[:,np.newaxis]
     detarr = detarr.reshape (nvec, ndet)
     if vec_on_cols:
         detarr = detarr.T
     detarr = np.ascontiguousarray (detarr)
     if is_flat:
-        detarr = detarr.ravel ()
+        detarr = detarr.reshape (-1)
     elif is_list:
         detarr = list (detarr)
     elif is_tuple:
@@ -488,6 +564,80 @@ def transform_opmat_det2csf (detarr, norb, neleca, nelecb, smult, csd_mask=None)
     csfarr = _transform_detcsf_vec_or_mat (detarr, norb, neleca, nelecb, smult, reverse=False, op_matrix=True, csd_mask=csd_mask, project=False)
     return csfarr
 
+def make_transform_plan (norb, neleca, nelecb, smult, csd_mask=None):
+    ''' Precompute the gather/scatter plan of the determinant<->CSF transformation. In csd order,
+    the determinants of each spin-pairing sector with any CSFs occupy a contiguous range, as do
+    the corresponding CSFs, so the whole transformation is a single gather (or scatter) of
+    determinants followed by one blocked GEMM per sector.
+
+    Returns:
+        det_perm: ndarray of ints
+            Determinant addresses in the order in which they are consumed by the blocks
+        ncsf_all: int
+            Total number of CSFs
+        blocks: list of tuples (d0, d1, c0, c1, nconf, ndet, ncsf, umat)
+            det_perm[d0:d1] and CSFs c0:c1 belong to a sector of nconf configurations, each with
+            ndet determinants and ncsf CSFs related by the spin-coupling matrix umat
+        det_unused: ndarray of ints
+            Determinant addresses with no CSF of the given spin
+    '''
+    min_npair, npair_csd_offset, npair_dconf_size, npair_sconf_size, npair_sdet_size = csdstring.get_csdaddrs_shape (norb, neleca, nelecb)
+    _, npair_csf_offset, _, _, npair_csf_size = get_csfvec_shape (norb, neleca, nelecb, smult)
+    ndet_all = special.comb (norb, neleca, exact=True) * special.comb (norb, nelecb, exact=True)
+    ncsf_all = count_all_csfs (norb, neleca, nelecb, smult)
+    if csd_mask is None: csd_mask = csdstring.make_csd_mask (norb, neleca, nelecb)
+    det_perm = []
+    blocks = []
+    d0 = 0
+    for npair in range (min_npair, min (neleca, nelecb)+1):
+        ipair = npair - min_npair
+        ncsf = npair_csf_size[ipair]
+        nconf = npair_dconf_size[ipair] * npair_sconf_size[ipair]
+        ndet = npair_sdet_size[ipair]
+        if ncsf == 0 or nconf == 0: continue
+        nspin = neleca + nelecb - 2*npair
+        csd_offset = npair_csd_offset[ipair]
+        c0 = npair_csf_offset[ipair]
+        d1 = d0 + nconf*ndet
+        det_perm.append (csd_mask[csd_offset:][:nconf*ndet])
+        umat = np.asarray_chkfinite (get_spin_evecs (nspin, neleca, nelecb, smult))
+        blocks.append ((d0, d1, c0, c0+nconf*ncsf, nconf, ndet, ncsf, umat))
+        d0 = d1
+    if len (det_perm): det_perm = np.concatenate (det_perm).astype (np.int64)
+    else: det_perm = np.zeros (0, dtype=np.int64)
+    det_used = np.zeros (ndet_all, dtype=np.bool_)
+    det_used[det_perm] = True
+    det_unused = np.where (~det_used)[0]
+    return det_perm, ncsf_all, blocks, det_unused
+
+def _is_out_ok (out, size):
+    return (isinstance (out, np.ndarray) and out.size == size and out.flags.c_contiguous
+            and out.dtype == np.float64)
+
+def _transform_det2csf_plan (inparr, plan, reverse=False, out=None):
+    ''' Transform an array of shape (nrow, ndet) [(nrow, ncsf) if reverse] using the output of
+    make_transform_plan, optionally writing into the preallocated array out '''
+    det_perm, ncsf_all, blocks, det_unused = plan
+    nrow = inparr.shape[0]
+    ndet_all = det_perm.size + det_unused.size
+    dtype = np.result_type (inparr.dtype, np.float64)
+    if out is not None and out.dtype != dtype: out = None
+    if not reverse:
+        if out is None: out = np.empty ((nrow, ncsf_all), dtype=dtype)
+        buf = np.take (inparr, det_perm, axis=1)
+        for d0, d1, c0, c1, nconf, ndet, ncsf, umat in blocks:
+            np.matmul (buf[:,d0:d1].reshape (nrow, nconf, ndet), umat,
+                       out=out[:,c0:c1].reshape (nrow, nconf, ncsf))
+    else:
+        if out is None: out = np.empty ((nrow, ndet_all), dtype=dtype)
+        buf = np.empty ((nrow, det_perm.size), dtype=dtype)
+        for d0, d1, c0, c1, nconf, ndet, ncsf, umat in blocks:
+            np.matmul (inparr[:,c0:c1].reshape (nrow, nconf, ncsf), umat.T,
+                       out=buf[:,d0:d1].reshape (nrow, nconf, ndet))
+        out[:,det_perm] = buf
+        if det_unused.size: out[:,det_unused] = 0
+    return out
+
 def _transform_detcsf_vec_or_mat (arr, norb, neleca, nelecb, smult, reverse=False, op_matrix=False, csd_mask=None, project=False):
     ''' Wrapper to manipulate array into correct shape and transform both dimensions if an operator matrix 
 
@@ -636,29 +786,70 @@ def _transform_det2csf (inparr, norb, neleca, nelecb, smult, reverse=False, csd_
     '''
     return outarr
 
-def transform_opmat_det2csf_pspace (op, econfs, norb, neleca, nelecb, smult, csd_mask, econf_det_mask, econf_csf_mask):
+def get_confspace_addrs (norb, neleca, nelecb, smult, econfs):
+    ''' Get the addresses of all determinants and CSFs spanning a subset of electron
+    configurations directly from the shape of the csd- and CSF-ordered CI vectors, without
+    searching econf_det_mask or econf_csf_mask
+
+    Args:
+        norb, neleca, nelecb, smult: ints
+            basic parameters: numbers of orbitals and electrons and 2s+1
+        econfs: ndarray of ints
+            sorted, unique addresses of electron configurations in the canonical order defined by
+            csdstring.py
+
+    Returns:
+        csd_addrs: ndarray of ints
+            csd-ordered addresses of the determinants; the corresponding determinant addresses are
+            csd_mask[csd_addrs]
+        csf_addrs: ndarray of ints
+            addresses of the CSFs, in canonical order
+        blocks: list of tuples (nconf, ndet, ncsf, nspin)
+            csd_addrs and csf_addrs are composed of consecutive blocks of nconf configurations
+            with nspin unpaired electrons, each with ndet determinants and ncsf CSFs
+    '''
+    econfs = np.asarray (econfs, dtype=np.int64).ravel ()
+    assert (np.all (econfs[1:] > econfs[:-1])), "econfs must be sorted and unique"
+    min_npair, npair_csd_offset, npair_dconf_size, npair_sconf_size, npair_sdet_size = csdstring.get_csdaddrs_shape (norb, neleca, nelecb)
+    _, npair_csf_offset, _, _, npair_csf_size = get_csfvec_shape (norb, neleca, nelecb, smult)
+    npair_econf_size = npair_dconf_size.astype (np.int64) * npair_sconf_size
+    npair_conf_offset = np.cumsum (npair_econf_size) - npair_econf_size
+    csd_addrs = [np.zeros (0, dtype=np.int64)]
+    csf_addrs = [np.zeros (0, dtype=np.int64)]
+    blocks = []
+    for ipair, (conf_offset, nconf_full) in enumerate (zip (npair_conf_offset, npair_econf_size)):
+        i, j = np.searchsorted (econfs, [conf_offset, conf_offset+nconf_full])
+        if i == j: continue
+        confs = econfs[i:j,None] - conf_offset
+        ndet = int (npair_sdet_size[ipair])
+        ncsf = int (npair_csf_size[ipair])
+        nspin = neleca + nelecb - 2*(ipair + min_npair)
+        csd_addrs.append ((npair_csd_offset[ipair] + confs*ndet + np.arange (ndet)).ravel ())
+        csf_addrs.append ((npair_csf_offset[ipair] + confs*ncsf + np.arange (ncsf)).ravel ())
+        blocks.append ((j-i, ndet, ncsf, nspin))
+    return np.concatenate (csd_addrs), np.concatenate (csf_addrs), blocks
+
+def transform_opmat_det2csf_pspace (op, econfs, norb, neleca, nelecb, smult, csd_mask=None,
+                                    econf_det_mask=None, econf_csf_mask=None):
     ''' Transform an operator matrix from the determinant basis to the csf basis, in a subspace of determinants spanning
         the electron configurations addressed by econfs
 
     Args:
         op: square ndarray
             operator matrix in the determinant basis
-            the basis must be arranged in the order (econfs[0], det[0]), (econfs [0], det[1]), ...
+            the basis must be arranged in csd order, i.e., (econfs[0], det[0]), (econfs [0], det[1]), ...
             (econfs[1], det[0]), ...
             where det[n] is the nth configuration of spins compatible with a given spinless
             electron configuration (i.e., a configuration with no singly-occupied orbitals has only 1 determinant, etc.)
+            The corresponding determinant addresses are csd_mask[get_confspace_addrs (...)[0]].
             It MUST include ALL determinants within each electron configuration given by econfs
         econfs: ndarray of ints
-            addresses for electron configurations in the canonical order defined by csdstring.py
+            sorted, unique addresses for electron configurations in the canonical order defined by csdstring.py
             (NOT determinants, refers to strings like 2 2 1 2 0 0)
         norb, neleca, nelecb, smult: ints
             basic parameters: numbers of orbitals and electrons and 2s+1
-        csd_mask: ndarray of ints
-            csd_mask[idx_csd] = idx_dd
-        econf_det_mask: ndarray of ints
-            econf_det_mask[idx_dd] = idx_econf
-        econf_csf_mask: ndarray of ints
-            econf_det_mask[idx_csf] = idx_econf
+        csd_mask, econf_det_mask, econf_csf_mask: ndarray of ints
+            Not used; retained for backwards compatibility
 
     Returns:
         op: ndarray
@@ -666,74 +857,32 @@ def transform_opmat_det2csf_pspace (op, econfs, norb, neleca, nelecb, smult, csd
         csf_addrs: ndarray of ints
             CI vector element addresses in CSF basis
     '''
-
-    nconf_all = econfs.size 
-    # I basically need to invert econf_det_mask and econf_csf_mask. I can't use argsort for this because their elements aren't unique
-    # csf_addrs needs to be sorted because I don't want to make a second reduced_csd_mask index for the csf-basis version (see below);
-    # just return the damn thing in the canonical order!
-    det_addrs = np.concatenate ([np.nonzero (econf_det_mask == conf)[0] for conf in econfs])
-    csf_addrs = np.sort (np.concatenate ([np.nonzero (econf_csf_mask == conf)[0] for conf in econfs]))
-    ndet_all = det_addrs.size
+    csd_addrs, csf_addrs, blocks = get_confspace_addrs (norb, neleca, nelecb, smult, econfs)
+    ndet_all = csd_addrs.size
     ncsf_all = csf_addrs.size
-    # econfs could have been provided in any order and defines the indexing of "op" (via det_addrs as generated above).
-    #   I need to generate a mask array to address the elements of "op"
-    #   in the "canonical" ordering (ipair, doubly-occupied string, singly-occupied string, and spin configuration)
-    #   that I developed in csd string but spanning only those configurations that are included in econfs.
-    #   The next line should accomplish this. np.argsort (mask) inverts a given mask index array (assuming its elements are unique).
-    #   So for instance, np.argsort (csd_mask)[det_addrs] gives you csd addresses.
-    #   Then np.argsort (np.argsort (csd_mask)[det_addrs])[csd_addrs] inverts it twice, and gives you determinant addresses,
-    #   but if det_addrs doesn't span the whole space, then csd_addrs can't either. In other words, the csd indices are compressed
-    #   and correspond to the elements of op.
-    reduced_csd_mask = np.argsort (np.argsort (csd_mask)[det_addrs])
-    assert (op.shape == (ndet_all, ndet_all)), "operator matrix shape problem ({} for det_addrs of size {})".format (op.shape, det_addrs.size)
-    min_npair, npair_csd_offset, npair_dconf_size, npair_sconf_size, npair_sdet_size = csdstring.get_csdaddrs_shape (norb, neleca, nelecb)
-    _, npair_csf_offset, _, _, npair_csf_size = get_csfvec_shape (norb, neleca, nelecb, smult)
-    npair_econf_size = npair_dconf_size * npair_sconf_size
-    max_npair = min (neleca, nelecb)
-    assert (np.count_nonzero (reduced_csd_mask[1:] - reduced_csd_mask[:-1] - 1)==0)
-    def ax_b (mat):
-        nrow = mat.shape[0]
-        assert (mat.shape[1] == ndet_all)
-        outmat = np.zeros ((nrow, ncsf_all), dtype=mat.dtype)
-        det_offset = 0
-        csf_offset = 0
-        full_conf_offset = 0
-        full_det_offset = 0
-        for npair in range (min_npair, max_npair+1):
-            ipair = npair - min_npair
-            nconf_full = npair_econf_size[ipair]
-            nconf = np.count_nonzero (np.isin (range (full_conf_offset, full_conf_offset+nconf_full), econfs))
-            full_conf_offset += nconf_full
-            ncsf = npair_csf_size[ipair]
-            ndet = npair_sdet_size[ipair]
-            full_det_offset += nconf_full * ndet
-            if nconf == 0 or ncsf == 0 or ndet == 0:
-                continue
-
-            ci = csf_offset
-            cj = ci + nconf*ncsf
-
-            di = reduced_csd_mask[det_offset]
-            dj = di + nconf*ndet
-            mat_ij = mat[:,di:dj].reshape (nrow, nconf, ndet)
-
-            nspin = neleca + nelecb - 2*npair
-            umat = np.asarray_chkfinite (get_spin_evecs (nspin, neleca, nelecb, smult))
-
-            outmat[:,ci:cj] = np.tensordot (mat_ij, umat, axes=1).reshape (nrow, ncsf*nconf, order='C')
-
-            det_offset += nconf*ndet
-            csf_offset += nconf*ncsf
-
-        assert (det_offset <= ndet_all), "{} {}".format (det_offset, ndet_all) # Can be less because npair < min_npair corresponds to some dets that are skipped
-        assert (csf_offset == ncsf_all), "{} {}".format (csf_offset, ncsf_all)
-        return outmat
-
-    op = ax_b (op).conj ().T
-    op = ax_b (op).conj ().T
+    assert (op.shape == (ndet_all, ndet_all)), "operator matrix shape problem ({} for {} determinants)".format (op.shape, ndet_all)
+    # Each block of configurations shares one spin-coupling matrix, so the transformation is one
+    # GEMM per block on each index. The large determinant-basis matrix is only ever addressed by
+    # contiguous blocks of rows.
+    umats = [None if ncsf == 0 else np.asarray_chkfinite (get_spin_evecs (nspin, neleca, nelecb, smult))
+             for nconf, ndet, ncsf, nspin in blocks]
+    def iter_blocks ():
+        det_offset = csf_offset = 0
+        for (nconf, ndet, ncsf, nspin), umat in zip (blocks, umats):
+            di, dj = det_offset, det_offset + nconf*ndet
+            ci, cj = csf_offset, csf_offset + nconf*ncsf
+            det_offset, csf_offset = dj, cj
+            if ncsf == 0: continue
+            yield di, dj, ci, cj, nconf, ndet, ncsf, umat
+    uop = np.empty ((ncsf_all, ndet_all), dtype=op.dtype)
+    for di, dj, ci, cj, nconf, ndet, ncsf, umat in iter_blocks ():
+        mat_ij = op[di:dj].reshape (nconf, ndet, ndet_all)
+        uop[ci:cj] = np.matmul (umat.conj ().T, mat_ij).reshape (nconf*ncsf, ndet_all)
+    op = np.empty ((ncsf_all, ncsf_all), dtype=uop.dtype)
+    for di, dj, ci, cj, nconf, ndet, ncsf, umat in iter_blocks ():
+        mat_ij = uop[:,di:dj].reshape (ncsf_all, nconf, ndet)
+        op[:,ci:cj] = np.tensordot (mat_ij, umat, axes=1).reshape (ncsf_all, nconf*ncsf)
     return op, csf_addrs
-            
-
 
 def make_econf_csf_mask (norb, neleca, nelecb, smult):
     ''' Make a mask index matching csfs to electron configurations '''
@@ -853,14 +1002,164 @@ def get_csfvec_shape (norb, neleca, nelecb, smult):
 
     return min_npair, npair_offset[:-1], npair_dconf_size, npair_sconf_size, npair_csf_size
 
+class LRUCache (abc.ABC):
+    ''' Thread-safe least-recently-used cache of read-only objects built from a key tuple.
+    Subclasses implement _build (*key), and _nbytes (obj) if obj has no nbytes attribute.
+
+    Attributes:
+        max_memory : float
+            Maximum total size in MB of the cached objects. The least-recently-used entries are
+            evicted when it is exceeded; objects larger than this are never cached. Set to 0 to
+            disable caching. Defaults to CACHE_MAX_MEMORY.
+        hits : int
+            Number of calls served from the cache
+        misses : int
+            Number of calls which had to build the object
+        evictions : int
+            Number of entries dropped to respect max_memory
+    '''
+
+    def __init__(self, max_memory=CACHE_MAX_MEMORY):
+        self.max_memory = max_memory
+        self._data = collections.OrderedDict ()
+        self._lock = threading.RLock ()
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len (self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __call__(self, *key):
+        with self._lock:
+            obj = self._data.get (key, None)
+            if obj is not None:
+                self._data.move_to_end (key)
+                self.hits += 1
+                return obj
+            self.misses += 1
+        # Build outside of the lock, so that other threads aren't held up by a big object
+        obj = self._build (*key)
+        nbytes = self._nbytes (obj)
+        with self._lock:
+            if nbytes <= self.max_memory*1e6 and key not in self._data:
+                self._data[key] = obj
+                self.nbytes += nbytes
+                self._evict ()
+        return obj
+
+    @abc.abstractmethod
+    def _build (self, *key):
+        ''' Make the object to be cached under key '''
+
+    def _nbytes (self, obj):
+        return obj.nbytes
+
+    def _evict (self):
+        while self.nbytes > self.max_memory*1e6 and len (self._data):
+            key, obj = self._data.popitem (last=False)
+            self.nbytes -= self._nbytes (obj)
+            self.evictions += 1
+
+    def clear (self):
+        with self._lock:
+            self._data.clear ()
+            self.nbytes = 0
+
+    def stats (self):
+        ''' Returns a dict of the hit, miss, and eviction counts and the number and total size
+        in MB of the cached objects '''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len (self._data), 'memory': self.nbytes / 1e6}
+
+class SpinEvecsCache (LRUCache):
+    ''' Process-wide LRU cache of the spin-coupling matrices returned by get_spin_evecs, shared
+    by all CSFTransformer instances in the process. The cached arrays are read-only. See
+    LRUCache. '''
+
+    def _build (self, nspin, neleca, nelecb, smult):
+        umat = _make_spin_evecs (nspin, neleca, nelecb, smult)
+        umat.flags.writeable = False
+        return umat
+
+spin_evecs_cache = SpinEvecsCache ()
+
+def load_or_make_table (name, key, builder, *args, dtype=None, cache_dir=None):
+    ''' Memory-map a previously-computed string table from the on-disk cache, or compute it as
+    builder (*args) and save it there for next time. The file name includes TABLE_CACHE_VERSION
+    and the dtype, and a file whose contents do not have that dtype is rebuilt.
+
+    Args:
+        name : str
+            Kind of table (i.e., 'csd_mask')
+        key : tuple
+            Parameters (i.e., norb, neleca, nelecb) which uniquely determine the table
+        builder : callable
+            Computes the table from args
+
+    Kwargs:
+        dtype : data-type
+            Data type of the table. Defaults to that of builder's output, in which case the table
+            has to be built before the cache can be searched.
+        cache_dir : str
+            Directory of the cache. Defaults to the module-level TABLE_CACHE_DIR. If neither is
+            set, the table is simply computed.
+
+    Returns:
+        table : ndarray
+            Read-only if it was memory-mapped
+    '''
+    if cache_dir is None: cache_dir = TABLE_CACHE_DIR
+    table = None
+    if dtype is None:
+        table = builder (*args)
+        dtype = table.dtype
+    dtype = np.dtype (dtype)
+    if not cache_dir:
+        if table is None: table = builder (*args)
+        return np.asarray (table, dtype=dtype)
+    fname = os.path.join (cache_dir, '{}_v{}_{}_{}.npy'.format (
+        name, TABLE_CACHE_VERSION, dtype.str.lstrip ('<>|='), '_'.join ([str (k) for k in key])))
+    try:
+        cached = np.load (fname, mmap_mode='r')
+        if cached.dtype == dtype: return cached
+    except (OSError, ValueError):
+        pass
+    if table is None: table = builder (*args)
+    table = np.asarray (table, dtype=dtype)
+    # Write to a temporary file and rename, so that concurrent processes never see half a table
+    try:
+        os.makedirs (cache_dir, exist_ok=True)
+        fd, ftmp = tempfile.mkstemp (suffix='.npy', dir=cache_dir)
+        try:
+            with os.fdopen (fd, 'wb') as f:
+                np.save (f, table)
+            os.replace (ftmp, fname)
+        except Exception:
+            os.remove (ftmp)
+            raise
+    except OSError as e:
+        warnings.warn ('could not cache {} in {}: {}'.format (name, cache_dir, e))
+    return table
+
 def get_spin_evecs (nspin, neleca, nelecb, smult):
-    ms = (neleca - nelecb) / 2
-    s = (smult - 1) / 2
+    ''' The (ndet, ncsf) matrix transforming nspin singly-occupied spin-orbitals with neleca - 
+    nelecb spin polarization from determinants to CSFs with multiplicity smult. The result is
+    taken from the read-only, process-wide spin_evecs_cache if possible. '''
     #assert (neleca >= nelecb)
     assert (abs (neleca - nelecb) <= smult - 1)
     assert (abs (neleca - nelecb) <= nspin)
     assert (abs (neleca - nelecb) % 2 == (smult-1) % 2)
     assert (abs (neleca - nelecb) % 2 == nspin % 2)
+    return spin_evecs_cache (nspin, neleca, nelecb, smult)
+
+def _make_spin_evecs (nspin, neleca, nelecb, smult):
+    ms = (neleca - nelecb) / 2
+    s = (smult - 1) / 2
 
     na = (nspin + neleca - nelecb) // 2
     ndet = special.comb (nspin, na, exact=True)
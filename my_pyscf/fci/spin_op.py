@@ -18,9 +18,10 @@
 from functools import reduce
 import numpy as np
 from scipy import linalg
-from pyscf import lib
+from pyscf import lib, __config__
 from pyscf.fci import cistring
 from pyscf.fci.addons import _unpack_nelec
+from mrh.my_pyscf.fci.csfstring import LRUCache
 
 librdm = lib.load_library('libfci')
 
@@ -59,59 +60,149 @@ librdm = lib.load_library('libfci')
 #       <CI|ao><ao|S^2|CI>
 # For a complete list of AOs, I = \sum |ao><ao|, it becomes <CI|S^2|CI>
 
+def _gen_map (norb, nelec, des=True):
+    ''' For each orbital i, the addresses of the strings on which a_i (des) or a'_i (not des)
+    acts, the addresses of the resulting strings, and the signs '''
+    if des:
+        index = cistring.gen_des_str_index (range (norb), nelec)
+        orb = index[:,:,1]
+    else:
+        index = cistring.gen_cre_str_index (range (norb), nelec)
+        orb = index[:,:,0]
+    src = np.broadcast_to (np.arange (index.shape[0])[:,None], orb.shape)
+    tgt, sgn = index[:,:,2], index[:,:,3]
+    maps = []
+    for i in range (norb):
+        idx = (orb == i) & (sgn != 0)
+        maps.append ((src[idx], tgt[idx], sgn[idx]))
+    return maps
+
+def make_sladder_map (norb, nelec, op=-1):
+    ''' The string maps used by contract_sladder: for each orbital i, a tuple of (source alpha
+    addresses, target alpha addresses, alpha signs, source beta addresses, target beta addresses,
+    beta signs) for the term a'_i,beta a_i,alpha (op=-1) or a'_i,alpha a_i,beta (op=1) '''
+    neleca, nelecb = _unpack_nelec (nelec)
+    amaps = _gen_map (norb, neleca, des=(op==-1))
+    bmaps = _gen_map (norb, nelecb, des=(op==1))
+    return tuple ([amap + bmap for amap, bmap in zip (amaps, bmaps)])
+
+class SLadderMapCache (LRUCache):
+    ''' Process-wide LRU cache of the output of make_sladder_map, keyed by
+    (norb, neleca, nelecb, op). See csfstring.LRUCache. '''
+
+    def _build (self, norb, neleca, nelecb, op):
+        maps = make_sladder_map (norb, (neleca, nelecb), op=op)
+        for m in maps:
+            for x in m: x.flags.writeable = False
+        return maps
+
+    def _nbytes (self, maps):
+        return sum ([x.nbytes for m in maps for x in m])
+
+# Relative norm below which the result of a spin ladder operator is taken to be zero. For a
+# normalized spin eigenstate, |S-|S,M>|**2 = S(S+1) - M(M-1) is at least 1 unless M = -S.
+NULL_THRESH = getattr (__config__, 'fci_spin_op_sladder_null_thresh', 1e-8)
+
+sladder_map_cache = SLadderMapCache ()
+
 def contract_sladder(fcivec, norb, nelec, op=-1):
     ''' Contract spin ladder operator S+ or S- with fcivec.
         Changes neleca - nelecb without altering <S2>
         Obtained by modifying pyscf.fci.spin_op.contract_ss
+
+        fcivec may also be a list or 3d array of several CI vectors, which are all processed
+        together, in which case the result is a 3d array. The string maps are taken from
+        sladder_map_cache. Each result is normalized, except for null results (i.e., S- or S+
+        acting on the M_S = -S or +S component of a spin eigenstate), the norm of which is
+        smaller than NULL_THRESH times that of the corresponding input vector; these are
+        returned as zero vectors.
     '''
     neleca, nelecb = _unpack_nelec(nelec)
     na = cistring.num_strings(norb, neleca)
     nb = cistring.num_strings(norb, nelecb)
-    fcivec = fcivec.reshape(na,nb)
+    fcivec = np.asarray (fcivec)
+    single = (fcivec.ndim < 3 and fcivec.size == na*nb)
+    fcivec = fcivec.reshape(-1,na,nb)
+    nvecs = fcivec.shape[0]
     assert (op in (-1,1)), 'op = -1 or 1'
     if ((op==-1 and (neleca==0 or nelecb==norb)) or
-        (op==1 and (neleca==norb or nelecb==0))): return np.zeros ((0,0))
+        (op==1 and (neleca==norb or nelecb==0))):
+        return np.zeros ((0,0)) if single else np.zeros ((nvecs,0,0))
     # ^ Annihilate vacuum state ^
 
-    def gen_map(fstr_index, nelec, des=True):
-        a_index = fstr_index(range(norb), nelec)
-        amap = np.zeros((a_index.shape[0],norb,2), dtype=np.int32)
-        if des:
-            for k, tab in enumerate(a_index):
-                amap[k,tab[:,1]] = tab[:,2:]
-        else:
-            for k, tab in enumerate(a_index):
-                amap[k,tab[:,0]] = tab[:,2:]
-        return amap
-
-    if op==-1:
-        aindex = gen_map(cistring.gen_des_str_index, neleca)
-        bindex = gen_map(cistring.gen_cre_str_index, nelecb, False)
-    else:
-        aindex = gen_map(cistring.gen_cre_str_index, neleca, False)
-        bindex = gen_map(cistring.gen_des_str_index, nelecb)
-
-    ci1 = np.zeros((cistring.num_strings(norb,neleca+op),
-                   cistring.num_strings(norb,nelecb-op)))
-    for i in range(norb):
-        signa = aindex[:,i,1]
-        signb = bindex[:,i,1]
-        maska = np.where(signa!=0)[0]
-        maskb = np.where(signb!=0)[0]
-        addra = aindex[maska,i,0]
-        addrb = bindex[maskb,i,0]
-        citmp = lib.take_2d(fcivec, maska, maskb)
-        citmp *= signa[maska].reshape(-1,1)
-        citmp *= signb[maskb]
-        #: ci1[addra.reshape(-1,1),addrb] += citmp
-        lib.takebak_2d(ci1, citmp, addra, addrb)
-    ci1 /= linalg.norm (ci1) # ???
-    return ci1
+    maps = sladder_map_cache (norb, neleca, nelecb, op)
+    na1 = cistring.num_strings(norb,neleca+op)
+    nb1 = cistring.num_strings(norb,nelecb-op)
+    # All vectors at once: alpha strings on the rows, (vector, beta string) pairs on the columns
+    ci0 = np.ascontiguousarray (fcivec.transpose (1,0,2).reshape (na, nvecs*nb))
+    ci1 = np.zeros((na1, nvecs*nb1), dtype=fcivec.dtype)
+    offs0 = np.arange (nvecs)[:,None] * nb
+    offs1 = np.arange (nvecs)[:,None] * nb1
+    for srca, tgta, signa, srcb, tgtb, signb in maps:
+        citmp = lib.take_2d(ci0, srca, (offs0 + srcb[None,:]).ravel ())
+        citmp *= signa.reshape(-1,1)
+        citmp *= np.tile (signb, nvecs)
+        #: ci1[tgta.reshape(-1,1),tgtb] += citmp
+        lib.takebak_2d(ci1, citmp, tgta, (offs1 + tgtb[None,:]).ravel ())
+    ci1 = ci1.reshape (na1, nvecs, nb1).transpose (1,0,2)
+    norm1 = linalg.norm (ci1.reshape (nvecs,-1), axis=1)
+    norm0 = linalg.norm (fcivec.reshape (nvecs,-1), axis=1)
+    null = norm1 <= NULL_THRESH * norm0
+    ci1[null] = 0
+    ci1[~null] /= norm1[~null,None,None]
+    if single: ci1 = ci1[0]
+    return np.ascontiguousarray (ci1)
 
 
 def contract_sdown (ci, norb, nelec): return contract_sladder (ci, norb, nelec, op=-1)
 def contract_sup (ci, norb, nelec): return contract_sladder (ci, norb, nelec, op=1)
 
+def make_spin_multiplet (ci, norb, nelec, smult, transformer=None):
+    ''' All 2S+1 M_S components of one or several spin eigenstates, from the M_S = S component.
+
+    Equivalent to applying contract_sdown smult-1 times in succession, but each component is
+    generated independently by transforming the CSF coefficients of ci, which do not depend
+    on M_S, back to determinants for every M_S at once. The phase convention is that of the
+    ladder operator.
+
+    Args:
+        ci : ndarray or list of ndarrays
+            CI vector(s) in the determinant basis with neleca - nelecb = smult - 1
+        norb : integer
+            Number of orbitals
+        nelec : integer or tuple of length 2
+            Number of electrons of ci
+        smult : integer
+            Spin multiplicity of ci
+
+    Kwargs:
+        transformer : instance of :class:`CSFTransformer`
+            Transformer for ci, if one is already available
+
+    Returns:
+        ci_ms : list of length smult
+            ci_ms[k] is ci lowered k times, as a 3d array if ci is a list or 3d array, and as
+            a 2d array otherwise
+    '''
+    from mrh.my_pyscf.fci.csfstring import CSFTransformer
+    neleca, nelecb = _unpack_nelec (nelec)
+    assert (neleca - nelecb == smult - 1)
+    na = cistring.num_strings (norb, neleca)
+    nb = cistring.num_strings (norb, nelecb)
+    ci = np.asarray (ci)
+    single = (ci.ndim < 3 and ci.size == na*nb)
+    ci = ci.reshape (-1, na, nb)
+    if transformer is None:
+        transformer = CSFTransformer (norb, neleca, nelecb, smult)
+    ci_csf = transformer.vec_det2csf (ci, normalize=False)
+    ci_ms = [ci[0] if single else ci,]
+    for k in range (1, smult):
+        t = CSFTransformer (norb, neleca-k, nelecb+k, smult)
+        ci1 = t.vec_csf2det (ci_csf).reshape (-1, t.ndeta, t.ndetb)
+        if (k * (neleca + nelecb - 1)) % 2: ci1 = -ci1
+        ci_ms.append (ci1[0] if single else ci1)
+    return ci_ms
+
 if __name__ == '__main__':
     import sys
     import time
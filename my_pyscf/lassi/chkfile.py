@@ -1,3 +1,6 @@
+import h5py
+import numpy as np
+from pyscf import gto
 from mrh.my_pyscf.mcscf import chkfile as las_chkfile
 
 KEYS_CONFIG_LASSI = las_chkfile.KEYS_CONFIG_LASSCF + ['nfrags', 'break_symmetry', 'soc', 'opt']
@@ -22,7 +25,53 @@ def dump_lsi (lsi, chkfile='None', method_key='lsi', mo_coeff=None, ci=None,
                                  ci=ci, overwrite_mol=overwrite_mol, keys_config=keys_config,
                                  keys_saconstr=keys_saconstr, keys_results=keys_results, **kwargs)
 
-                                  
-
-
+def dump_excitations (lsi, chkfile=None, method_key='lsis_excitations'):
+    '''Save the warm-start caches ci_spin_flips and ci_charge_hops of a LASSIS object, together
+    with the molecule and orbitals in which they are expressed, so that load_excitations_ can
+    restore them in a later run'''
+    if chkfile is None: chkfile = lsi.chkfile
+    if not chkfile: return lsi
+    basis = getattr (lsi, '_ci_cache_basis', None)
+    if basis is None: return lsi
+    mol, mo_coeff = basis
+    with h5py.File (chkfile, 'a') as fh5:
+        if method_key in fh5:
+            del (fh5[method_key])
+        chkdata = fh5.create_group (method_key)
+        chkdata['mol'] = mol.dumps ()
+        chkdata['mo_coeff'] = mo_coeff
+        # keys of ci_spin_flips are (ifrag, 'u' or 'd')
+        chkdata_sf = chkdata.create_group ('ci_spin_flips')
+        for (ifrag, ud), ci in lsi.ci_spin_flips.items ():
+            chkdata_sf['{}{}'.format (ifrag, ud)] = ci
+        # keys of ci_charge_hops are integer hashes of rootspaces; ragged values
+        chkdata_ch = chkdata.create_group ('ci_charge_hops')
+        for key, ci in lsi.ci_charge_hops.items ():
+            chkdata_ch_i = chkdata_ch.create_group (str (key))
+            for j, cij in enumerate (ci):
+                chkdata_ch_i[str(j)] = cij
+    return lsi
 
+def load_excitations_(lsi, chkfile=None, method_key='lsis_excitations'):
+    '''Restore the caches saved by dump_excitations into a LASSIS object. If the orbitals of lsi
+    differ, the cached CI vectors are projected onto them when they are used.'''
+    if chkfile is None: chkfile = lsi.chkfile
+    if chkfile is None: raise RuntimeError ('chkfile not specified')
+    with h5py.File (chkfile, 'r') as fh5:
+        if method_key not in fh5:
+            raise KeyError ('{} record not in chkfile'.format (method_key.upper()))
+        chkdata = fh5[method_key]
+        mol = chkdata['mol'][()]
+        if isinstance (mol, bytes): mol = mol.decode ()
+        mol = gto.loads (mol)
+        mo_coeff = chkdata['mo_coeff'][()]
+        ci_spin_flips = {}
+        for key, ci in chkdata['ci_spin_flips'].items ():
+            ci_spin_flips[(int (key[:-1]), key[-1])] = ci[()]
+        ci_charge_hops = {}
+        for key, ci in chkdata['ci_charge_hops'].items ():
+            ci_charge_hops[int (key)] = [ci[str(j)][()] for j in range (len (ci))]
+    lsi.ci_spin_flips = ci_spin_flips
+    lsi.ci_charge_hops = ci_charge_hops
+    lsi._ci_cache_basis = (mol, mo_coeff)
+    return lsi
@@ -1,4 +1,12 @@
+import io
+import sys
+import contextlib
 import numpy as np
+from pyscf import lib
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
 
 def get_lroots (ci):
     '''Generate a table showing the number of states contained in a (optionally nested) list
@@ -64,4 +72,44 @@ def get_rootaddr_fragaddr (lroots):
         rootaddr[i:j] = iroot
     return rootaddr, fragaddr
 
+def _run_tasks (tasks, costs=None, max_workers=1, stdout=None):
+    '''Call each of a list of independent callables and return their results in order. Each
+    task is called with one argument, a file object to which it should write its log output (e.g.,
+    by pyscf.lib.logger.Logger (stdout, verbose), or by setting the stdout of the solvers that it
+    runs). If max_workers > 1, the calls are made concurrently in a pool of that many threads,
+    the most costly ones first, with the OpenMP threads shared out among the workers. (The heavy
+    lifting of the CI solvers is done by BLAS and C kernels which release the GIL.)
 
+    If max_workers > 1, each task writes to its own io.StringIO buffer, and the buffers are
+    written to stdout one at a time in task order, so that the output is the same as for
+    max_workers = 1 (apart from timings). Output which a task writes anywhere else is not
+    reordered. The BLAS thread pool is limited to the same number of threads per worker if
+    threadpoolctl is installed; otherwise, a BLAS library with its own (non-OpenMP) thread pool
+    keeps all of its threads in every worker, and max_workers > 1 oversubscribes the CPU.'''
+    if stdout is None: stdout = sys.stdout
+    ntasks = len (tasks)
+    if max_workers is None or max_workers <= 1 or ntasks <= 1:
+        return [task (stdout) for task in tasks]
+    from concurrent.futures import ThreadPoolExecutor
+    if costs is None: costs = np.zeros (ntasks)
+    max_workers = min (max_workers, ntasks)
+    nthreads = max (1, lib.num_threads () // max_workers)
+    def run (task):
+        buf = io.StringIO ()
+        with lib.with_omp_threads (nthreads):
+            return task (buf), buf
+    if threadpool_limits is not None:
+        blas_limits = threadpool_limits (limits=nthreads, user_api='blas')
+    else:
+        blas_limits = contextlib.nullcontext ()
+    order = np.argsort (-np.asarray (costs), kind='stable')
+    results = []
+    with blas_limits:
+        with ThreadPoolExecutor (max_workers=max_workers) as executor:
+            futures = {i: executor.submit (run, tasks[i]) for i in order}
+            for i in range (ntasks):
+                result, buf = futures[i].result ()
+                stdout.write (buf.getvalue ())
+                results.append (result)
+    stdout.flush ()
+    return results
@@ -17,6 +17,8 @@ LOWEST_REFOVLP_EIGVAL_THRESH = getattr (__config__, 'lassi_excitations_refovlp_e
 IMAG_SHIFT = getattr (__config__, 'lassi_excitations_imag_shift', 1e-6)
 MAX_CYCLE_E0 = getattr (__config__, 'lassi_excitations_max_cycle_e0', 1)
 CONV_TOL_E0 = getattr (__config__, 'lassi_excitations_conv_tol_e0', 1e-8)
+VRV_RANK_THRESH = getattr (__config__, 'lassi_excitations_vrv_rank_thresh', 1e-12)
+VRV_SVD_MIN_SIZE = getattr (__config__, 'lassi_excitations_vrv_svd_min_size', 16)
 
 def lowest_refovlp_eigval (ham_pq, ovlp_thresh=LOWEST_REFOVLP_EIGVAL_THRESH):
     ''' Return the lowest eigenvalue of the matrix ham_pq, whose corresponding
@@ -148,7 +150,6 @@ class ExcitationPSFCISolver (ProductStateFCISolver):
             ref_weights = [0.0,]*len (solvers_ref)
             ref_weights[0] = 1.0
         self.solvers_ref = solvers_ref
-        self.ci_ref = ci_ref
         self.ref_weights = np.asarray (ref_weights)
         self.norb_ref = np.asarray (norb_ref)
         self.nelec_ref = nelec_ref
@@ -159,6 +160,21 @@ class ExcitationPSFCISolver (ProductStateFCISolver):
         self._deactivate_vrv = False # for testing
         ProductStateFCISolver.__init__(self, solvers_ref[0].fcisolvers, stdout=stdout,
                                        verbose=verbose)
+        self.set_ci_ref_(ci_ref)
+        self.excited_frags = []
+        self.fcisolvers = []
+        self._e_q = []
+        self._si_q = []
+
+    def set_ci_ref_(self, ci_ref):
+        '''Replace the CI vectors of the reference states, i.e., in order to reuse this solver
+        after a change of orbitals or geometry, and update their density matrices
+
+        Args:
+            ci_ref: list of length nfrags of list of length nref of ndarrays
+                CI vectors of each fragment in each reference state'''
+        norb_ref, nelec_ref = self.norb_ref, self.nelec_ref
+        self.ci_ref = ci_ref
         ci_ref_rf = [[c[i] for c in ci_ref] for i in range (len (self.solvers_ref))]
         self.dm1s_ref = np.asarray ([s.make_rdm1s (c, norb_ref, nelec_ref)
                                      for s, c in zip (self.solvers_ref, ci_ref_rf)])
@@ -166,10 +182,7 @@ class ExcitationPSFCISolver (ProductStateFCISolver):
         self.dm2_ref = np.asarray ([s.make_rdm2 (c, norb_ref, nelec_ref)
                                     for s, c in zip (self.solvers_ref, ci_ref_rf)])
         self.dm2_ref = np.tensordot (self.ref_weights, self.dm2_ref, axes=1)
-        self.excited_frags = []
-        self.fcisolvers = []
-        self._e_q = []
-        self._si_q = []
+        return self
 
     def get_excited_orb_idx (self):
         nj = np.cumsum (self.norb_ref)
@@ -477,7 +490,11 @@ class VRVDressedFCISolver (object):
 
     Additional attributes:
         v_qpab: ndarray of shape (nq, np, ndeta, ndetb)
-            Contains the CI vector V_PQ |Q> in the |P> Hilbert space
+            Contains the CI vector V_PQ |Q> in the |P> Hilbert space. Stored internally as a
+            truncated SVD, from which the (rank x rank) matrix of the VRV operator is computed
+            once per update of denom_q, and reconstructed when it is read. Every assignment
+            costs an SVD of the (nq*np, ndeta*ndetb) matrix, i.e., O((nq*np)**2 * ndeta*ndetb)
+            operations, unless nq*np < vrv_svd_min_size.
         e_q: ndarray of shape (nq,)
             Eigenenergies of the QQ sector of the Hamiltonian
         denom_q: ndarray of shape (nq,)
@@ -488,9 +505,16 @@ class VRVDressedFCISolver (object):
             eigenproblem
         conv_tol_e0: float
             Convergence threshold for the self-consistent eigenenergy
+        vrv_rank_thresh: float
+            Singular values of V_PQ smaller than this, relative to the largest one, are
+            discarded
+        vrv_svd_min_size: integer
+            If nq*np is smaller than this, V_PQ is stored untruncated and the SVD is skipped,
+            because removing at most nq*np rows would save little in each sigma vector
     '''
     _keys = {'contract_vrv', 'base', 'v_qpab', 'denom_q', 'e_q', 'max_cycle_e0', 'conv_tol_e0',
-             'charge', 'crash_locmin', 'imag_shift'}
+             'charge', 'crash_locmin', 'imag_shift', 'vrv_rank_thresh',
+             'vrv_svd_min_size'}
     def __init__(self, fcibase, my_vrv, my_eq, my_e0, max_cycle_e0=MAX_CYCLE_E0,
                  conv_tol_e0=CONV_TOL_E0, crash_locmin=False):
         self.base = copy.copy (fcibase)
@@ -501,6 +525,8 @@ class VRVDressedFCISolver (object):
         self.__dict__.update (fcibase.__dict__)
         self.denom_q = 0
         self.imag_shift = IMAG_SHIFT
+        self.vrv_rank_thresh = VRV_RANK_THRESH
+        self.vrv_svd_min_size = VRV_SVD_MIN_SIZE
         self.e_q = my_eq
         self.v_qpab = my_vrv
         self.max_cycle_e0 = max_cycle_e0
@@ -508,15 +534,87 @@ class VRVDressedFCISolver (object):
         self.crash_locmin = crash_locmin
         self.davidson_only = self.base.davidson_only = True
         # TODO: Relaxing this ^ requires accounting for pspace, precond, and/or hdiag
+    @property
+    def v_qpab (self):
+        if getattr (self, '_vrv_w', None) is None: return None
+        return np.dot (self._vrv_us, self._vrv_w).reshape (self._vrv_shape)
+    @v_qpab.setter
+    def v_qpab (self, v_qpab):
+        self._vrv_core = None
+        if v_qpab is None:
+            self._vrv_us = self._vrv_w = self._vrv_shape = None
+            return
+        v_qpab = np.asarray (v_qpab)
+        self._vrv_shape = v_qpab.shape
+        q, p = v_qpab.shape[:2]
+        vmat = v_qpab.reshape (q*p, -1)
+        if vmat.size == 0:
+            self._vrv_us = np.zeros ((q*p, 0), dtype=vmat.dtype)
+            self._vrv_w = np.zeros ((0, vmat.shape[1]), dtype=vmat.dtype)
+            return
+        if q*p < getattr (self, 'vrv_svd_min_size', VRV_SVD_MIN_SIZE):
+            self._vrv_us = np.eye (q*p, dtype=vmat.dtype)
+            self._vrv_w = np.ascontiguousarray (vmat)
+            return
+        # V_PQ = (U S) W, truncated to its numerical rank
+        u, svals, w = linalg.svd (vmat, full_matrices=False)
+        thresh = getattr (self, 'vrv_rank_thresh', VRV_RANK_THRESH)
+        r = np.count_nonzero (svals > thresh * svals[0])
+        self._vrv_us = np.ascontiguousarray (u[:,:r] * svals[None,:r])
+        self._vrv_w = np.ascontiguousarray (w[:r])
+    @property
+    def denom_q (self):
+        return self._denom_q
+    @denom_q.setter
+    def denom_q (self, denom_q):
+        self._denom_q = denom_q
+        self._vrv_core = None
+    def get_vrv_core (self, denom_q=None):
+        '''The VRV operator is W^T C W^*, where V_PQ = (U S) W, and the (rank x rank) matrix
+
+        C = (U S)^T R_QQ (U S)^*
+
+        is computed here. Unless denom_q is given, it is cached until v_qpab, denom_q, or
+        imag_shift change.'''
+        cache = denom_q is None
+        if cache:
+            if self._vrv_core is not None and self._vrv_core[0] == self.imag_shift:
+                return self._vrv_core[1]
+            denom_q = self.denom_q
+        q, p = self._vrv_shape[:2]
+        denom_q = np.broadcast_to (denom_q, (q,))
+        idx = np.abs (denom_q) > 1e-16
+        denom_fac_q = np.zeros (q)
+        denom_fac_q[idx] = np.real (1.0 / (denom_q[idx] + 1j*self.imag_shift))
+        rus = (self._vrv_us.reshape (q,p,-1) * denom_fac_q[:,None,None]).reshape (q*p,-1)
+        core = np.dot (rus.T, self._vrv_us.conj ())
+        if cache: self._vrv_core = (self.imag_shift, core)
+        return core
+    def get_vket (self, ket):
+        '''Compute <Q|V_QP|ket> as an array of shape (nq, np)'''
+        q, p = self._vrv_shape[:2]
+        return np.dot (self._vrv_us, np.dot (self._vrv_w, np.ravel (ket))).reshape (q,p)
     def contract_2e(self, eri, fcivec, norb, nelec, link_index=None, v_qpab=None, denom_q=None,
                     **kwargs):
         ci0 = self.undressed_contract_2e (eri, fcivec, norb, nelec, link_index, **kwargs)
         ci0 += self.contract_vrv (fcivec, v_qpab=v_qpab, denom_q=denom_q)
         return ci0
     def contract_vrv (self, ket, v_qpab=None, denom_q=None):
-        if v_qpab is None: v_qpab = self.v_qpab
+        '''Apply the VRV operator to ket, which may also be an array of several CI vectors'''
+        if v_qpab is not None:
+            return self._contract_vrv_dense (ket, v_qpab, denom_q)
+        if getattr (self, '_vrv_w', None) is None: return np.zeros_like (ket)
+        r, ndet = self._vrv_w.shape
+        if not r: return np.zeros_like (ket)
+        core = self.get_vrv_core (denom_q=denom_q)
+        ket_shape = ket.shape
+        kets = np.asarray (ket).reshape (-1, ndet).T
+        w = self._vrv_w
+        wket = np.dot (w.conj () if np.iscomplexobj (w) else w, kets)
+        hket = np.dot (w.T, np.dot (core, wket))
+        return hket.T.reshape (ket_shape)
+    def _contract_vrv_dense (self, ket, v_qpab, denom_q=None):
         if denom_q is None: denom_q = self.denom_q
-        if v_qpab is None: return np.zeros_like (ket)
         ket_shape = ket.shape
         idx = np.abs (denom_q) > 1e-16
         p = v_qpab.shape[1]
@@ -530,15 +628,15 @@ class VRVDressedFCISolver (object):
         return hket
     def test_locmin (self, e0, ci, norb, nelec, h0e, h1e, h2e, warntag='Apparent local minimum'):
         log = lib.logger.new_logger (self, self.verbose)
-        if self.v_qpab is not None:
-            p, na, nb = self.v_qpab.shape[1:]
+        if self._vrv_shape is not None:
+            p, na, nb = self._vrv_shape[1:]
             ci = np.asarray (ci).reshape (-1,na,nb)[0]
         ket = ci if isinstance (ci, np.ndarray) else ci[0]
         vrvket = self.contract_vrv (ket)
         vrv = np.dot (ket.conj ().ravel (), vrvket.ravel ())
         if abs (vrv) < 1e-16: return False
         e_p = e0 - vrv
-        h_qp = np.tensordot (self.v_qpab, ket, axes=2)
+        h_qp = self.get_vket (ket)
         de_pq = np.zeros_like (self.denom_q)
         idx = np.abs (self.denom_q) > 1e-16
         de_pq[idx] = np.diag (np.dot (h_qp.conj (), h_qp.T))[idx] / self.denom_q[idx]
@@ -571,15 +669,18 @@ class VRVDressedFCISolver (object):
                 raise RuntimeError (errstr)
             return True
         return False
-    def solve_e0 (self, h0e, h1e, h2e, norb, nelec, ket):
+    def solve_e0 (self, h0e, h1e, h2e, norb, nelec, ket, hket_p=None):
+        '''If hket_p, the undressed Hamiltonian applied to ket, is already known, it can be
+        passed in order to skip the sigma-vector step.'''
         # TODO: figure out how to modify this for p>1
         log = lib.logger.new_logger (self, self.verbose)
-        hket_p = self.undressed_contract_2e (self.absorb_h1e (h1e, h2e, norb, nelec, 0.5),
-                                             ket, norb, nelec)
+        if hket_p is None:
+            hket_p = self.undressed_contract_2e (self.absorb_h1e (h1e, h2e, norb, nelec, 0.5),
+                                                 ket, norb, nelec)
         e_p = np.dot (np.ravel (ket), np.ravel (hket_p)) + h0e
-        if self.v_qpab is None: return e_p
-        q, p = self.v_qpab.shape[0:2]
-        v_q = np.dot (self.v_qpab.reshape (q,p,-1), np.ravel (ket)).T.ravel ()
+        if self._vrv_shape is None: return e_p
+        q, p = self._vrv_shape[0:2]
+        v_q = self.get_vket (ket).T.ravel ()
         e_pq = np.append ([e_p,], list(self.e_q)*p)
         ham_pq = np.diag (e_pq)
         ham_pq[0,1:] = v_q
@@ -590,14 +691,20 @@ class VRVDressedFCISolver (object):
         return e0
     def sort_ci (self, h0e, h1e, h2e, norb, nelec, ci):
         if self.nroots==1: ci = [ci]
-        e0 = [self.solve_e0 (h0e, h1e, h2e, norb, nelec, ket) for ket in ci]
+        # The undressed sigma vectors serve both for e0 and for the dressed energies below
+        h2eff = self.absorb_h1e (h1e, h2e, norb, nelec, 0.5)
+        hci = [self.undressed_contract_2e (h2eff, ket, norb, nelec) for ket in ci]
+        e0 = [self.solve_e0 (h0e, h1e, h2e, norb, nelec, ket, hket_p=hket)
+              for ket, hket in zip (ci, hci)]
         idx = np.argsort (e0)
         e0 = [e0[ix] for ix in idx]
         ci = [ci[ix] for ix in idx]
+        hci = [hci[ix] for ix in idx]
         den = e0[0] - self.e_q
-        h2eff = self.absorb_h1e (h1e, h2e, norb, nelec, 0.5)
-        e = [np.dot (ket.ravel(), self.contract_2e (h2eff, ket, norb, nelec, denom_q=den).ravel())
-             for ket in ci]
+        vrvci = self.contract_vrv (np.stack ([np.asarray (ket) for ket in ci], axis=0),
+                                   denom_q=den)
+        e = [np.dot (ket.ravel(), (hket + vrvket).ravel()) for ket, hket, vrvket
+             in zip (ci, hci, vrvci)]
         if self.nroots > 1:
             idx = np.argsort (e[1:])
             ci = [ci[0]] + [ci[1:][ix] for ix in idx]
@@ -605,20 +712,26 @@ class VRVDressedFCISolver (object):
             ci = ci[0]
         return e0[0], ci
     def kernel (self, h1e, h2e, norb, nelec, ecore=0, ci0=None, orbsym=None, **kwargs):
+        '''Self-consistent loop over e0, each cycle of which is a complete Davidson solution of
+        the dressed eigenproblem. No Krylov subspace is carried over between cycles, because
+        pyscf's Davidson solver cannot be restarted from one; each cycle is only warm-started
+        from the CI vectors of the last one.'''
         log = lib.logger.new_logger (self, self.verbose)
         max_cycle_e0 = self.max_cycle_e0
         conv_tol_e0 = self.conv_tol_e0
         e0_last = 0
         converged = False
         ket = ci0[0] if self.nroots>1 else ci0
-        e0 = self.solve_e0 (ecore, h1e, h2e, norb, nelec, ket)
+        h2eff = self.absorb_h1e (h1e, h2e, norb, nelec, 0.5)
+        # ket is the same for every e0 update below, so its sigma vector is computed only once
+        hket = self.undressed_contract_2e (h2eff, ket, norb, nelec)
+        e0 = self.solve_e0 (ecore, h1e, h2e, norb, nelec, ket, hket_p=hket)
         ci1 = ci0
         self.denom_q = e0 - self.e_q
         log.debug ("Self-energy singularities in VRVSolver: {}".format (self.e_q))
         log.debug ("e0 = %.8g", e0)
         log.debug ("Denominators in VRVSolver: {}".format (self.denom_q))
         self.test_locmin (e0, ci1, norb, nelec, ecore, h1e, h2e, warntag='Saddle-point initial guess')
-        h2eff = self.absorb_h1e (h1e, h2e, norb, nelec, 0.5)
         for it in range (max_cycle_e0):
             e, ci1 = self.undressed_kernel (
                 h1e, h2e, norb, nelec, ecore=ecore, ci0=ci1, orbsym=orbsym, **kwargs
@@ -633,7 +746,7 @@ class VRVDressedFCISolver (object):
                 hci = self.undressed_contract_2e (h2eff, ci1, norb, nelec)
                 e = ecore + np.dot (ci1.ravel (), hci.ravel ())
             e0_last = e0
-            e0 = self.solve_e0 (ecore, h1e, h2e, norb, nelec, ket)
+            e0 = self.solve_e0 (ecore, h1e, h2e, norb, nelec, ket, hket_p=hket)
             self.denom_q = e0 - self.e_q
             log.debug ("e0 = %.8g", e0)
             log.debug ("Denominators in VRVSolver: {}".format (self.denom_q))
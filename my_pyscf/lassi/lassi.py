@@ -9,6 +9,7 @@ from pyscf.lib.numpy_helper import tag_array
 from pyscf.fci.direct_spin1 import _unpack_nelec
 from itertools import combinations, product
 from mrh.my_pyscf.mcscf import soc_int as soc_int
+from pyscf import __config__
 
 
 # TODO: fix stdm1 index convention in both o0 and o1
@@ -22,6 +23,12 @@ from mrh.my_pyscf.mcscf import soc_int as soc_int
 # temporary environment.
 
 LINDEP_THRESHOLD = 1.0e-5
+# Check of the LASSI matrices against the reference op_o0 algorithm: None (no check), 'full' (all
+# matrix elements), or 'sample' (VALIDATE_NSAMPLE random rows of each symmetry block, drawn by a
+# random number generator seeded with VALIDATE_SEED; None for a different sample each run)
+VALIDATE = getattr (__config__, 'lassi_validate', None)
+VALIDATE_NSAMPLE = getattr (__config__, 'lassi_validate_nsample', 4)
+VALIDATE_SEED = getattr (__config__, 'lassi_validate_seed', 0)
 
 op = (op_o0, op_o1)
 
@@ -232,10 +239,27 @@ class LASSIOop01DisagreementError (RuntimeError):
         return self.message
 
 def lassi (las, mo_coeff=None, ci=None, veff_c=None, h2eff_sub=None, orbsym=None, soc=False,
-           break_symmetry=False, opt=1):
-    ''' Diagonalize the state-interaction matrix of LASSCF '''
+           break_symmetry=False, opt=1, validate=None, validate_nsample=None, validate_seed=None,
+           mats_known=None):
+    ''' Diagonalize the state-interaction matrix of LASSCF
+
+    The validate, validate_nsample, and validate_seed kwargs default to the attributes of the same
+    names of las, if any, and otherwise to VALIDATE, VALIDATE_NSAMPLE, and VALIDATE_SEED.
+
+    If mats_known = (mask_known_space, ham, s2, ovlp) is provided, the matrix elements among the
+    product states of the rootspaces selected by the mask array mask_known_space, in order, are
+    taken from the matrices ham (- e0), s2, and ovlp instead of being recomputed (opt=1 only).
+    The full matrices are tagged onto the returned si array as ham_mat, s2_mat, and ovlp_mat,
+    with the product states in rootspace order.'''
     if mo_coeff is None: mo_coeff = las.mo_coeff
     if ci is None: ci = las.ci
+    if validate is None: validate = getattr (las, 'validate', VALIDATE)
+    if validate not in (None, False, 'full', 'sample'):
+        raise RuntimeError ("validate = {}; must be None, 'full', or 'sample'".format (validate))
+    if validate_nsample is None:
+        validate_nsample = getattr (las, 'validate_nsample', VALIDATE_NSAMPLE)
+    if validate_seed is None: validate_seed = getattr (las, 'validate_seed', VALIDATE_SEED)
+    rng = np.random.default_rng (validate_seed)
     if orbsym is None: 
         orbsym = getattr (las.mo_coeff, 'orbsym', None)
         if orbsym is None and callable (getattr (las, 'label_symmetry_', None)):
@@ -257,8 +281,11 @@ def lassi (las, mo_coeff=None, ci=None, veff_c=None, h2eff_sub=None, orbsym=None
     s2_roots = []
     rootsym = []
     si = []
+    ham_mat = []
     s2_mat = []
+    ovlp_mat = []
     idx_allprods = []
+    nprods_r = np.prod (get_lroots (ci), axis=0)
     dtype = complex if soc else np.float64
 
     # Loop over symmetry blocks
@@ -277,14 +304,24 @@ def lassi (las, mo_coeff=None, ci=None, veff_c=None, h2eff_sub=None, orbsym=None
             lib.logger.debug (las, 'Only one state in this symmetry block')
             e_roots.extend (las1.e_states - e0)
             si.append (np.ones ((1,1), dtype=dtype))
+            ham_mat.append ((las1.e_states - e0)*np.ones((1,1)))
             s2_mat.append (s2_states[idx_space]*np.ones((1,1)))
+            ovlp_mat.append (np.ones ((1,1)))
             s2_roots.extend (s2_states[idx_space])
             rootsym.extend ([sym,])
             continue
         wfnsym = None if break_symmetry else sym[-1]
-        e, c, s2_blk = _eig_block (las1, e0, h1, h2, ci_blk, nelec_blk, sym, soc,
-                                   orbsym, wfnsym, o0_memcheck, opt)
+        mats_known_blk = None
+        if mats_known is not None and opt == 1:
+            mats_known_blk = _get_mats_known_blk (mats_known, idx_space, nprods_r)
+        e, c, (ham_blk, s2_blk, ovlp_blk) = _eig_block (las1, e0, h1, h2, ci_blk, nelec_blk, sym,
+                                                        soc, orbsym, wfnsym, o0_memcheck, opt,
+                                                        validate=validate,
+                                                        validate_nsample=validate_nsample,
+                                                        rng=rng, mats_known=mats_known_blk)
+        ham_mat.append (ham_blk)
         s2_mat.append (s2_blk)
+        ovlp_mat.append (ovlp_blk)
         si.append (c)
         s2_blk = c.conj ().T @ s2_blk @ c
         lib.logger.debug2 (las, 'Block S**2 in adiabat basis:')
@@ -297,7 +334,9 @@ def lassi (las, mo_coeff=None, ci=None, veff_c=None, h2eff_sub=None, orbsym=None
     # Therefore, I need to ~invert~ idx_allprods to get the proper order
     idx_allprods = np.argsort (idx_allprods)
     si = linalg.block_diag (*si)[idx_allprods,:]
+    ham_mat = linalg.block_diag (*ham_mat)[np.ix_(idx_allprods,idx_allprods)]
     s2_mat = linalg.block_diag (*s2_mat)[np.ix_(idx_allprods,idx_allprods)]
+    ovlp_mat = linalg.block_diag (*ovlp_mat)[np.ix_(idx_allprods,idx_allprods)]
 
     # Sort results by energy
     idx = np.argsort (e_roots)
@@ -315,7 +354,8 @@ def lassi (las, mo_coeff=None, ci=None, veff_c=None, h2eff_sub=None, orbsym=None
 
     # Results tagged on si array....
     si = si[:,idx]
-    si = tag_array (si, s2=s2_roots, s2_mat=s2_mat, nelec=nelec_roots, wfnsym=wfnsym_roots,
+    si = tag_array (si, s2=s2_roots, s2_mat=s2_mat, ham_mat=ham_mat, ovlp_mat=ovlp_mat,
+                    nelec=nelec_roots, wfnsym=wfnsym_roots,
                     rootsym=rootsym, break_symmetry=break_symmetry, soc=soc)
 
     # I/O
@@ -344,10 +384,33 @@ def lassi (las, mo_coeff=None, ci=None, veff_c=None, h2eff_sub=None, orbsym=None
             break
     return e_roots, si
 
-def _eig_block (las, e0, h1, h2, ci_blk, nelec_blk, rootsym, soc, orbsym, wfnsym, o0_memcheck, opt):
+def _check_o0_o1 (las, rootsym, mats_o1, mats_o0, soc):
+    for lbl, mat, ref in zip (('ham', 'S2', 'ovlp'), mats_o1, mats_o0):
+        lib.logger.debug (las,
+            'LASSI diagonalizer rootsym {}: {} o0-o1 algorithm disagreement = {}'.format (
+                rootsym, lbl, linalg.norm (mat - ref)))
+    errvec = np.concatenate ([(mat-ref).ravel () for mat, ref in zip (mats_o1, mats_o0)])
+    if np.amax (np.abs (errvec)) > 1e-8 and soc == False: # tmp until SOC in op_o1
+        raise LASSIOop01DisagreementError ("Hamiltonian + S2 + Ovlp", errvec)
+
+def _get_mats_known_blk (mats_known, idx_space, nprods_r):
+    '''Select the known matrix elements of one symmetry block (see lassi)'''
+    mask_known, mats = mats_known[0], mats_known[1:]
+    mask_known = np.asarray (mask_known, dtype=bool)
+    if not np.any (mask_known & idx_space): return None
+    offs = np.cumsum (nprods_r * mask_known) - nprods_r
+    idx = np.concatenate ([np.arange (offs[i], offs[i]+nprods_r[i])
+                           for i in np.where (mask_known & idx_space)[0]])
+    return [mask_known[idx_space],] + [mat[np.ix_(idx,idx)] for mat in mats]
+
+def _eig_block (las, e0, h1, h2, ci_blk, nelec_blk, rootsym, soc, orbsym, wfnsym, o0_memcheck, opt,
+                validate=None, validate_nsample=VALIDATE_NSAMPLE, rng=None, mats_known=None):
     # TODO: simplify
     t0 = (lib.logger.process_clock (), lib.logger.perf_counter ())
-    if (las.verbose > lib.logger.INFO) and (o0_memcheck):
+    if validate and not o0_memcheck:
+        lib.logger.debug (las, 'Insufficient memory to test against o0 LASSI algorithm')
+        validate = None
+    if validate == 'full':
         ham_ref, s2_ref, ovlp_ref = op_o0.ham (las, h1, h2, ci_blk, nelec_blk, soc=soc,
                                                orbsym=orbsym, wfnsym=wfnsym)
         t0 = lib.logger.timer (las, 'LASSI diagonalizer rootsym {} CI algorithm'.format (
@@ -361,29 +424,29 @@ def _eig_block (las, e0, h1, h2, ci_blk, nelec_blk, rootsym, soc, orbsym, wfnsym
                                                wfnsym=wfnsym)
         t0 = lib.logger.timer (las, 'LASSI diagonalizer rootsym {} TDM algorithm'.format (
             rootsym), *t0)
-        lib.logger.debug (las,
-            'LASSI diagonalizer rootsym {}: ham o0-o1 algorithm disagreement = {}'.format (
-                rootsym, linalg.norm (ham_blk - ham_ref))) 
-        lib.logger.debug (las,
-            'LASSI diagonalizer rootsym {}: S2 o0-o1 algorithm disagreement = {}'.format (
-                rootsym, linalg.norm (s2_blk - s2_ref))) 
-        lib.logger.debug (las,
-            'LASSI diagonalizer rootsym {}: ovlp o0-o1 algorithm disagreement = {}'.format (
-                rootsym, linalg.norm (ovlp_blk - ovlp_ref))) 
-        errvec = np.concatenate ([(ham_blk-ham_ref).ravel (), (s2_blk-s2_ref).ravel (),
-                                  (ovlp_blk-ovlp_ref).ravel ()])
-        if np.amax (np.abs (errvec)) > 1e-8 and soc == False: # tmp until SOC in op_o1
-            raise LASSIOop01DisagreementError ("Hamiltonian + S2 + Ovlp", errvec)
+        _check_o0_o1 (las, rootsym, (ham_blk, s2_blk, ovlp_blk), (ham_ref, s2_ref, ovlp_ref), soc)
         if opt == 0:
             ham_blk = ham_ref
             s2_blk = s2_ref
             ovlp_blk = ovlp_ref
     else:
-        if (las.verbose > lib.logger.INFO): lib.logger.debug (
-            las, 'Insufficient memory to test against o0 LASSI algorithm')
+        kwargs = {} if mats_known is None else {'mats_known': mats_known}
         ham_blk, s2_blk, ovlp_blk = op[opt].ham (las, h1, h2, ci_blk, nelec_blk, soc=soc,
-                                                 orbsym=orbsym, wfnsym=wfnsym)
+                                                 orbsym=orbsym, wfnsym=wfnsym, **kwargs)
         t0 = lib.logger.timer (las, 'LASSI H build rootsym {}'.format (rootsym), *t0)
+        if validate == 'sample' and opt != 0:
+            # Only a few rows of the reference matrices: one op_o0 H|ket> each
+            ndim = ham_blk.shape[0]
+            nsample = min (ndim, validate_nsample)
+            if rng is None: rng = np.random.default_rng (VALIDATE_SEED)
+            ikets = np.sort (rng.choice (ndim, size=nsample, replace=False))
+            lib.logger.debug (las, 'LASSI rootsym %s o0 check rows: %s', str (rootsym), str (ikets))
+            mats_ref = op_o0.ham (las, h1, h2, ci_blk, nelec_blk, soc=soc, orbsym=orbsym,
+                                  wfnsym=wfnsym, ikets=ikets)
+            t0 = lib.logger.timer (las, 'LASSI rootsym {} o0 check of {} rows'.format (
+                rootsym, nsample), *t0)
+            _check_o0_o1 (las, rootsym, [mat[ikets] for mat in (ham_blk, s2_blk, ovlp_blk)],
+                          mats_ref, soc)
     log_debug = lib.logger.debug2 if las.nroots>10 else lib.logger.debug
     if np.iscomplexobj (ham_blk):
         log_debug (las, 'Block Hamiltonian - ecore (real):')
@@ -428,7 +491,7 @@ def _eig_block (las, e0, h1, h2, ci_blk, nelec_blk, rootsym, soc, orbsym, wfnsym
                        '|ovlp| = {:.6e}').format (ovlp_det)
             raise RuntimeError (err_str) from e
         else: raise (e) from None
-    return e, c, s2_blk
+    return e, c, (ham_blk, s2_blk, ovlp_blk)
 
 def make_stdm12s (las, ci=None, orbsym=None, soc=False, break_symmetry=False, opt=1):
     ''' Evaluate <I|p'q|J> and <I|p'r'sq|J> where |I>, |J> are LAS states.
@@ -493,7 +556,7 @@ def make_stdm12s (las, ci=None, orbsym=None, soc=False, break_symmetry=False, op
         t0 = (lib.logger.process_clock (), lib.logger.perf_counter ())
         wfnsym = None if break_symmetry else sym[-1]
         # TODO: implement SOC in op_o1 and then re-enable the debugging block below
-        if (las.verbose > lib.logger.INFO) and (o0_memcheck) and (soc==False):
+        if (getattr (las, 'validate', VALIDATE) == 'full') and (o0_memcheck) and (soc==False):
             d1s, d2s = op_o0.make_stdm12s (las1, ci_blk, nelec_blk, orbsym=orbsym, wfnsym=wfnsym)
             t0 = lib.logger.timer (las, 'LASSI make_stdm12s rootsym {} CI algorithm'.format (
                 sym), *t0)
@@ -611,7 +674,7 @@ def roots_make_rdm12s (las, ci, si, orbsym=None, soc=None, break_symmetry=None,
         si_blk = si[np.ix_(idx_prod,idx_si)]
         t0 = (lib.logger.process_clock (), lib.logger.perf_counter ())
         # TODO: implement SOC in op_o1 and then re-enable the debugging block below
-        if (las.verbose > lib.logger.INFO) and (o0_memcheck) and (soc==False):
+        if (getattr (las, 'validate', VALIDATE) == 'full') and (o0_memcheck) and (soc==False):
             d1s, d2s = op_o0.roots_make_rdm12s (las1, ci_blk, nelec_blk, si_blk, orbsym=orbsym,
                                                 wfnsym=wfnsym)
             t0 = lib.logger.timer (las, 'LASSI make_rdm12s rootsym {} CI algorithm'.format (sym),
@@ -694,7 +757,7 @@ class LASSI(lib.StreamObject):
     LASSI Method class
     '''
     def __init__(self, las, mo_coeff=None, ci=None, soc=False, break_symmetry=False, opt=1,
-                 **kwargs):
+                 validate=VALIDATE, **kwargs):
         from mrh.my_pyscf.mcscf.lasci import LASCINoSymm
         if isinstance(las, LASCINoSymm): self._las = las
         else: raise RuntimeError("LASSI requires las instance")
@@ -713,7 +776,8 @@ class LASSI(lib.StreamObject):
         self.stdout, self.verbose, self.chkfile = las.stdout, las.verbose, las.chkfile
         # General config data from las parent
         self.max_memory = las.max_memory
-        keys = set(('e_roots', 'si', 's2', 's2_mat', 'nelec', 'wfnsym', 'rootsym', 'break_symmetry', 'soc', 'opt'))
+        keys = set(('e_roots', 'si', 's2', 's2_mat', 'nelec', 'wfnsym', 'rootsym', 'break_symmetry', 'soc', 'opt',
+                    'validate', 'validate_nsample', 'validate_seed'))
         self.e_roots = None
         self.si = None
         self.s2 = None
@@ -724,10 +788,13 @@ class LASSI(lib.StreamObject):
         self.break_symmetry = break_symmetry
         self.soc = soc
         self.opt = opt
+        self.validate = validate
+        self.validate_nsample = VALIDATE_NSAMPLE
+        self.validate_seed = VALIDATE_SEED
         self._keys = set((self.__dict__.keys())).union(keys)
 
     def kernel(self, mo_coeff=None, ci=None, veff_c=None, h2eff_sub=None, orbsym=None, soc=None,\
-               break_symmetry=None, opt=None,  **kwargs):
+               break_symmetry=None, opt=None, mats_known=None, **kwargs):
         if soc is None: soc = self.soc
         if break_symmetry is None: break_symmetry = self.break_symmetry
         if opt is None: opt = self.opt
@@ -735,7 +802,9 @@ class LASSI(lib.StreamObject):
         if not self.converged:
             log.warn ('LASSI state preparation step not converged!')
         e_roots, si = lassi(self, mo_coeff=mo_coeff, ci=ci, veff_c=veff_c, h2eff_sub=h2eff_sub, orbsym=orbsym, \
-                            soc=soc, break_symmetry=break_symmetry, opt=opt)
+                            soc=soc, break_symmetry=break_symmetry, opt=opt, validate=self.validate,
+                            validate_nsample=self.validate_nsample,
+                            validate_seed=self.validate_seed, mats_known=mats_known)
         self.e_roots = e_roots
         self.si, self.s2, self.s2_mat, self.nelec, self.wfnsym, self.rootsym, self.break_symmetry, self.soc  = \
             si, si.s2, si.s2_mat, si.nelec, si.wfnsym, si.rootsym, si.break_symmetry, si.soc
@@ -3,6 +3,8 @@ from pyscf.lib import logger
 from mrh.my_pyscf.lassi import LASSI
 from mrh.my_pyscf.lassi.states import spin_shuffle, spin_shuffle_ci
 from mrh.my_pyscf.lassi.states import all_single_excitations, SingleLASRootspace
+from mrh.my_pyscf.lassi.states import get_rootspace_table, _get_row_ids
+from mrh.my_pyscf.lassi.lassi import get_lroots
 from mrh.my_pyscf.mcscf.lasci import get_space_info
 
 def prepare_states_spin_shuffle (lsi):
@@ -22,9 +24,96 @@ def prepare_states (lsi):
         las = all_single_excitations (las)
     las = lsi.filter_spaces (las)
     lroots = lsi.make_lroots (las)
-    las.lasci_(lroots=lroots)
+    # 2. Fragment CI step, skipping rootspaces already solved by a previous (r,q) calculation
+    prev = lsi._rq_prev if _rq_prev_is_valid (lsi) else None
+    todo = np.ones (las.nroots, dtype=bool)
+    if prev is not None:
+        todo = _reuse_rootspaces_(las, lroots, prev['las'], prev['lroots'])
+        log.info ("LASSIrq: reusing %d of %d rootspaces from (r,q) = (%d,%d)",
+                  np.count_nonzero (~todo), las.nroots, prev['r'], prev['q'])
+    if np.all (todo):
+        las.lasci_(lroots=lroots)
+    elif np.any (todo):
+        _lasci_subset_(las, lroots, todo)
+    lsi._rq_prev = {'las': las, 'lroots': lroots, 'r': lsi.r, 'q': lsi.q, 'todo': todo,
+                    'mo_coeff': lsi._las.mo_coeff,
+                    'ci': [c for ci_i in lsi._las.ci for c in ci_i]}
     return las.converged, las
 
+def _rq_prev_is_valid (lsi):
+    '''Whether the rootspaces of the previous (r,q) calculation were built on the current LAS
+    reference'''
+    prev = getattr (lsi, '_rq_prev', None)
+    if prev is None: return False
+    if prev['mo_coeff'] is not lsi._las.mo_coeff: return False
+    ci = [c for ci_i in lsi._las.ci for c in ci_i]
+    return len (ci) == len (prev['ci']) and all ([c is c0 for c, c0 in zip (ci, prev['ci'])])
+
+def _get_rootspace_map (las, las0):
+    '''For each rootspace of las, the index of the same rootspace in las0, or -1 if it is new'''
+    ids, ids0 = _get_row_ids (get_rootspace_table (las).rows, get_rootspace_table (las0).rows)
+    idx0 = {i: j for j, i in enumerate (ids0)}
+    return np.array ([idx0.get (lbl, -1) for lbl in ids], dtype=int)
+
+def _reuse_rootspaces_(las, lroots, las0, lroots0):
+    '''Copy the fragment CI vectors of the rootspaces of las0 into the same rootspaces of las.
+    Rootspaces which were converged in las0 with the same lroots are not solved again and their
+    energies are copied as well; the vectors of the others are kept as initial guesses.
+
+    Returns:
+        todo: ndarray of shape (las.nroots,) of bool
+            Which rootspaces of las still need to be solved
+    '''
+    nfrags, nroots = las.nfrags, las.nroots
+    ci = [[None for i in range (nroots)] for j in range (nfrags)]
+    e_lexc = [[None for i in range (nroots)] for j in range (nfrags)]
+    e_states = np.zeros (nroots)
+    converged = [False for i in range (nroots)]
+    todo = np.ones (nroots, dtype=bool)
+    for i, j in enumerate (_get_rootspace_map (las, las0)):
+        if j < 0: continue
+        for ifrag in range (nfrags):
+            ci[ifrag][i] = las0.ci[ifrag][j]
+        if np.all (lroots[:,i] == lroots0[:,j]) and las0.states_converged[j]:
+            todo[i] = False
+            for ifrag in range (nfrags):
+                e_lexc[ifrag][i] = las0.e_lexc[ifrag][j]
+            e_states[i] = las0.e_states[j]
+            converged[i] = True
+    las.ci, las.e_lexc, las.e_states, las.converged = ci, e_lexc, e_states, converged
+    las.e_tot = np.dot (las.weights, las.e_states)
+    return todo
+
+def _get_mats_known (las, todo, las0, si0):
+    '''Hamiltonian, spin-squared, and overlap matrices among the product states of the rootspaces
+    of las copied unchanged from las0, taken from the LASSI eigenvectors si0 of las0; see the
+    mats_known kwarg of lassi'''
+    known = ~todo
+    if not np.any (known): return None
+    src = _get_rootspace_map (las, las0)
+    nprods0 = np.prod (get_lroots (las0.ci), axis=0)
+    offs0 = np.cumsum (nprods0) - nprods0
+    idx = np.concatenate ([np.arange (offs0[j], offs0[j]+nprods0[j]) for j in src[known]])
+    mats = [getattr (si0, key)[np.ix_(idx,idx)] for key in ('ham_mat', 's2_mat', 'ovlp_mat')]
+    return [known,] + mats
+
+def _lasci_subset_(las, lroots, todo):
+    '''Solve the fragment CI problems of a subset of the rootspaces of las in place'''
+    idx = np.where (todo)[0]
+    charges, spins, smults, wfnsyms = get_space_info (las)
+    las1 = las.state_average (weights=[las.weights[i] for i in idx], charges=charges[idx],
+                              spins=spins[idx], smults=smults[idx], wfnsyms=wfnsyms[idx])
+    las1.ci = [[ci_i[i] for i in idx] for ci_i in las.ci]
+    las1.lasci_(lroots=lroots[:,idx])
+    for k, i in enumerate (idx):
+        for ifrag in range (las.nfrags):
+            las.ci[ifrag][i] = las1.ci[ifrag][k]
+            las.e_lexc[ifrag][i] = las1.e_lexc[ifrag][k]
+        las.e_states[i] = las1.e_states[k]
+        las.states_converged[i] = las1.states_converged[k]
+    las.e_tot = np.dot (las.weights, las.e_states)
+    return las
+
 def make_lroots (lsi, las, q=None):
     if q is None: q = lsi.q
     ncsf = las.get_ugg ().ncsf_sub
@@ -34,9 +123,11 @@ class LASSIrq (LASSI):
     def __init__(self, las, r=0, q=1, opt=1, **kwargs):
         self.r = r
         self.q = q
+        self._rq_prev = None
         LASSI.__init__(self, las, opt=opt, **kwargs)
 
     def kernel (self, **kwargs):
+        prev = self._rq_prev if _rq_prev_is_valid (self) else None
         self.converged, las = self.prepare_states ()
         #self.__dict__.update(las.__dict__) # Unsafe
         self.fciboxes = las.fciboxes
@@ -45,7 +136,48 @@ class LASSIrq (LASSI):
         self.weights = las.weights
         self.e_lexc = las.e_lexc
         self.e_states = las.e_states
-        return LASSI.kernel (self, **kwargs)
+        si0 = None if prev is None else prev.get ('si', None)
+        if si0 is not None and getattr (si0, 'ham_mat', None) is not None:
+            # Matrix elements among rootspaces whose CI vectors were not solved again
+            kwargs.setdefault ('mats_known', _get_mats_known (las, self._rq_prev['todo'],
+                                                              prev['las'], si0))
+        e_roots, si = LASSI.kernel (self, **kwargs)
+        self._rq_prev['si'] = si
+        return e_roots, si
+
+    def extend (self, r=None, q=None, **kwargs):
+        '''Rerun the calculation with a larger excitation rank r and/or number of local roots q,
+        solving the fragment CI problems only of rootspaces which are new or whose number of local
+        roots has changed since the last calculation'''
+        if r is not None: self.r = r
+        if q is not None: self.q = q
+        return self.kernel (**kwargs)
+
+    def scan_rq (self, rq, **kwargs):
+        '''Run the calculation for a sequence of (r,q) pairs in order, each one reusing the
+        rootspaces of those before it, and log the convergence of the lowest energy
+
+        Args:
+            rq : list of tuples of length 2
+                (r,q) pairs
+
+        Returns:
+            e_rq : ndarray of shape (len (rq),)
+                Lowest LASSI energy for each (r,q) pair
+        '''
+        log = logger.new_logger (self, self.verbose)
+        e_rq, nroots = [], []
+        for r, q in rq:
+            self.extend (r=r, q=q, **kwargs)
+            e_rq.append (self.e_roots[0])
+            nroots.append (self.nroots)
+        e_rq = np.asarray (e_rq)
+        log.note ('LASSIrq energy convergence with r and q')
+        log.note ('%4s %4s %8s %20s %12s', 'r', 'q', 'nroots', 'E', 'dE')
+        for i, ((r, q), n, e) in enumerate (zip (rq, nroots, e_rq)):
+            de = e - e_rq[i-1] if i else 0
+            log.note ('%4d %4d %8d %20.12f %12.4e', r, q, n, e, de)
+        return e_rq
 
     def filter_spaces (self, las):
         # Hook for child methods
@@ -1,18 +1,28 @@
 import sys
+import contextlib
 import numpy as np
 from scipy import linalg
 from pyscf import lib, gto
 from pyscf.lib import logger
 from pyscf.lo.orth import vec_lowdin
 from mrh.my_pyscf.fci import csf_solver
-from mrh.my_pyscf.fci.csfstring import CSFTransformer
-from mrh.my_pyscf.fci.spin_op import contract_sdown, contract_sup
+from mrh.my_pyscf.fci.csfstring import CSFTransformer, count_all_csfs
+from mrh.my_pyscf.fci.spin_op import contract_sdown, contract_sup, make_spin_multiplet
 from mrh.my_pyscf.mcscf.lasci import get_space_info
 from mrh.my_pyscf.mcscf.productstate import ProductStateFCISolver
 from mrh.my_pyscf.lassi.excitations import ExcitationPSFCISolver
 from mrh.my_pyscf.lassi.states import spin_shuffle, spin_shuffle_ci
 from mrh.my_pyscf.lassi.states import all_single_excitations, SingleLASRootspace
+from mrh.my_pyscf.lassi.states import rootspaces_to_table, LazyCIList
+from mrh.my_pyscf.lassi.citools import _run_tasks
 from mrh.my_pyscf.lassi.lassi import LASSI
+from mrh.my_pyscf.lassi import chkfile as lassi_chkfile
+from pyscf import __config__
+
+# Number of threads among which to share independent fragment CI problems
+MAX_WORKERS = getattr (__config__, 'lassi_lassis_max_workers', 1)
+# Whether LASSIS.kernel saves the fragment excitations to the chkfile (see dump_excitations)
+DUMP_CHK_EXCITATIONS = getattr (__config__, 'lassi_lassis_dump_chk_excitations', False)
 
 # TODO: split prepare_states into three steps
 # 1. Compute the number of unique fragment CI vectors to be computed (including sz-flips but not
@@ -29,6 +39,14 @@ def prepare_states (lsi, ncharge=1, nspin=0, sa_heff=True, deactivate_vrv=False,
     # between definition of e_states array for neutral and charge-separated rootspaces
     log = logger.new_logger (lsi, lsi.verbose)
     las = lsi._las.get_single_state_las (state=0)
+    # 0. If the cached CI vectors of the fragment excitations (from a previous geometry, previous
+    # orbitals, or a chkfile) are in another orbital basis, they are projected when looked up
+    u_f = get_ci_cache_projector (lsi)
+    if u_f is not None:
+        log.info ("LASSIS: projecting cached fragment CI vectors onto the current orbitals")
+        lsi._ci_cache_old = ({'ci_spin_flips': lsi.ci_spin_flips,
+                              'ci_charge_hops': lsi.ci_charge_hops}, u_f)
+        lsi.ci_spin_flips, lsi.ci_charge_hops = {}, {}
     # 1. Spin shuffle step
     if np.all (get_space_info (las)[2]==1):
         # If all singlets, skip the spin shuffle and the unnecessary warning below
@@ -67,15 +85,60 @@ def prepare_states (lsi, ncharge=1, nspin=0, sa_heff=True, deactivate_vrv=False,
     else:
         las3 = las2
     las3.lasci (_dry_run=True)
+    lsi._ci_cache_old = None
+    lsi._ci_cache_basis = (lsi.mol, lsi.mo_coeff)
     return converged, las3
 
+def get_ci_cache_projector (lsi):
+    '''Get the overlap matrices between the active orbitals of each fragment in the basis in which
+    the cached CI vectors ci_spin_flips and ci_charge_hops of lsi are expressed and the current
+    ones, or None if they are the same (or if there is nothing cached).'''
+    basis = getattr (lsi, '_ci_cache_basis', None)
+    if basis is None or not (len (lsi.ci_spin_flips) or len (lsi.ci_charge_hops)): return None
+    mol0, mo0 = basis
+    mol1, mo1 = lsi.mol, lsi.mo_coeff
+    if mol0 is mol1 and (mo0 is mo1 or np.array_equal (mo0, mo1)): return None
+    s01 = gto.intor_cross ('int1e_ovlp', mol0, mol1)
+    u_f = []
+    i = lsi.ncore
+    for norb in lsi.ncas_sub:
+        j = i + norb
+        u_f.append (mo0[:,i:j].conj ().T @ s01 @ mo1[:,i:j])
+        i = j
+    return u_f
+
+def project_ci_guess (ci, u, nelec):
+    '''Transform one or several CI vectors of a fragment into a new orbital basis, given the
+    overlap matrix u between the old and new orbitals, and Lowdin-orthonormalize them.'''
+    from pyscf.fci.addons import transform_ci
+    ci = np.asarray (ci)
+    ci1 = np.stack ([transform_ci (c, nelec, u) for c in ci.reshape (-1, *ci.shape[-2:])], axis=0)
+    nroots = ci1.shape[0]
+    ci1 = vec_lowdin (ci1.reshape (nroots, -1).T).T
+    return ci1.reshape (ci.shape)
+
+def _get_ci_guess (lsi, name, key, frags, nelec):
+    '''Look up the cached CI vectors stored under key in lsi.<name>. If they are only found in
+    the cache of the previous orbital basis, project them. frags and nelec identify the fragment
+    and electron numbers of the CI vectors; if frags is an int, the value is a single fragment's
+    CI vectors, otherwise a list of them.'''
+    ci0 = getattr (lsi, name).get (key, None)
+    old = getattr (lsi, '_ci_cache_old', None)
+    if ci0 is not None or old is None: return ci0
+    cache, u_f = old
+    ci0 = cache[name].get (key, None)
+    if ci0 is None: return None
+    if isinstance (frags, (int, np.integer)):
+        return project_ci_guess (ci0, u_f[frags], nelec)
+    return [project_ci_guess (c, u_f[k], ne) for c, k, ne in zip (ci0, frags, nelec)]
+
 def single_excitations_ci (lsi, las2, las1, ncharge=1, sa_heff=True, deactivate_vrv=False,
                            spin_flips=None, crash_locmin=False):
     log = logger.new_logger (lsi, lsi.verbose)
     mol = lsi.mol
     nfrags = lsi.nfrags
     e_roots = np.append (las1.e_states, np.zeros (las2.nroots-las1.nroots))
-    ci = [[ci_ij for ci_ij in ci_i] for ci_i in las2.ci]
+    ci = [LazyCIList (ci_i) for ci_i in las2.ci]
     spaces = [SingleLASRootspace (las2, m, s, c, las2.weights[ix], ci=[c[ix] for c in ci])
               for ix, (c, m, s, w) in enumerate (zip (*get_space_info (las2)))]
     ncsf = las2.get_ugg ().ncsf_sub
@@ -92,26 +155,41 @@ def single_excitations_ci (lsi, las2, las1, ncharge=1, sa_heff=True, deactivate_
     h0, h1, h2 = lsi.ham_2q ()
     t0 = (logger.process_clock (), logger.perf_counter ())
     converged = True
+    spin_shuffle_ref = all ([spaces[j].is_spin_shuffle_of (spaces[0])
+                             for j in range (1,las1.nroots)])
     log.info ("LASSIS electron hop spaces: %d-%d", las1.nroots, las2.nroots-1)
+    # 0. The rootspace connectivity, lroots, and solvers of the previous call are reused if
+    # nothing but the CI vectors and the Hamiltonian has changed (i.e., in a scanner)
+    key = _get_hop_plan_key (las1, las2, ncharge, sa_heff, spin_flips)
+    plan = getattr (lsi, '_hop_plan', None)
+    if plan is not None and plan['key'] == key:
+        log.info ("LASSIS: reusing the electron hop spaces and solvers of the previous calculation")
+    else:
+        plan = {'key': key}
+    # 1. Set up the independent ExcitationPSFCISolver problems
+    ssref = {}
+    tasks, costs, task_idx = [], [], []
     for i in range (las1.nroots, las2.nroots):
+        step = plan.get (i, None)
         # spin shuffle escape
-        i_ssref = None
-        for i0 in range (las1.nroots, i):
-            if spaces[i].is_spin_shuffle_of (spaces[i0]):
-                i_ssref = i0
-                break
-        if i_ssref is not None:
-            spaces[i].ci = spaces[i].get_spin_shuffle_civecs (spaces[i_ssref])
+        if step is None:
+            i_ssref = None
+            for i0 in range (las1.nroots, i):
+                if spaces[i].is_spin_shuffle_of (spaces[i0]):
+                    i_ssref = i0
+                    break
+            step = plan[i] = {'ssref': i_ssref}
+        if step['ssref'] is not None:
+            ssref[i] = step['ssref']
             log.info ("Electron hop space %d:", i)
             spaces[i].table_printlog ()
-            log.info ("is a spin shuffle of space %d", i_ssref)
-            for k in range (nfrags):
-                ci[k][i] = spaces[i].ci[k]
-            t0 = log.timer ("Space {} excitations".format (i), *t0)
+            log.info ("is a spin shuffle of space %d", ssref[i])
             continue
         # end spin shuffle escape
-        psref_ix = [j for j, space in enumerate (spaces[:las1.nroots])
-                    if spaces[i].is_single_excitation_of (space)]
+        if 'psref_ix' not in step:
+            step['psref_ix'] = [j for j, space in enumerate (spaces[:las1.nroots])
+                                if spaces[i].is_single_excitation_of (space)]
+        psref_ix = step['psref_ix']
         psref = [spaces[j] for j in psref_ix]
         excfrags = np.zeros (nfrags, dtype=bool)
         for space in psref: excfrags[spaces[i].excited_fragments (space)] = True
@@ -119,9 +197,13 @@ def single_excitations_ci (lsi, las2, las1, ncharge=1, sa_heff=True, deactivate_
         psref = _spin_flip_products (psref, spin_flips, nroots_ref=len(psref),
                                                frozen_frags=(~excfrags))
         psref = [space for space in psref if spaces[i].is_single_excitation_of (space)]
-        if auto_singles:
-            lr = spaces[i].compute_single_excitation_lroots (psref)
-            lroots[:,i] = np.minimum (lroots[:,i], lr)
+        if 'lroots' in step:
+            lroots[:,i] = step['lroots']
+        else:
+            if auto_singles:
+                lr = spaces[i].compute_single_excitation_lroots (psref)
+                lroots[:,i] = np.minimum (lroots[:,i], lr)
+            step['lroots'] = lroots[:,i].copy ()
         # logging after setup
         log.info ("Electron hop space %d:", i)
         spaces[i].table_printlog (lroots=lroots[:,i])
@@ -137,41 +219,79 @@ def single_excitations_ci (lsi, las2, las1, ncharge=1, sa_heff=True, deactivate_
         ciref = [[] for j in range (nfrags)]
         for k in range (nfrags):
             for space in psref: ciref[k].append (space.ci[k])
-        psref = [space.get_product_state_solver () for space in psref]
-        psexc = ExcitationPSFCISolver (psref, ciref, las2.ncas_sub, las2.nelecas_sub,
-                                       stdout=mol.stdout, verbose=mol.verbose,
-                                       crash_locmin=crash_locmin, opt=lsi.opt)
-        psexc._deactivate_vrv = deactivate_vrv
         neleca = spaces[i].neleca
         nelecb = spaces[i].nelecb
         smults = spaces[i].smults
-        for k in np.where (excfrags)[0]:
-            weights = np.zeros (lroots[k,i])
-            if sa_heff: weights[:] = 1.0 / len (weights)
-            else: weights[0] = 1.0
-            psexc.set_excited_fragment_(k, (neleca[k],nelecb[k]), smults[k], weights=weights)
-        ci0 = lsi.ci_charge_hops.get (hash (spaces[i]), None)
-        conv, e_roots[i], ci1 = psexc.kernel (h1, h2, ecore=h0, ci0=ci0,
-                                              max_cycle_macro=lsi.max_cycle_macro,
-                                              conv_tol_self=lsi.conv_tol_self)
-        lsi.ci_charge_hops[hash (spaces[i])] = [ci1[ifrag] for ifrag in psexc.excited_frags]
-        spin_shuffle_ref = all ([spaces[j].is_spin_shuffle_of (spaces[0])
-                                 for j in range (1,las1.nroots)])
-        for k in np.where (~excfrags)[0]:
-            # ci vector shape issues
-            if len (psref)==1:
-                ci1[k] = np.asarray (ci1[k])
-            elif spin_shuffle_ref:
-                # NOTE: This logic fails if the user does spin_shuffle -> lasci -> LASSIS
-                ci1[k] = np.asarray (ci1[k][0])
-        spaces[i].ci = ci1
-        if not conv: log.warn ("CI vectors for charge-separated rootspace %d not converged", i)
-        converged = converged and conv
+        psexc = step.get ('psexc', None)
+        if psexc is None:
+            psexc = ExcitationPSFCISolver ([space.get_product_state_solver () for space in psref],
+                                           ciref, las2.ncas_sub, las2.nelecas_sub,
+                                           stdout=mol.stdout, verbose=mol.verbose)
+            for k in np.where (excfrags)[0]:
+                weights = np.zeros (lroots[k,i])
+                if sa_heff: weights[:] = 1.0 / len (weights)
+                else: weights[0] = 1.0
+                psexc.set_excited_fragment_(k, (neleca[k],nelecb[k]), smults[k], weights=weights)
+            step['psexc'] = psexc
+        else:
+            psexc.set_ci_ref_(ciref)
+        psexc.crash_locmin = crash_locmin
+        psexc.opt = lsi.opt
+        psexc._deactivate_vrv = deactivate_vrv
+        ci0 = _get_ci_guess (lsi, 'ci_charge_hops', hash (spaces[i]), psexc.excited_frags,
+                             [(neleca[k], nelecb[k]) for k in psexc.excited_frags])
+        def task (stdout, i=i, psexc=psexc, ci0=ci0, nref=len (psref), excfrags=excfrags):
+            t1 = (logger.process_clock (), logger.perf_counter ())
+            with _psexc_stdout (psexc, stdout):
+                conv, e, ci1 = psexc.kernel (h1, h2, ecore=h0, ci0=ci0,
+                                             max_cycle_macro=lsi.max_cycle_macro,
+                                             conv_tol_self=lsi.conv_tol_self)
+            for k in np.where (~excfrags)[0]:
+                # ci vector shape issues
+                if nref==1:
+                    ci1[k] = np.asarray (ci1[k])
+                elif spin_shuffle_ref:
+                    # NOTE: This logic fails if the user does spin_shuffle -> lasci -> LASSIS
+                    ci1[k] = np.asarray (ci1[k][0])
+            logger.Logger (stdout, log.verbose).timer ("Space {} excitations".format (i), *t1)
+            return conv, e, ci1, [ci1[ifrag] for ifrag in psexc.excited_frags]
+        tasks.append (task)
+        # Balance the workers by the size of the CI problems
+        costs.append (sum ([count_all_csfs (las2.ncas_sub[k], neleca[k], nelecb[k], smults[k])
+                            * lroots[k,i] for k in np.where (excfrags)[0]]))
+        task_idx.append (i)
+    # 2. Solve them, possibly concurrently
+    results = dict (zip (task_idx, _run_tasks (tasks, costs=costs,
+                                               max_workers=getattr (lsi, 'max_workers', 1),
+                                               stdout=log.stdout)))
+    # 3. Merge the results in order
+    for i in range (las1.nroots, las2.nroots):
+        if i in ssref:
+            spaces[i].ci = spaces[i].get_spin_shuffle_civecs (spaces[ssref[i]], lazy=True)
+        else:
+            conv, e_roots[i], spaces[i].ci, ci_hop = results[i]
+            lsi.ci_charge_hops[hash (spaces[i])] = ci_hop
+            if not conv: log.warn ("CI vectors for charge-separated rootspace %d not converged", i)
+            converged = converged and conv
         for k in range (nfrags):
-            ci[k][i] = ci1[k]
-        t0 = log.timer ("Space {} excitations".format (i), *t0)
+            ci[k][i] = spaces[i].ci[k]
+    lsi._hop_plan = plan
+    log.timer ("LASSIS electron hop spaces", *t0)
     return converged, ci, e_roots
 
+def _get_hop_plan_key (las1, las2, ncharge, sa_heff, spin_flips):
+    '''Everything that determines the setup of the electron hop problems of
+    single_excitations_ci apart from the values of the CI vectors'''
+    tab = np.stack (get_space_info (las2)[:3], axis=-1)
+    shape = lambda c: None if c is None else np.asarray (c).shape
+    ci1_shapes = tuple ([shape (c) for ci_i in las1.ci for c in ci_i])
+    sf = None
+    if spin_flips is not None:
+        sf = tuple ([(tuple (f.spins), tuple (f.smults), tuple ([shape (c) for c in f.ci]))
+                     for f in spin_flips])
+    return (tab.shape, tab.tobytes (), las1.nroots, ci1_shapes, repr (np.asarray (ncharge).tolist ()),
+            bool (sa_heff), sf)
+
 class SpinFlips (object):
     '''For a single fragment, bundle the ci vectors of various spin-flipped states with their
        corresponding quantum numbers. Instances of this object are stored together in a list
@@ -181,6 +301,23 @@ class SpinFlips (object):
         self.spins = spins
         self.smults = smults
 
+@contextlib.contextmanager
+def _psexc_stdout (psexc, stdout):
+    '''Temporarily direct the log output of an ExcitationPSFCISolver and of its excited-fragment
+    solvers to stdout'''
+    solvers = [psexc,] + list (psexc.fcisolvers)
+    stdout0 = [solver.stdout for solver in solvers]
+    log0 = psexc.log
+    for solver in solvers: solver.stdout = stdout
+    psexc.log = logger.new_logger (psexc, psexc.verbose)
+    try:
+        yield psexc
+    finally:
+        # The kernel may have replaced (i.e., wrapped) the excited-fragment solvers
+        for solver in psexc.fcisolvers: solver.stdout = stdout0[0]
+        for solver, s0 in zip (solvers, stdout0): solver.stdout = s0
+        psexc.log = log0
+
 def all_spin_flips (lsi, las, nspin=1):
     # NOTE: this actually only uses the -first- rootspace in las, so it can be done before
     # the initial spin shuffle
@@ -196,69 +333,62 @@ def all_spin_flips (lsi, las, nspin=1):
     spins0 = spaces[0].spins
     smults0 = spaces[0].smults
     nfrags = spaces[0].nfrag
-    smults1 = []
-    spins1 = []
-    ci1 = []
     h0, h1, h2 = lsi.ham_2q ()
     casdm1s = las.make_casdm1s ()
     f1 = h1 + np.tensordot (h2, casdm1s.sum (0), axes=2)
     f1 = f1[None,:,:] - np.tensordot (casdm1s, h2, axes=((1,2),(2,1)))
-    i = 0
     auto_singles = isinstance (nspin, str) and 's' in nspin.lower ()
     nup0 = np.minimum (spaces[0].nelecd, spaces[0].nholeu)
     ndn0 = np.minimum (spaces[0].nelecu, spaces[0].nholed)
     if not auto_singles: # integer supplied by caller
         nup0[:] = nspin
         ndn0[:] = nspin
+    def cisolve (stdout, norb, nelec, sm, h1_i, h2_i, nroots, ci0):
+        neleca = (nelec + (sm-1)) // 2
+        nelecb = (nelec - (sm-1)) // 2
+        solver = csf_solver (las.mol, smult=sm).set (nelec=(neleca,nelecb), norb=norb)
+        solver.stdout = stdout
+        solver.check_transformer_cache ()
+        nroots = min (nroots, solver.transformer.ncsf)
+        ci_list = solver.kernel (h1_i, h2_i, norb, (neleca,nelecb), ci0=ci0, nroots=nroots)[1]
+        if nroots==1: ci_list = [ci_list,]
+        return make_spin_multiplet (np.array (ci_list), norb, (neleca,nelecb), sm)
+    # Phase 1: fragment effective Hamiltonians and one solver task per spin flip
+    tasks = []
+    costs = []
+    keys = []
+    i = 0
     for ifrag, (norb, nelec, spin, smult) in enumerate (zip (norb0, nelec0, spins0, smults0)):
         j = i + norb
         h2_i = h2[i:j,i:j,i:j,i:j]
         lasdm1s = casdm1s[:,i:j,i:j]
         h1_i = (f1[:,i:j,i:j] - np.tensordot (h2_i, lasdm1s.sum (0))[None,:,:]
                 + np.tensordot (lasdm1s, h2_i, axes=((1,2),(2,1))))
-        def cisolve (sm, nroots, ci0):
-            neleca = (nelec + (sm-1)) // 2
-            nelecb = (nelec - (sm-1)) // 2
-            solver = csf_solver (las.mol, smult=sm).set (nelec=(neleca,nelecb), norb=norb)
-            solver.check_transformer_cache ()
-            nroots = min (nroots, solver.transformer.ncsf)
-            ci_list = solver.kernel (h1_i, h2_i, norb, (neleca,nelecb), ci0=ci0, nroots=nroots)[1]
-            if nroots==1: ci_list = [ci_list,]
-            ci_arrlist = [np.array (ci_list),]
-            if sm>1:
-                for ms in range (sm-1):
-                    ci_list = [contract_sdown (ci, norb, (neleca,nelecb)) for ci in ci_list]
-                    neleca -= 1
-                    nelecb += 1
-                    ci_arrlist.append (np.array (ci_list))
-            return ci_arrlist
-        smults1_i = []
-        spins1_i = []
-        ci1_i = []
-        if smult > 2: # spin-lowered
-            log.info ("LASSIS fragment %d spin down (%de,%do;2S+1=%d)",
-                      ifrag, nelec, norb, smult-2)
-            smults1_i.extend ([smult-2,]*(smult-2))
-            spins1_i.extend (list (range (smult-3, -(smult-3)-1, -2)))
-            ci0 = lsi.ci_spin_flips.get ((ifrag,'d'), None)
-            ci1_i_down = cisolve (smult-2, ndn0[ifrag], ci0)
-            lsi.ci_spin_flips[(ifrag,'d')] = ci1_i_down[0]
-            ci1_i.extend (ci1_i_down)
+        i = j
         min_npair = max (0, nelec-norb)
         max_smult = (nelec - 2*min_npair) + 1
-        if smult < max_smult: # spin-raised
-            log.info ("LASSIS fragment %d spin up (%de,%do;2S+1=%d)",
-                      ifrag, nelec, norb, smult+2)
-            smults1_i.extend ([smult+2,]*(smult+2))
-            spins1_i.extend (list (range (smult+1, -(smult+1)-1, -2)))
-            ci0 = lsi.ci_spin_flips.get ((ifrag,'u'), None)
-            ci1_i_up = cisolve (smult+2, nup0[ifrag], ci0)
-            lsi.ci_spin_flips[(ifrag,'u')] = ci1_i_up[0]
-            ci1_i.extend (ci1_i_up)
-        smults1.append (smults1_i)
-        spins1.append (spins1_i)
-        ci1.append (ci1_i)
-        i = j
+        for lbl, sm, nroots in (('d', smult-2, ndn0[ifrag]), ('u', smult+2, nup0[ifrag])):
+            if sm < 1 or sm > max_smult: continue
+            log.info ("LASSIS fragment %d spin %s (%de,%do;2S+1=%d)", ifrag,
+                      {'d': 'down', 'u': 'up'}[lbl], nelec, norb, sm)
+            nelec1 = ((nelec+sm-1)//2, (nelec-sm+1)//2)
+            ci0 = _get_ci_guess (lsi, 'ci_spin_flips', (ifrag,lbl), ifrag, nelec1)
+            tasks.append (lambda stdout, args=(norb, nelec, sm, h1_i, h2_i, nroots, ci0):
+                          cisolve (stdout, *args))
+            costs.append (count_all_csfs (norb, *nelec1, sm) * nroots)
+            keys.append ((ifrag, lbl, sm))
+    # Phase 2: solve
+    results = _run_tasks (tasks, costs=costs, max_workers=getattr (lsi, 'max_workers', 1),
+                          stdout=log.stdout)
+    # Phase 3: collect, spin-lowered before spin-raised within each fragment
+    smults1 = [[] for ifrag in range (nfrags)]
+    spins1 = [[] for ifrag in range (nfrags)]
+    ci1 = [[] for ifrag in range (nfrags)]
+    for (ifrag, lbl, sm), ci1_i in zip (keys, results):
+        lsi.ci_spin_flips[(ifrag,lbl)] = ci1_i[0]
+        smults1[ifrag].extend ([sm,]*sm)
+        spins1[ifrag].extend (list (range (sm-1, -sm, -2)))
+        ci1[ifrag].extend (ci1_i)
     spin_flips = [SpinFlips (c,m,s) for c, m, s in zip (ci1, spins1, smults1)]
     return spin_flips
 
@@ -267,7 +397,6 @@ def _spin_flip_products (spaces, spin_flips, nroots_ref=1, frozen_frags=None):
     # the initial spin shuffle
     '''Combine spin-flip excitations in all symmetrically permissible ways'''
     if spin_flips is None or len (spin_flips)==0: return spaces
-    spaces_ref = spaces[:nroots_ref]
     spins3 = [she.spins for she in spin_flips]
     smults3 = [she.smults for she in spin_flips]
     ci3 = [she.ci for she in spin_flips]
@@ -290,15 +419,15 @@ def _spin_flip_products (spaces, spin_flips, nroots_ref=1, frozen_frags=None):
                 new_spaces.append (space.single_fragment_spin_change (
                     ifrag, s3i, m3i, ci=c3i))
         spaces += new_spaces
+    tab = rootspaces_to_table (spaces)
     # Filter by ms orthogonality
-    spaces = [space for space in spaces if space.spins.sum () == spin]
+    idx = (tab.spins.sum (1) == spin)
     # Filter by smult orthogonality
-    spaces = [space for space in spaces 
-              if (not (all (space.is_orthogonal_by_smult (spaces_ref))))]
-    seen = set ()
+    idx &= ~np.all (tab.is_orthogonal_by_smult (tab[:nroots_ref]), axis=1)
     # Filter duplicates!
-    spaces = [space for space in spaces if not ((space in seen) or seen.add (space))]
-    return spaces
+    idx = np.where (idx)[0]
+    idx = idx[tab[idx].unique_index ()]
+    return [spaces[i] for i in idx]
 
 def spin_flip_products (las2, spin_flips, nroots_ref=1):
     '''Inject spin-flips into las2 in all possible ways'''
@@ -357,6 +486,10 @@ class LASSIS_Scanner(lib.SinglePointScanner):
         self.__dict__.update(lsi.__dict__)
         self._las = lsi._las.as_scanner()
         self._scan_state = state
+        # Warm start: the cached fragment CI vectors are projected onto each new geometry's
+        # orbitals, and the electron hop solvers are reused if the rootspaces don't change
+        self.ci_spin_flips = dict (lsi.ci_spin_flips)
+        self.ci_charge_hops = dict (lsi.ci_charge_hops)
 
     def __call__(self, mol_or_geom, **kwargs):
         if isinstance(mol_or_geom, gto.MoleBase):
@@ -391,8 +524,13 @@ class LASSIS (LASSI):
         LASSI.__init__(self, las, opt=opt, **kwargs)
         self.max_cycle_macro = 50
         self.conv_tol_self = 1e-6
+        self.max_workers = MAX_WORKERS
+        self.dump_chk_excitations = DUMP_CHK_EXCITATIONS
         self.ci_spin_flips = {}
         self.ci_charge_hops = {}
+        self._ci_cache_basis = None
+        self._ci_cache_old = None
+        self._hop_plan = None
         if las.nroots>1:
             logger.warn (self, ("Only the first LASSCF state is used by LASSIS! "
                                 "Other states are discarded!"))
@@ -414,7 +552,10 @@ class LASSIS (LASSI):
         self.weights = las.weights
         self.e_lexc = las.e_lexc
         self.e_states = las.e_states
+        if self.dump_chk_excitations: self.dump_excitations ()
         return LASSI.kernel (self, **kwargs)
 
     as_scanner = as_scanner
+    dump_excitations = lassi_chkfile.dump_excitations
+    load_excitations = load_excitations_ = lassi_chkfile.load_excitations_
 
@@ -11,6 +11,11 @@ from itertools import combinations
 from mrh.my_pyscf.mcscf import soc_int as soc_int
 from mrh.my_pyscf.lassi import dms as lassi_dms
 from mrh.my_pyscf.fci.csf import unpack_h1e_cs
+from mrh.my_pyscf.lassi.citools import _run_tasks
+from pyscf import __config__
+
+MAX_WORKERS = getattr (__config__, 'lassi_op_o0_max_workers', 1)
+BATCH_MAX_MEMORY = getattr (__config__, 'lassi_op_o0_batch_max_memory', 500)
 
 def memcheck (las, ci, soc=None):
     '''Check if the system has enough memory to run these functions! ONLY checks
@@ -194,7 +199,7 @@ def _ci_outer_product (ci_f, norb_f, nelec_f):
         )
     norm_dp = linalg.norm (ci_dp.reshape (ci_dp.shape[0],-1), axis=1)
     ci_dp /= norm_dp[:,None,None]
-    def gen_ci_dp (buf=None):
+    def gen_ci_dp (buf=None, iprods=None):
         if buf is None:
             ci = np.empty ((ndet_a,ndet_b), dtype=ci_f[-1].dtype)
         else:
@@ -208,9 +213,10 @@ def _ci_outer_product (ci_f, norb_f, nelec_f):
         #    )
         #norm_dp = linalg.norm (ci_dp.reshape (ci_dp.shape[0],-1), axis=1)
         #ci_dp /= norm_dp[:,None,None]
-        for vec in ci_dp:
+        if iprods is None: iprods = range (nprods)
+        for iprod in iprods:
             ci[:,:] = 0.0
-            ci[idx] = vec[:,:]
+            ci[idx] = ci_dp[iprod][:,:]
             yield ci
     def dotter (c1, nelec1, skip=None):
         if nelec1 != nelec: return np.zeros (nprods)
@@ -255,7 +261,8 @@ def ci_outer_product_generator (ci_fr, norb_f, nelec_fr):
 
     Returns:
         ci_r_gen : callable that returns a generator of length (nprods)
-            Generates all direct-product CAS CI vectors
+            Generates all direct-product CAS CI vectors. If called with the kwarg ikets (a sorted
+            sequence of integers), generates only the product states with these indices
         nelec_p : list of length (nprods) of tuple of length 2
             (neleca, nelecb) for each product state
         dotter : callable
@@ -302,13 +309,21 @@ def ci_outer_product_generator (ci_fr, norb_f, nelec_fr):
         nelec_p.extend ([nelec,]*nprods)
         space_p.extend ([space,]*nprods)
         dotter_r.append ([dotter, nelec, nprods])
-    def ci_r_gen (buf=None):
+    offs_p = np.cumsum ([nprods for dot, nelec, nprods in dotter_r])
+    def ci_r_gen (buf=None, ikets=None):
         if buf is None:
             buf1 = np.empty (ndet, dtype=ci_fr[-1][0].dtype)
         else:
             buf1 = np.asarray (buf.flat[:ndet])
-        for gen_ci in gen_ci_r:
-            for x in gen_ci (buf=buf1):
+        if ikets is not None:
+            ikets = np.asarray (ikets, dtype=int)
+            spaces = np.searchsorted (offs_p, ikets, side='right')
+        for space, gen_ci in enumerate (gen_ci_r):
+            iprods = None
+            if ikets is not None:
+                iprods = ikets[spaces==space] - offs_p[space] + dotter_r[space][2]
+                if not len (iprods): continue
+            for x in gen_ci (buf=buf1, iprods=iprods):
                 yield x
     def dotter (ket, nelec_ket, spinless2ss=None, iket=None, oporder=None, skip=None):
         vec = []
@@ -358,6 +373,47 @@ def ci_outer_product (ci_fr, norb_f, nelec_fr):
     ci_r = [x.copy () for x in ci_r_gen ()]
     return ci_r, nelec_r
 
+def ci_outer_product_batches (ci_r_gen, nelec_r, max_memory=BATCH_MAX_MEMORY, nbuf=4,
+                              ikets=None):
+    '''Copy the outer-product CI vectors of a ci_r_gen generator (see
+    "ci_outer_product_generator") into batches, each of which fits into a bounded buffer
+
+    Args:
+        ci_r_gen : callable that returns a generator
+            Generates direct-product CAS CI vectors
+        nelec_r : list of tuple of length 2
+            (neleca, nelecb) for each product state
+
+    Kwargs:
+        max_memory : float
+            Memory in MB available to each batch
+        nbuf : integer
+            Number of vectors of storage needed per product state in a batch, including the
+            product state itself
+        ikets : sequence of integers
+            If provided, only the product states with these indices are put into batches, in
+            ascending order. The others are not constructed.
+
+    Returns:
+        generator of lists of tuples (i, nelec, ci)
+            Index, (neleca, nelecb), and CAS CI vector of each product state in a batch
+    '''
+    batch = []
+    batch_size = None
+    if ikets is None:
+        kets = enumerate (ci_r_gen ())
+    else:
+        ikets = sorted (set (ikets))
+        kets = zip (ikets, ci_r_gen (ikets=ikets))
+    for i, ket in kets:
+        if batch_size is None:
+            batch_size = max (1, int (max_memory*1e6 / (nbuf*ket.nbytes)))
+        batch.append ((i, nelec_r[i], ket.copy ()))
+        if len (batch) == batch_size:
+            yield batch
+            batch = []
+    if len (batch): yield batch
+
 #def si_soc (las, h1, ci, nelec, norb):
 #
 #### function adapted from github.com/hczhai/fci-siso/blob/master/fcisiso.py ###
@@ -400,9 +456,16 @@ def ci_outer_product (ci_fr, norb_f, nelec_fr):
 #
 #    return hsiso
 
-def ham (las, h1, h2, ci_fr, nelec_frs, soc=0, orbsym=None, wfnsym=None):
+def ham (las, h1, h2, ci_fr, nelec_frs, soc=0, orbsym=None, wfnsym=None, max_workers=None,
+         max_memory=None, ikets=None):
     '''Build LAS state interaction Hamiltonian, S2, and ovlp matrices
 
+    The product states are expanded into CAS CI vectors in batches that fit into max_memory.
+    Within a batch, H and S2 are applied to one vector at a time by separate single-vector
+    contract_2e calls, distributed among max_workers threads; this is not a block (multi-vector)
+    contraction, so it is only faster than the unbatched loop if the caller opts in to
+    max_workers > 1.
+
     Args:
         las : instance of class LASSCF
         h1 : ndarray of shape (ncas, ncas)
@@ -423,6 +486,15 @@ def ham (las, h1, h2, ci_fr, nelec_frs, soc=0, orbsym=None, wfnsym=None):
             Irrep ID for each orbital
         wfnsym : int
             Irrep ID for target matrix block
+        max_workers : integer
+            Number of threads among which the product states of each batch are divided. Defaults
+            to MAX_WORKERS (1)
+        max_memory : float
+            Memory in MB available to each batch of product states. Defaults to the smaller of
+            BATCH_MAX_MEMORY and the memory remaining to las
+        ikets : sequence of integers
+            If provided, only these rows of the matrices are computed and returned, in the
+            given order; i.e., the returned matrices have shape (len (ikets), ndim)
 
     Returns:
         ham_eff : square ndarray of length (ndim)
@@ -467,13 +539,19 @@ def ham (las, h1, h2, ci_fr, nelec_frs, soc=0, orbsym=None, wfnsym=None):
         spinless2ss = None
         ss2spinless = lambda *args: args[0]
 
+    if max_workers is None: max_workers = MAX_WORKERS
+    if max_memory is None:
+        max_memory = getattr (las, 'max_memory', BATCH_MAX_MEMORY) - lib.current_memory ()[0]
+        max_memory = min (BATCH_MAX_MEMORY, max_memory)
+
     solver = fci.solver (mol, symm=(wfnsym is not None)).set (orbsym=orbsym, wfnsym=wfnsym)
     h1_re_c, h1_re_s = h1_re, 0
     if h1_re.ndim > 2:
         h1_re_c, h1_re_s = unpack_h1e_cs (h1_re)
+    # The effective 2-electron Hamiltonian only depends on the number of electrons
+    h2eff_nel = {nel: solver.absorb_h1e (h1_re_c, h2_re, norb, nel, 0.5) for nel in set (nelec_r)}
     def contract_h_re (c, nel):
-        h2eff = solver.absorb_h1e (h1_re_c, h2_re, norb, nel, 0.5)
-        return solver.contract_2e (h2eff, c, norb, nel)
+        return solver.contract_2e (h2eff_nel[nel], c, norb, nel)
     if h1_im is not None:
         def contract_h (c, nel):
             hc = contract_h_re (c, nel)
@@ -482,20 +560,34 @@ def ham (las, h1, h2, ci_fr, nelec_frs, soc=0, orbsym=None, wfnsym=None):
     else:
         contract_h = contract_h_re
 
-    ham_eff = np.zeros ((ndim, ndim), dtype=h1.dtype)
-    ovlp_eff = np.zeros ((ndim, ndim))
-    s2_eff = np.zeros ((ndim,ndim))
-    for i, ket in zip(range(ndim), ci_r_generator ()):
-        nelec_ket = nelec_r_ss[i]
-        ovlp_eff[i,:] = dotter (ket, nelec_ket, iket=i, oporder=0)
+    def get_rows (i, nelec_ket, ket):
+        ovlp_row = dotter (ket, nelec_ket, iket=i, oporder=0)
         s2ket = contract_ss (ket, norb_ss, nelec_ket)
-        s2_eff[i,:] = dotter (s2ket, nelec_ket, iket=i, oporder=2)
+        s2_row = dotter (s2ket, nelec_ket, iket=i, oporder=2)
         s2ket, ket = None, ss2spinless (ket, nelec_ket)
         nelec_ket = nelec_r[i]
         hket = contract_h (ket, nelec_ket)
         ket = None
-        ham_eff[i,:] = dotter (hket, nelec_ket, spinless2ss=spinless2ss, iket=i, oporder=2)
-    
+        ham_row = dotter (hket, nelec_ket, spinless2ss=spinless2ss, iket=i, oporder=2)
+        return ham_row, s2_row, ovlp_row
+
+    if ikets is None: ikets = range (ndim)
+    row_idx = {iket: irow for irow, iket in enumerate (ikets)}
+    nrows = len (row_idx)
+    ham_eff = np.zeros ((nrows, ndim), dtype=h1.dtype)
+    ovlp_eff = np.zeros ((nrows, ndim))
+    s2_eff = np.zeros ((nrows,ndim))
+    # A ket, its spinless copy, and the results of two operators acting on it
+    nbuf = 6 if soc else 4
+    for batch in ci_outer_product_batches (ci_r_generator, nelec_r_ss, max_memory=max_memory,
+                                           nbuf=nbuf, ikets=ikets):
+        tasks = [lambda stdout, args=args: get_rows (*args) for args in batch]
+        rows = _run_tasks (tasks, max_workers=max_workers)
+        for (i, _, _), (ham_row, s2_row, ovlp_row) in zip (batch, rows):
+            ham_eff[row_idx[i],:] = ham_row
+            s2_eff[row_idx[i],:] = s2_row
+            ovlp_eff[row_idx[i],:] = ovlp_row
+
     return ham_eff, s2_eff, ovlp_eff
 
 def contract_ham_ci (las, h1, h2, ci_fr_ket, nelec_frs_ket, ci_fr_bra, nelec_frs_bra, 
@@ -589,6 +589,9 @@ class LSTDMint2 (object):
             mask_ket_space : sequence of int or mask array of shape (nroots,)
                 If included, only matrix elements involving the corresponding ket rootspaces are
                 computed.
+            mask_known_space : mask array of shape (nroots,)
+                If included, matrix elements between two of the corresponding rootspaces (or
+                within one of them) are not computed; they are known from elsewhere.
             dtype : instance of np.dtype
                 Currently not used; TODO: generalize to ms-broken fragment-local states?
         '''
@@ -599,7 +602,7 @@ class LSTDMint2 (object):
     # TODO: at some point, if it ever becomes rate-limiting, make this multithread better
 
     def __init__(self, ints, nlas, hopping_index, lroots, mask_bra_space=None, mask_ket_space=None,
-                 dtype=np.float64):
+                 mask_known_space=None, dtype=np.float64):
         self.ints = ints
         self.nlas = nlas
         self.norb = sum (nlas)
@@ -624,7 +627,11 @@ class LSTDMint2 (object):
                              for nelec_sf in self.nelec_rf]
         self.nelec_rf = self.nelec_rf.sum (1)
 
+        if mask_known_space is None: mask_known_space = np.zeros (self.nroots, dtype=bool)
+        self.mask_known_space = np.asarray (mask_known_space, dtype=bool)
         exc = self.make_exc_tables (hopping_index)
+        known = self.mask_known_space
+        exc = {key: tab[~(known[tab[:,0]] & known[tab[:,1]])] for key, tab in exc.items ()}
         self.exc_null = self.mask_exc_table (exc['null'], mask_bra_space, mask_ket_space)
         self.exc_1c = self.mask_exc_table (exc['1c'], mask_bra_space, mask_ket_space)
         self.exc_1s = self.mask_exc_table (exc['1s'], mask_bra_space, mask_ket_space)
@@ -1005,11 +1012,13 @@ class LSTDMint2 (object):
         for row in self.exc_1s: self._loop_lroots_(self._crunch_1s_, *row)
         for row in self.exc_1s1c: self._loop_lroots_(self._crunch_1s1c_, *row)
         for row in self.exc_2c: self._loop_lroots_(self._crunch_2c_, *row)
-        for i0, i1 in self.offs_lroots:
+        for i0, i1 in self.offs_lroots[~self.mask_known_space]:
             for bra, ket in combinations (range (i0, i1), 2):
                 self._crunch_null_(bra, ket)
         self._add_transpose_()
-        for state in range (self.nstates): self._crunch_null_(state, state)
+        for state in range (self.nstates):
+            if self.mask_known_space[self.rootaddr[state]]: continue
+            self._crunch_null_(state, state)
 
     def _add_transpose_(self):
         self.tdm1s += self.tdm1s.conj ().transpose (1,0,2,4,3)
@@ -1045,17 +1054,26 @@ class HamS2ovlpint (LSTDMint2):
             optionally spin-separated
         h2 : ndarray of size ncas**4
             Contains 2-electron Hamiltonian amplitudes in second quantization
+
+    Additional kwargs:
+        mats_known : tuple of length 4
+            (mask_known_space, ham, s2, ovlp): the Hamiltonian, spin-squared, and overlap
+            matrices among the product states of the rootspaces selected by the mask array
+            mask_known_space (in order), which are copied instead of computed
     '''
     # TODO: SO-LASSI o1 implementation: the one-body spin-orbit coupling part of the
     # Hamiltonian in addition to h1 and h2, which are spin-symmetric
 
     def __init__(self, ints, nlas, hopping_index, lroots, h1, h2, mask_bra_space=None,
-                 mask_ket_space=None, dtype=np.float64):
+                 mask_ket_space=None, mats_known=None, dtype=np.float64):
+        mask_known_space = None if mats_known is None else mats_known[0]
         LSTDMint2.__init__(self, ints, nlas, hopping_index, lroots, mask_bra_space=mask_bra_space,
-                           mask_ket_space=mask_ket_space, dtype=dtype)
+                           mask_ket_space=mask_ket_space, mask_known_space=mask_known_space,
+                           dtype=dtype)
         if h1.ndim==2: h1 = np.stack ([h1,h1], axis=0)
         self.h1 = h1
         self.h2 = h2
+        self.mats_known = mats_known
 
     def _get_D1_(self, bra, ket):
         self.d1[:] = 0.0
@@ -1111,7 +1129,12 @@ class HamS2ovlpint (LSTDMint2):
             ovlp[i0:i1,j0:j1] = o
         for bra_sp, ket_sp in self.exc_null: crunch_ovlp (bra_sp, ket_sp)
         ovlp += ovlp.T
-        for iroot in range (self.nroots): crunch_ovlp (iroot, iroot)
+        for iroot in np.where (~self.mask_known_space)[0]: crunch_ovlp (iroot, iroot)
+        if self.mats_known is not None and np.any (self.mask_known_space):
+            idx = np.concatenate ([np.arange (*self.offs_lroots[i])
+                                   for i in np.where (self.mask_known_space)[0]])
+            for mat, mat_known in zip ((self.ham, self.s2, ovlp), self.mats_known[1:]):
+                mat[np.ix_(idx,idx)] = mat_known
         return self.ham, self.s2, ovlp, t0
 
 class LRRDMint (LSTDMint2):
@@ -1387,7 +1410,7 @@ def make_stdm12s (las, ci, nelec_frs, **kwargs):
     tdm2s = tdm2s.reshape (nstates,nstates,2,2,ncas,ncas,ncas,ncas).transpose (0,2,4,5,3,6,7,1)
     return tdm1s, tdm2s
 
-def ham (las, h1, h2, ci, nelec_frs, **kwargs):
+def ham (las, h1, h2, ci, nelec_frs, mats_known=None, **kwargs):
     ''' Build Hamiltonian, spin-squared, and overlap matrices in LAS product state basis
 
     Args:
@@ -1402,6 +1425,13 @@ def ham (las, h1, h2, ci, nelec_frs, **kwargs):
             Number of electrons of each spin in each rootspace in each
             fragment
 
+    Kwargs:
+        mats_known : tuple of length 4
+            (mask_known_space, ham, s2, ovlp): mask array of shape (nroots,) and the matrices
+            among the product states of the rootspaces it selects, in order (i.e., from a previous
+            calculation with the same orbitals and the same CI vectors for those rootspaces). Only
+            the matrix elements involving the other rootspaces are computed.
+
     Returns:
         ham : ndarray of shape (nroots,nroots)
             Hamiltonian in LAS product state basis
@@ -1417,7 +1447,8 @@ def ham (las, h1, h2, ci, nelec_frs, **kwargs):
 
     # Second pass: upper-triangle
     t0 = (lib.logger.process_clock (), lib.logger.perf_counter ())
-    outerprod = HamS2ovlpint (ints, nlas, hopping_index, lroots, h1, h2, dtype=ci[0][0].dtype)
+    outerprod = HamS2ovlpint (ints, nlas, hopping_index, lroots, h1, h2, mats_known=mats_known,
+                              dtype=ci[0][0].dtype)
     lib.logger.timer (las, 'LASSI Hamiltonian second intermediate indexing setup', *t0)        
     ham, s2, ovlp, t0 = outerprod.kernel ()
     lib.logger.timer (las, 'LASSI Hamiltonian second intermediate crunching', *t0)        
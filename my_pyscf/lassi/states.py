@@ -10,7 +10,197 @@ from mrh.my_pyscf.fci.spin_op import contract_sdown, contract_sup
 from mrh.my_pyscf.fci.csfstring import CSFTransformer
 from mrh.my_pyscf.fci.csfstring import ImpossibleSpinError
 from mrh.my_pyscf.mcscf.productstate import ImpureProductStateFCISolver
+from pyscf import __config__
 import itertools
+import collections
+import threading
+import weakref
+
+SZROT_CACHE_MAX_MEMORY = getattr (__config__, 'lassi_states_szrot_cache_max_memory', 1000)
+
+def szrot_civec (ci, norb, nelec, sz1):
+    '''Rotate the local spin axis of the CI vector(s) ci of a fragment with norb orbitals and
+    nelec = (neleca, nelecb) electrons from 2M_S = neleca-nelecb to 2M_S = sz1 by repeated
+    application of the spin ladder operators. If ci is a single vector, or a list or 3d array of
+    length 1, the result is a 2d array; otherwise it is a 3d array.'''
+    neleca, nelecb = nelec
+    sz = neleca - nelecb
+    if sz1 == sz: return ci
+    ndeta = cistring.num_strings (norb, neleca)
+    ndetb = cistring.num_strings (norb, nelecb)
+    ci1 = np.asarray (ci).reshape (-1, ndeta, ndetb)
+    nvecs = ci1.shape[0]
+    while sz > sz1:
+        ci1 = contract_sdown (ci1, norb, (neleca, nelecb))
+        neleca, nelecb, sz = neleca-1, nelecb+1, sz-2
+    while sz < sz1:
+        ci1 = contract_sup (ci1, norb, (neleca, nelecb))
+        neleca, nelecb, sz = neleca+1, nelecb-1, sz+2
+    if nvecs==1: ci1 = ci1[0]
+    return ci1
+
+class SzRotatedCI (object):
+    '''Placeholder for the CI vectors of a fragment in a spin-shuffled rootspace, which are those
+    of another rootspace with the local spin axis rotated (see szrot_civec). The rotation is
+    only carried out when the vectors are needed, and the result is kept subject to the memory
+    budget of szrot_cache. Placeholders are stored in LazyCIList objects, which replace them
+    with copies of the rotated vectors when elements are accessed.
+
+    Args:
+        ci : ndarray or instance of :class:`SzRotatedCI`
+            CI vectors of the reference rootspace. Placeholders are resolved to their own
+            references.
+        norb : integer
+            Number of orbitals in the fragment
+        nelec : tuple of length 2
+            Number of electrons of ci
+        sz1 : integer
+            2M_S of the rotated vectors
+
+    Kwargs:
+        ndim : integer
+            Number of dimensions of the arrays returned by copy: 2 for (ndeta,ndetb) if there
+            is only one vector, or 3 for (nvecs,ndeta,ndetb). Defaults to that of ci.
+    '''
+    def __init__(self, ci, norb, nelec, sz1, ndim=None):
+        if isinstance (ci, SzRotatedCI):
+            if ndim is None: ndim = ci.ndim
+            ci, nelec = ci.ci, ci.nelec
+        if ndim is None: ndim = np.ndim (ci)
+        self.ci = ci
+        self.norb = norb
+        self.nelec = tuple (nelec)
+        self.sz1 = sz1
+        self.ndim = ndim
+        self._ci1 = None
+
+    @property
+    def is_identity (self):
+        return self.nelec[0] - self.nelec[1] == self.sz1
+
+    def rotate (self):
+        return szrot_civec (self.ci, self.norb, self.nelec, self.sz1)
+
+    def get (self):
+        '''The rotated vectors, shared with the reference (if the rotation is the identity) or
+        with szrot_cache. Not to be modified.'''
+        if self.is_identity: return self.ci
+        return szrot_cache (self)
+
+    def copy (self):
+        '''A new, writable array of the rotated vectors with ndim dimensions'''
+        nelec = sum (self.nelec)
+        ndeta = cistring.num_strings (self.norb, (nelec + self.sz1) // 2)
+        ndetb = cistring.num_strings (self.norb, (nelec - self.sz1) // 2)
+        shape = (-1, ndeta, ndetb) if self.ndim > 2 else (ndeta, ndetb)
+        return np.array (self.get ()).reshape (shape)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray (self.get (), dtype=dtype)
+
+def _get_civec (ci):
+    if isinstance (ci, SzRotatedCI): return ci.copy ()
+    return ci
+
+class LazyCIList (list):
+    '''The list of the CI vectors of one fragment in each rootspace (an element of las.ci), some
+    elements of which may be SzRotatedCI placeholders. When an element which is a placeholder is
+    accessed by indexing or iteration, a new copy of the rotated CI vectors is returned, but the
+    placeholder is not overwritten, so that the rotated vectors can be dropped again when
+    szrot_cache is full. Modifying the returned array therefore changes neither the reference
+    vectors nor the list; to change such an element, assign to it.'''
+    def __getitem__(self, idx):
+        item = super().__getitem__(idx)
+        if isinstance (idx, slice): return [_get_civec (c) for c in item]
+        return _get_civec (item)
+
+    def __iter__(self):
+        for c in super().__iter__(): yield _get_civec (c)
+
+    def get_raw (self, idx):
+        '''The element idx, without replacing placeholders'''
+        return super().__getitem__(idx)
+
+    def copy (self):
+        return LazyCIList (super().__iter__())
+
+class SzRotCache (object):
+    ''' Thread-safe least-recently-used memory budget for the rotated CI vectors of SzRotatedCI
+    placeholders. Each placeholder holds its own rotated vectors, which are read-only; the
+    vectors of the least-recently-used placeholders are dropped when the budget is exceeded, and
+    recomputed if they are needed again.
+
+    Attributes:
+        max_memory : float
+            Maximum total size in MB of the rotated vectors kept. Set to 0 to disable caching.
+        hits : int
+            Number of calls served from the cache
+        misses : int
+            Number of calls which had to carry out the rotation
+        evictions : int
+            Number of sets of rotated vectors dropped to respect max_memory
+    '''
+
+    def __init__(self, max_memory=SZROT_CACHE_MAX_MEMORY):
+        self.max_memory = max_memory
+        self._data = collections.OrderedDict ()
+        self._lock = threading.RLock ()
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len (self._data)
+
+    def __call__(self, rot):
+        key = id (rot)
+        with self._lock:
+            ci1 = rot._ci1
+            if ci1 is not None:
+                self._data.move_to_end (key)
+                self.hits += 1
+                return ci1
+            self.misses += 1
+        ci1 = rot.rotate ()
+        ci1.flags.writeable = False
+        nbytes = ci1.nbytes
+        with self._lock:
+            if nbytes <= self.max_memory*1e6 and rot._ci1 is None:
+                rot._ci1 = ci1
+                ref = weakref.ref (rot, lambda r, key=key: self._forget (key))
+                self._data[key] = (ref, nbytes)
+                self.nbytes += nbytes
+                self._evict ()
+        return ci1
+
+    def _forget (self, key):
+        with self._lock:
+            entry = self._data.pop (key, None)
+            if entry is not None: self.nbytes -= entry[1]
+
+    def _evict (self):
+        while self.nbytes > self.max_memory*1e6 and len (self._data):
+            key, (ref, nbytes) = self._data.popitem (last=False)
+            self.nbytes -= nbytes
+            self.evictions += 1
+            rot = ref ()
+            if rot is not None: rot._ci1 = None
+
+    def clear (self):
+        with self._lock:
+            while len (self._data):
+                key, (ref, nbytes) = self._data.popitem ()
+                rot = ref ()
+                if rot is not None: rot._ci1 = None
+            self.nbytes = 0
+
+    def stats (self):
+        ''' Returns a dict of the hit, miss, and eviction counts and the number and total size
+        in MB of the sets of rotated vectors kept '''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len (self._data), 'memory': self.nbytes / 1e6}
+
+szrot_cache = SzRotCache ()
 
 class SingleLASRootspace (object):
     def __init__(self, las, spins, smults, charges, weight, nlas=None, nelelas=None, stdout=None,
@@ -146,16 +336,7 @@ class SingleLASRootspace (object):
         return singles
 
     def gen_spin_shuffles (self):
-        assert ((np.sum (self.smults - 1) - np.sum (self.spins)) % 2 == 0)
-        nflips = (np.sum (self.smults - 1) - np.sum (self.spins)) // 2
-        spins_table = (self.smults-1).copy ()[None,:]
-        subtrahend = 2*np.eye (self.nfrag, dtype=spins_table.dtype)[None,:,:]
-        for i in range (nflips):
-            spins_table = spins_table[:,None,:] - subtrahend
-            spins_table = spins_table.reshape (-1, self.nfrag)
-            # minimum valid value in column i is 1-self.smults[i]
-            idx_valid = np.all (spins_table>-self.smults[None,:], axis=1)
-            spins_table = spins_table[idx_valid,:]
+        spins_table = _spin_shuffle_table (self.smults, self.spins.sum ())
         for spins in spins_table:
             yield SingleLASRootspace (self.las, spins, self.smults, self.charges, 0, nlas=self.nlas,
                                   nelelas=self.nelelas, stdout=self.stdout, verbose=self.verbose)
@@ -185,17 +366,17 @@ class SingleLASRootspace (object):
             nvecs = ci1.shape[0]
             nelec1 = nelec
             for sz1 in range (sz-2, -(1+smult), -2):
-                ci1 = [contract_sdown (c, norb, nelec1) for c in ci1]
+                ci1 = contract_sdown (ci1, norb, nelec1)
                 nelec1 = nelec1[0]-1, nelec1[1]+1
                 if nvecs==1: ci_sz_[sz1] = ci1[0]
-                else: ci_sz_[sz1] = np.asarray (ci1)
+                else: ci_sz_[sz1] = ci1
             ci1 = np.asarray (ci).reshape (nvecs, ndeta, ndetb)
             nelec1 = nelec
             for sz1 in range (sz+2, (1+smult), 2):
-                ci1 = [contract_sup (c, norb, nelec1) for c in ci1]
+                ci1 = contract_sup (ci1, norb, nelec1)
                 nelec1 = nelec1[0]+1, nelec1[1]-1
                 if nvecs==1: ci_sz_[sz1] = ci1[0]
-                else: ci_sz_[sz1] = np.asarray (ci1)
+                else: ci_sz_[sz1] = ci1
             ci_sz.append (ci_sz_)
         return ci_sz
 
@@ -253,10 +434,15 @@ class SingleLASRootspace (object):
         if np.any (self.smults != other.smults): return False
         return self.spins.sum () == other.spins.sum ()
 
-    def get_spin_shuffle_civecs (self, other):
+    def get_spin_shuffle_civecs (self, other, lazy=False):
+        '''The CI vectors of other with the local spin axes rotated to match self. If lazy, the
+        rotated vectors are returned as SzRotatedCI placeholders.'''
         assert (self.is_spin_shuffle_of (other) and other.has_ci ())
-        ci_sz = other.get_ci_szrot ()
-        return [ci_sz[ifrag][self.spins[ifrag]] for ifrag in range (self.nfrag)]
+        ci = [SzRotatedCI (other.ci[ifrag], other.nlas[ifrag],
+                           (other.neleca[ifrag], other.nelecb[ifrag]), self.spins[ifrag])
+              for ifrag in range (self.nfrag)]
+        if lazy: return ci
+        return [c.rotate () for c in ci]
 
     def excited_fragments (self, other):
         dneleca = self.neleca - other.neleca
@@ -343,36 +529,222 @@ class SingleLASRootspace (object):
                                             verbose=self.verbose)
 
 
+def _spin_shuffle_table (smults, spin):
+    '''All arrangements of local 2M_S for local spin multiplicities smults summing to spin, in the
+    order in which they are generated by flipping spins one at a time starting from the local
+    high-spin state'''
+    smults = np.asarray (smults)
+    nfrag = len (smults)
+    assert ((np.sum (smults - 1) - spin) % 2 == 0)
+    nflips = (np.sum (smults - 1) - spin) // 2
+    spins_table = (smults-1).copy ()[None,:]
+    subtrahend = 2*np.eye (nfrag, dtype=spins_table.dtype)[None,:,:]
+    for i in range (nflips):
+        spins_table = spins_table[:,None,:] - subtrahend
+        spins_table = spins_table.reshape (-1, nfrag)
+        # minimum valid value in column i is 1-smults[i]
+        idx_valid = np.all (spins_table>-smults[None,:], axis=1)
+        spins_table = spins_table[idx_valid,:]
+        # later duplicates only have children which duplicate those of the first occurrence
+        spins_table = spins_table[np.sort (np.unique (spins_table, axis=0, return_index=True)[1])]
+    return spins_table
+
+def _get_row_ids (*arrs):
+    '''Integer labels of the rows of several 2d arrays, equal iff the rows are equal'''
+    nrows = [len (arr) for arr in arrs]
+    inv = np.unique (np.concatenate (arrs, axis=0), axis=0, return_inverse=True)[1]
+    return np.split (np.asarray (inv).ravel (), np.cumsum (nrows)[:-1])
+
+class LASRootspaceTable (object):
+    '''Array-backed table of LAS rootspaces, one per row of the (nspaces, nfrag) integer arrays
+    charges, spins, and smults, for enumerating, filtering, and deduplicating large numbers of
+    rootspaces without building SingleLASRootspace objects. Individual rows are built into
+    SingleLASRootspace objects on demand by indexing with an integer.'''
+    def __init__(self, las, charges, spins, smults, weights=None, nlas=None, nelelas=None,
+                 stdout=None, verbose=None):
+        if nlas is None: nlas = las.ncas_sub
+        if nelelas is None: nelelas = [sum (_unpack_nelec (x)) for x in las.nelecas_sub]
+        if stdout is None: stdout = las.stdout
+        if verbose is None: verbose = las.verbose
+        self.las = las
+        self.nlas, self.nelelas = np.asarray (nlas), np.asarray (nelelas)
+        self.nfrag = len (nlas)
+        self.charges = np.asarray (charges, dtype=int).reshape (-1, self.nfrag)
+        self.spins = np.asarray (spins, dtype=int).reshape (-1, self.nfrag)
+        self.smults = np.asarray (smults, dtype=int).reshape (-1, self.nfrag)
+        if weights is None: weights = np.zeros (len (self.charges))
+        self.weights = np.asarray (weights, dtype=float)
+        self.stdout, self.verbose = stdout, verbose
+
+        self.nelec = self.nelelas[None,:] - self.charges
+        self.neleca = (self.nelec + self.spins) // 2
+        self.nelecb = (self.nelec - self.spins) // 2
+        self.nholea = self.nlas[None,:] - self.neleca
+        self.nholeb = self.nlas[None,:] - self.nelecb
+
+    def __len__(self):
+        return len (self.charges)
+
+    def __getitem__(self, idx):
+        if isinstance (idx, (int, np.integer)):
+            return SingleLASRootspace (self.las, self.spins[idx], self.smults[idx],
+                                       self.charges[idx], self.weights[idx], nlas=self.nlas,
+                                       nelelas=self.nelelas, stdout=self.stdout,
+                                       verbose=self.verbose)
+        return self._copy_with (self.charges[idx], self.spins[idx], self.smults[idx],
+                                self.weights[idx])
+
+    def _copy_with (self, charges, spins, smults, weights):
+        return LASRootspaceTable (self.las, charges, spins, smults, weights=weights,
+                                  nlas=self.nlas, nelelas=self.nelelas, stdout=self.stdout,
+                                  verbose=self.verbose)
+
+    @property
+    def rows (self):
+        return np.concatenate ([self.charges, self.spins, self.smults], axis=1)
+
+    def append (self, other):
+        return self._copy_with (np.append (self.charges, other.charges, axis=0),
+                                np.append (self.spins, other.spins, axis=0),
+                                np.append (self.smults, other.smults, axis=0),
+                                np.append (self.weights, other.weights))
+
+    def unique_index (self):
+        '''Indices of the first occurrences of each distinct rootspace, in order'''
+        if len (self) == 0: return np.zeros (0, dtype=int)
+        return np.sort (np.unique (self.rows, axis=0, return_index=True)[1])
+
+    def unique (self):
+        '''Remove duplicate rootspaces, keeping the first occurrence and the order'''
+        return self[self.unique_index ()]
+
+    def isin (self, other):
+        '''Boolean array indicating which of the rootspaces of self are present in other'''
+        if len (self) == 0 or len (other) == 0: return np.zeros (len (self), dtype=bool)
+        ids_self, ids_other = _get_row_ids (self.rows, other.rows)
+        return np.isin (ids_self, ids_other)
+
+    def is_orthogonal_by_smult (self, other):
+        '''Boolean array of shape (len (self), len (other)) indicating which pairs of rootspaces
+        cannot couple to any common total spin'''
+        def get_range (smults):
+            s2 = smults - 1
+            max_s2 = np.sum (s2, axis=1)
+            min_s2 = 2*np.amax (s2, axis=1) - max_s2
+            return min_s2, max_s2
+        min_self, max_self = get_range (self.smults)
+        min_other, max_other = get_range (other.smults)
+        return ((max_self[:,None] < min_other[None,:]) |
+                (max_other[None,:] < min_self[:,None]))
+
+    def get_singles (self):
+        '''Table of all rootspaces characterized by one electron hopping from one fragment to
+        another fragment of one of the rootspaces of self, in the same order as
+        SingleLASRootspace.get_singles applied to each rootspace in turn'''
+        nfrag = self.nfrag
+        i, a = np.nonzero (~np.eye (nfrag, dtype=bool))
+        npair = len (i)
+        nrows = len (self)
+        # Candidates are indexed by (row, alpha/beta, i->a, dsmult_i, dsmult_a)
+        shape = (nrows, 2, npair, 2, 2)
+        dsm = np.array ([-1,1])
+        m = np.array ([0,1])[None,:,None,None,None]
+        dm = 1 - 2*m
+        si = dsm[None,None,None,:,None]
+        sa = dsm[None,None,None,None,:]
+        def take (arr, frag):
+            return arr[:,frag][:,None,:,None,None]
+        has_e = np.stack ([self.neleca[:,i], self.nelecb[:,i]], axis=1) > 0
+        has_h = np.stack ([self.nholea[:,a], self.nholeb[:,a]], axis=1) > 0
+        idx_valid = (has_e & has_h)[:,:,:,None,None]
+        nlas_i, nlas_a = self.nlas[i][None,None,:,None,None], self.nlas[a][None,None,:,None,None]
+        nelec_i = take (self.nelec, i) - 1
+        nelec_a = take (self.nelec, a) + 1
+        spins_i = take (self.spins, i) - dm
+        spins_a = take (self.spins, a) + dm
+        smults_i = take (self.smults, i)
+        smults_a = take (self.smults, a)
+        # Valid spin-magnitude changes (see SingleLASRootspace.get_valid_smult_change)
+        def valid_dsmult (nelec, nlas, spins, smults, ds):
+            min_smult = np.abs (spins) + 1
+            max_smult = 1 + nelec - 2*np.maximum (0, nelec - nlas)
+            return np.where (ds < 0, smults > min_smult, smults < max_smult)
+        idx_valid = idx_valid & valid_dsmult (nelec_i, nlas_i, spins_i, smults_i, si)
+        idx_valid = idx_valid & valid_dsmult (nelec_a, nlas_a, spins_a, smults_a, sa)
+        smults_i = smults_i + si
+        smults_a = smults_a + sa
+        # Impossible spin states (see SingleLASRootspace.get_single)
+        idx_valid = idx_valid & ~((nelec_a == 2*nlas_a) & (smults_a > 1))
+        idx_valid = idx_valid & ~((nelec_i == 0) & (smults_i > 1))
+        irow, im, ipair, isi, isa = np.nonzero (np.broadcast_to (idx_valid, shape))
+        ifrag, afrag = i[ipair], a[ipair]
+        new = np.arange (len (irow))
+        charges = self.charges[irow].copy ()
+        spins = self.spins[irow].copy ()
+        smults = self.smults[irow].copy ()
+        dm = 1 - 2*im
+        charges[new,ifrag] += 1
+        charges[new,afrag] -= 1
+        spins[new,ifrag] -= dm
+        spins[new,afrag] += dm
+        smults[new,ifrag] += dsm[isi]
+        smults[new,afrag] += dsm[isa]
+        return self._copy_with (charges, spins, smults, np.zeros (len (irow)))
+
+    def get_spin_shuffles (self):
+        '''Table of all rootspaces with the same local charges and spin magnitudes and the same
+        total 2M_S as any of the rootspaces of self, in the same order as
+        SingleLASRootspace.gen_spin_shuffles applied to each rootspace in turn'''
+        charges, spins, smults = [], [], []
+        for c, m, s in zip (self.charges, self.spins, self.smults):
+            spins_table = _spin_shuffle_table (s, m.sum ())
+            spins.append (spins_table)
+            charges.append (np.broadcast_to (c, spins_table.shape))
+            smults.append (np.broadcast_to (s, spins_table.shape))
+        if not len (spins): return self[:0]
+        charges, spins, smults = [np.concatenate (x, axis=0) for x in (charges, spins, smults)]
+        return self._copy_with (charges, spins, smults, np.zeros (len (spins)))
+
+    def state_average (self, las=None):
+        if las is None: las = self.las
+        return las.state_average (weights=list (self.weights), charges=self.charges,
+                                  spins=self.spins, smults=self.smults)
+
+def get_rootspace_table (las):
+    '''Build a LASRootspaceTable of the rootspaces of a LAS method instance'''
+    from mrh.my_pyscf.mcscf.lasci import get_space_info
+    charges, spins, smults = get_space_info (las)[:3]
+    return LASRootspaceTable (las, charges, spins, smults, weights=las.weights)
+
+def rootspaces_to_table (spaces):
+    '''Build a LASRootspaceTable from a list of SingleLASRootspace objects'''
+    sp0 = spaces[0]
+    return LASRootspaceTable (sp0.las, [sp.charges for sp in spaces], [sp.spins for sp in spaces],
+                              [sp.smults for sp in spaces], weights=[sp.weight for sp in spaces],
+                              nlas=sp0.nlas, nelelas=sp0.nelelas, stdout=sp0.stdout,
+                              verbose=sp0.verbose)
+
 def all_single_excitations (las, verbose=None):
     '''Add states characterized by one electron hopping from one fragment to another fragment
     in all possible ways. Uses all states already present as reference states, so that calling
     this function a second time generates two-electron excitations, etc. The input object is
     not altered in-place. For orbital optimization, all new states have weight = 0; all weights
     of existing states are unchanged.'''
-    from mrh.my_pyscf.mcscf.lasci import get_space_info
     from mrh.my_pyscf.mcscf.lasci import LASCISymm
     if verbose is None: verbose=las.verbose
     log = logger.new_logger (las, verbose)
     if isinstance (las, LASCISymm):
         raise NotImplementedError ("Point-group symmetry for LASSI state generator")
-    ref_states = [SingleLASRootspace (las, m, s, c, 0) for c,m,s,w in zip (*get_space_info (las))]
-    for weight, state in zip (las.weights, ref_states): state.weight = weight
-    new_states = []
-    for ref_state in ref_states:
-        new_states.extend (ref_state.get_singles ())
-    seen = set (ref_states)
-    all_states = ref_states + [state for state in new_states if not ((state in seen) or seen.add (state))]
-    weights = [state.weight for state in all_states]
-    charges = [state.charges for state in all_states]
-    spins = [state.spins for state in all_states]
-    smults = [state.smults for state in all_states]
-    #wfnsyms = [state.wfnsyms for state in all_states]
+    ref_states = get_rootspace_table (las)
+    new_states = ref_states.get_singles ().unique ()
+    new_states = new_states[~new_states.isin (ref_states)]
+    all_states = ref_states.append (new_states)
     log.info ('Built {} singly-excited LAS states from {} reference LAS states'.format (
         len (all_states) - len (ref_states), len (ref_states)))
     if len (all_states) == len (ref_states):
         log.warn (("%d reference LAS states exhaust current active space specifications; "
                    "no singly-excited states could be constructed"), len (ref_states))
-    return las.state_average (weights=weights, charges=charges, spins=spins, smults=smults)
+    return all_states.state_average (las)
 
 def spin_shuffle (las, verbose=None, equal_weights=False):
     '''Add states characterized by varying local Sz in all possible ways without changing
@@ -382,33 +754,22 @@ def spin_shuffle (las, verbose=None, equal_weights=False):
     degeneracy between states of different S**2. Unlike all_single_excitations, there
     should never be any reason to call this function more than once. For orbital optimization,
     all new states have weight == 0; all weights of existing states are unchanged.'''
-    from mrh.my_pyscf.mcscf.lasci import get_space_info
     from mrh.my_pyscf.mcscf.lasci import LASCISymm
     if verbose is None: verbose=las.verbose
     log = logger.new_logger (las, verbose)
     if isinstance (las, LASCISymm):
         raise NotImplementedError ("Point-group symmetry for LASSI state generator")
-    ref_states = [SingleLASRootspace (las, m, s, c, 0) for c,m,s,w in zip (*get_space_info (las))]
-    for weight, state in zip (las.weights, ref_states): state.weight = weight
-    seen = set (ref_states)
-    all_states = [state for state in ref_states]
-    for ref_state in ref_states:
-        for new_state in ref_state.gen_spin_shuffles ():
-            if not new_state in seen:
-                all_states.append (new_state)
-                seen.add (new_state)
-    weights = [state.weight for state in all_states]
+    ref_states = get_rootspace_table (las)
+    new_states = ref_states.get_spin_shuffles ().unique ()
+    new_states = new_states[~new_states.isin (ref_states)]
+    all_states = ref_states.append (new_states)
     if equal_weights:
-        weights = [1.0/len(all_states),]*len(all_states)
-    charges = [state.charges for state in all_states]
-    spins = [state.spins for state in all_states]
-    smults = [state.smults for state in all_states]
-    #wfnsyms = [state.wfnsyms for state in all_states]
+        all_states.weights[:] = 1.0/len(all_states)
     log.info ('Built {} spin(local Sz)-shuffled LAS states from {} reference LAS states'.format (
         len (all_states) - len (ref_states), len (ref_states)))
     if len (all_states) == len (ref_states):
         log.warn ("no spin-shuffling options found for given LAS states")
-    return las.state_average (weights=weights, charges=charges, spins=spins, smults=smults)
+    return all_states.state_average (las)
 
 def spin_shuffle_ci (las, ci):
     '''Fill out the CI vectors for rootspaces constructed by the spin_shuffle function.
@@ -417,47 +778,51 @@ def spin_shuffle_ci (las, ci):
     vectors are set to the appropriate rotations of the latter. In the event that
     more than one reference state for an unallocated rootspace is identified, the
     rotated vectors are combined and orthogonalized. Unlike running las.lasci (),
-    doing this should ALWAYS guarantee good spin quantum number.'''
+    doing this should ALWAYS guarantee good spin quantum number.
+
+    The lists of the returned ci are LazyCIList objects. Rotations of a single reference state
+    are stored as SzRotatedCI placeholders and carried out when they are accessed. As in the
+    case of several reference states, each access returns a new array of shape
+    (lroots,ndeta,ndetb) which does not share memory with the reference.'''
     from mrh.my_pyscf.mcscf.lasci import get_space_info
-    spaces = [SingleLASRootspace (las, m, s, c, 0, ci=[c[ix] for c in ci])
+    nfrag = las.nfrags
+    ci_raw = [list (list.__iter__ (c)) for c in ci]
+    spaces = [SingleLASRootspace (las, m, s, c, 0)
               for ix, (c, m, s, w) in enumerate (zip (*get_space_info (las)))]
-    old_ci_sz = []
     old_idx = []
     new_idx = []
-    nfrag = las.nfrags
     for ix, space in enumerate (spaces):
-        if space.has_ci ():
+        if all ([ci_raw[ifrag][ix] is not None for ifrag in range (nfrag)]):
             old_idx.append (ix)
-            old_ci_sz.append (space.get_ci_szrot ())
         else:
             new_idx.append (ix)
     def is_spin_shuffle_ref (sp1, sp2):
         return (np.all (sp1.charges==sp2.charges) and
                 np.all (sp1.smults==sp2.smults))
+    ci = [LazyCIList (c) for c in ci_raw]
     for ix in new_idx:
+        ref_idx = [jx for jx in old_idx if is_spin_shuffle_ref (spaces[ix], spaces[jx])]
         ndet = spaces[ix].get_ndet ()
-        ci_ix = [np.zeros ((0,ndet[i][0],ndet[i][1]))
-                 for i in range (nfrag)]
-        for ci_sz, jx in zip (old_ci_sz, old_idx):
-            if not is_spin_shuffle_ref (spaces[ix], spaces[jx]): continue
-            for ifrag in range (nfrag):
-                c = ci_sz[ifrag][spaces[ix].spins[ifrag]]
-                if c.ndim < 3: c = c[None,:,:]
-                ci_ix[ifrag] = np.append (ci_ix[ifrag], c, axis=0)
         for ifrag in range (nfrag):
-            if ci_ix[ifrag].size==0:
+            if not len (ref_idx):
                 ci[ifrag][ix] = None
                 continue
-            lroots, ndeti = ci_ix[ifrag].shape[0], ndet[ifrag]
-            if lroots > 1:
-                c = (ci_ix[ifrag].reshape (lroots, ndeti[0]*ndeti[1])).T
-                ovlp = c.conj ().T @ c
-                w, v = linalg.eigh (ovlp)
-                idx = w>1e-8
-                v = v[:,idx] / np.sqrt (w[idx])[None,:]
-                c = (c @ v).T
-                ci_ix[ifrag] = c.reshape (-1, ndeti[0], ndeti[1])
-            ci[ifrag][ix] = ci_ix[ifrag]
+            rot = [SzRotatedCI (ci_raw[ifrag][jx], spaces[jx].nlas[ifrag],
+                                (spaces[jx].neleca[ifrag], spaces[jx].nelecb[ifrag]),
+                                spaces[ix].spins[ifrag], ndim=3)
+                   for jx in ref_idx]
+            if len (rot) == 1:
+                ci[ifrag][ix] = rot[0]
+                continue
+            ndeti = ndet[ifrag]
+            c = np.concatenate ([np.asarray (r.rotate ()).reshape (-1, ndeti[0]*ndeti[1])
+                                 for r in rot], axis=0).T
+            ovlp = c.conj ().T @ c
+            w, v = linalg.eigh (ovlp)
+            idx = w>1e-8
+            v = v[:,idx] / np.sqrt (w[idx])[None,:]
+            c = (c @ v).T
+            ci[ifrag][ix] = c.reshape (-1, ndeti[0], ndeti[1])
     return ci
 
 def count_excitations (las0):
@@ -136,9 +136,8 @@ def get_grad_orb (las, mo_coeff=None, ci=None, h2eff_sub=None, veff=None, dm1s=N
     casdm2 -= np.multiply.outer (casdm1, casdm1)
     casdm2 += np.multiply.outer (casdm1s[0], casdm1s[0]).transpose (0,3,2,1)
     casdm2 += np.multiply.outer (casdm1s[1], casdm1s[1]).transpose (0,3,2,1)
-    eri = h2eff_sub.reshape (nmo*ncas, ncas*(ncas+1)//2)
-    eri = lib.numpy_helper.unpack_tril (eri).reshape (nmo, ncas, ncas, ncas)
-    f1[:,ncore:nocc] += np.tensordot (eri, casdm2, axes=((1,2,3),(1,2,3)))
+    for p0, p1, eri_blk in loop_h2eff_paaa (las, h2eff_sub, nfac=3):
+        f1[p0:p1,ncore:nocc] += np.tensordot (eri_blk, casdm2, axes=((1,2,3),(1,2,3)))
 
     if hermi == -1:
         return f1 - f1.T
@@ -190,6 +189,72 @@ def get_grad_ci (las, mo_coeff=None, ci=None, h1eff_sub=None, h2eff_sub=None, ve
         gci.append ([2.0 * (hc - c * (c.dot (hc))) for c, hc in zip (ci0, hc0)])
     return gci
 
+def get_h2eff_blksize (las, ncas, nfac=3):
+    '''Number of rows (first index) of h2eff_sub which can be unpacked to full (p,a,a,a) shape at
+    the same time without exceeding the remaining memory of las.max_memory.
+
+    Args:
+        las : instance of :class:`LASCINoSymm`
+        ncas : integer
+            Number of active orbitals spanned by the last three indices
+
+    Kwargs:
+        nfac : integer
+            Number of (p,a,a,a)-shaped temporary arrays expected to be in memory at once
+
+    Returns:
+        blksize : integer
+    '''
+    max_memory = max (0, las.max_memory - lib.current_memory ()[0])
+    row_size = nfac * ncas**3 * np.dtype (np.float64).itemsize / 1e6
+    return max (1, int (max_memory // max (row_size, 1e-6)))
+
+def loop_h2eff_paaa (las, h2eff_sub, nfac=2, blksize=None):
+    '''Iterate over blocks of rows (first index) of h2eff_sub, unpacking only one block at a time.
+
+    Args:
+        las : instance of :class:`LASCINoSymm`
+        h2eff_sub : ndarray of shape (nmo,ncas**2*(ncas+1)/2)
+            Contains ERIs (p1a1|a2a3), lower-triangular in the a2a3 indices
+
+    Kwargs:
+        nfac : integer
+            Number of (p,a,a,a)-shaped temporary arrays expected to be in memory at once
+        blksize : integer
+            Number of rows per block. Defaults to get_h2eff_blksize (las, ncas, nfac=nfac)
+
+    Yields:
+        p0, p1 : integers
+            Range of rows of the current block
+        eri : ndarray of shape (p1-p0,ncas,ncas,ncas)
+            ERIs (p1a1|a2a3) for p1 in range (p0,p1)
+    '''
+    ncas = las.ncas
+    eri_paaa = h2eff_sub.reshape (-1, ncas, ncas*(ncas+1)//2)
+    nmo = eri_paaa.shape[0]
+    if blksize is None: blksize = get_h2eff_blksize (las, ncas, nfac=nfac)
+    for p0, p1 in lib.prange (0, nmo, blksize):
+        eri = np.asarray (eri_paaa[p0:p1]).reshape ((p1-p0)*ncas, -1)
+        eri = lib.numpy_helper.unpack_tril (eri).reshape (p1-p0, ncas, ncas, ncas)
+        yield p0, p1, eri
+
+def get_h2eff_cas (las, h2eff_sub):
+    '''Unpack the active-space block (a0a1|a2a3) of h2eff_sub without unpacking any other rows
+
+    Args:
+        las : instance of :class:`LASCINoSymm`
+        h2eff_sub : ndarray of shape (nmo,ncas**2*(ncas+1)/2)
+            Contains ERIs (p1a1|a2a3), lower-triangular in the a2a3 indices
+
+    Returns:
+        eri_cas : ndarray of shape (ncas,ncas,ncas,ncas)
+    '''
+    ncore, ncas = las.ncore, las.ncas
+    nocc = ncore + ncas
+    eri_cas = h2eff_sub.reshape (-1, ncas, ncas*(ncas+1)//2)[ncore:nocc]
+    eri_cas = lib.numpy_helper.unpack_tril (np.asarray (eri_cas).reshape (ncas*ncas, -1))
+    return eri_cas.reshape (ncas, ncas, ncas, ncas)
+
 def density_fit (las, auxbasis=None, with_df=None):
     ''' Here I ONLY need to attach the tag and the df object because I put conditionals in
         LASCINoSymm to make my life easier '''
@@ -269,8 +334,7 @@ def h1e_for_las (las, mo_coeff=None, ncas=None, ncore=None, nelecas=None, ci=Non
     moH_cas = mo_cas.conj ().T 
     h1e = moH_cas @ (las.get_hcore ()[None,:,:] + veff) @ mo_cas
     h1e_r = np.empty ((las.nroots, 2, ncas, ncas), dtype=h1e.dtype)
-    h2e = lib.numpy_helper.unpack_tril (h2eff_sub.reshape (nmo*ncas,
-        ncas*(ncas+1)//2)).reshape (nmo, ncas, ncas, ncas)[ncore:nocc,:,:,:]
+    h2e = get_h2eff_cas (las, h2eff_sub)
     avgdm1s = np.stack ([linalg.block_diag (*[dm[spin] for dm in casdm1s_sub])
                          for spin in range (2)], axis=0)
     for state in range (las.nroots):
@@ -453,14 +517,17 @@ def canonicalize (las, mo_coeff=None, ci=None, casdm1fs=None, natorb_casdm1=None
         '''
         mo_coeff = lib.tag_array (mo_coeff, orbsym=orbsym)
     if h2eff_sub is not None:
-        h2eff_sub = lib.numpy_helper.unpack_tril (h2eff_sub.reshape (nmo*las.ncas, -1))
-        h2eff_sub = h2eff_sub.reshape (nmo, las.ncas, las.ncas, las.ncas)
-        h2eff_sub = np.tensordot (umat, h2eff_sub, axes=((0),(0)))
-        h2eff_sub = np.tensordot (ucas, h2eff_sub, axes=((0),(1))).transpose (1,0,2,3)
-        h2eff_sub = np.tensordot (ucas, h2eff_sub, axes=((0),(2))).transpose (1,2,0,3)
-        h2eff_sub = np.tensordot (ucas, h2eff_sub, axes=((0),(3))).transpose (1,2,3,0)
-        h2eff_sub = h2eff_sub.reshape (nmo*las.ncas, las.ncas, las.ncas)
-        h2eff_sub = lib.numpy_helper.pack_tril (h2eff_sub).reshape (nmo, -1)
+        # Rotate the active indices one block of rows at a time; the general index can be
+        # rotated directly in the packed representation
+        h2eff_rot = np.empty ((nmo, las.ncas*las.ncas*(las.ncas+1)//2), dtype=h2eff_sub.dtype)
+        for p0, p1, eri in loop_h2eff_paaa (las, h2eff_sub, nfac=3):
+            eri = np.tensordot (ucas, eri, axes=((0),(1))).transpose (1,0,2,3)
+            eri = np.tensordot (ucas, eri, axes=((0),(2))).transpose (1,2,0,3)
+            eri = np.tensordot (ucas, eri, axes=((0),(3))).transpose (1,2,3,0)
+            eri = eri.reshape ((p1-p0)*las.ncas, las.ncas, las.ncas)
+            h2eff_rot[p0:p1] = lib.numpy_helper.pack_tril (eri).reshape (p1-p0, -1)
+        h2eff_sub = umat.T @ h2eff_rot
+        h2eff_rot = None
 
     # I/O
     log = lib.logger.new_logger (las, las.verbose)
@@ -497,9 +564,7 @@ def get_init_guess_ci (las, mo_coeff=None, h2eff_sub=None, ci0=None):
     nocc = ncore + ncas
     dm1_core= 2 * mo_coeff[:,:ncore] @ mo_coeff[:,:ncore].conj ().T
     h1e_ao = las._scf.get_fock (dm=dm1_core)
-    eri_cas = lib.numpy_helper.unpack_tril (h2eff_sub.reshape (nmo*ncas, ncas*(ncas+1)//2))
-    eri_cas = eri_cas.reshape (nmo, ncas, ncas, ncas)
-    eri_cas = eri_cas[ncore:nocc]
+    eri_cas = get_h2eff_cas (las, h2eff_sub)
     for ix, (fcibox, norb, nelecas) in enumerate (zip (las.fciboxes,las.ncas_sub,las.nelecas_sub)):
         i = sum (las.ncas_sub[:ix])
         j = i + norb
@@ -511,7 +576,9 @@ def get_init_guess_ci (las, mo_coeff=None, h2eff_sub=None, ci0=None):
         for iy, solver in enumerate (fcibox.fcisolvers):
             nelec = fcibox._get_nelec (solver, nelecas)
             ndet = tuple ([cistring.num_strings (norb, n) for n in nelec])
-            if isinstance (ci0[ix][iy], np.ndarray) and ci0[ix][iy].size==ndet[0]*ndet[1]: continue
+            # Guesses for any number of roots are kept; missing roots are filled in by the solver
+            if (isinstance (ci0[ix][iy], np.ndarray) and ci0[ix][iy].size
+                    and ci0[ix][iy].size % (ndet[0]*ndet[1]) == 0): continue
             if hasattr (mo_coeff, 'orbsym'):
                 solver.orbsym = mo_coeff.orbsym[ncore+i:ncore+j]
             hdiag_csf = solver.make_hdiag_csf (h1e, eri, norb, nelec, max_memory=las.max_memory)
@@ -764,9 +831,7 @@ def run_lasci (las, mo_coeff=None, ci0=None, lroots=None, lweights=None, verbose
     if (ci0 is None or any ([c is None for c in ci0]) or
             any ([any ([c2 is None for c2 in c1]) for c1 in ci0])):
         ci0 = las.get_init_guess_ci (mo_coeff, h2eff, ci0)
-    eri_cas = lib.numpy_helper.unpack_tril (
-            h2eff.reshape (nmo*ncas, ncas*(ncas+1)//2)).reshape (nmo, ncas,
-            ncas, ncas)[ncore:nocc]
+    eri_cas = get_h2eff_cas (las, h2eff)
 
     e_cas = np.empty (las.nroots)
     e_states = np.empty (las.nroots)
@@ -839,9 +904,14 @@ class LASCINoSymm (casci.CASCI):
         self.ah_level_shift = 1e-8
         self.max_cycle_macro = 50
         self.max_cycle_micro = 5
+        # Incremental veff builds between full builds in conventional-ERI LASCI macrocycles (see
+        # lasci_sync.IncrementalVeff); 0 (default) always does full builds
+        self.max_cycle_incr_veff = 0
+        self.max_ncsf_prec_block = 0
         keys = set(('e_states', 'fciboxes', 'nroots', 'weights', 'ncas_sub', 'nelecas_sub',
                     'conv_tol_grad', 'conv_tol_self', 'max_cycle_macro', 'max_cycle_micro',
-                    'ah_level_shift', 'states_converged', 'chkfile', 'e_lexc'))
+                    'ah_level_shift', 'states_converged', 'chkfile', 'e_lexc',
+                    'max_cycle_incr_veff', 'max_ncsf_prec_block'))
         self._keys = set(self.__dict__.keys()).union(keys)
         self.fciboxes = []
         if isinstance(spin_sub,int):
@@ -881,10 +951,20 @@ class LASCINoSymm (casci.CASCI):
             # Store intermediate with one contracted ao index for faster calculation of exchange!
             bPmn = sparsedf_array (self.with_df._cderi)
             bmuP = bPmn.contract1 (mo_cas)
+            naux = bmuP.shape[-1]
             buvP = np.tensordot (mo_cas.conjugate (), bmuP, axes=((0),(0)))
-            eri_muxy = np.tensordot (bmuP, buvP, axes=((2),(2)))
-            eri = np.tensordot (mo_coeff.conjugate (), eri_muxy, axes=((0),(0)))
-            eri = lib.pack_tril (eri.reshape (nmo*ncas, ncas, ncas)).reshape (nmo, -1)
+            bPxy = lib.pack_tril (np.ascontiguousarray (buvP.transpose (2,0,1)))
+            buvP = None
+            # Contract one AO row block at a time so that the (nao,ncas,ncas,ncas) intermediate is
+            # never held in memory all at once
+            eri = np.zeros ((nmo, ncas*bPxy.shape[-1]), dtype=bPxy.dtype)
+            max_memory = max (0, self.max_memory - lib.current_memory ()[0])
+            row_size = ncas * bPxy.shape[-1] * bPxy.itemsize / 1e6
+            blksize = max (1, int (max_memory // max (row_size, 1e-6)))
+            for p0, p1 in lib.prange (0, nao, blksize):
+                eri_muxy = np.dot (np.asarray (bmuP[p0:p1]).reshape ((p1-p0)*ncas, naux), bPxy)
+                eri += np.dot (mo_coeff[p0:p1].conjugate ().T, eri_muxy.reshape (p1-p0, -1))
+            eri_muxy = bPxy = None
             eri = lib.tag_array (eri, bmPu=bmuP.transpose (0,2,1))
             if self.verbose > lib.logger.DEBUG:
                 eri_comp = self.with_df.ao2mo (mo, compact=True)
@@ -902,18 +982,36 @@ class LASCINoSymm (casci.CASCI):
         return eri
 
     def get_h2eff_slice (self, h2eff, idx, compact=None):
+        ''' Get the ERIs (a1a2|a3a4) of the idx'th fragment directly from the packed h2eff
+        array, without unpacking the whole active space. If h2eff has been tagged with a dict
+        called 'eri_sub_cache' (see tag_h2eff_slice_cache), results are memoized in that dict;
+        this assumes that the active-orbital rows of h2eff are not modified in-place. Memoized
+        arrays are shared between callers and are therefore returned read-only. '''
+        cache = getattr (h2eff, 'eri_sub_cache', None)
+        key = (idx, compact)
+        if cache is not None and key in cache: return cache[key]
         ncas_cum = np.cumsum ([0] + self.ncas_sub.tolist ())
         i = ncas_cum[idx] 
         j = ncas_cum[idx+1]
+        norb = j - i
+        ncas = self.ncas
         ncore = self.ncore
-        nocc = ncore + self.ncas
-        eri = h2eff[ncore:nocc,:].reshape (self.ncas*self.ncas, -1)
-        ix_i, ix_j = np.tril_indices (self.ncas)
-        eri = eri[(ix_i*self.ncas)+ix_j,:]
-        eri = ao2mo.restore (1, eri, self.ncas)[i:j,i:j,i:j,i:j]
-        if compact: eri = ao2mo.restore (compact, eri, j-i)
+        ix_i, ix_j = np.tril_indices (norb)
+        ix_pair = ((ix_i+i)*(ix_i+i+1)//2) + ix_j + i
+        eri = np.asarray (h2eff[ncore+i:ncore+j,:]).reshape (norb, ncas, -1)
+        eri = eri[:,i:j,:][:,:,ix_pair].reshape (norb*norb, -1)
+        eri = eri[(ix_i*norb)+ix_j,:]
+        eri = ao2mo.restore (compact or 1, eri, norb)
+        if cache is not None:
+            eri.flags.writeable = False
+            cache[key] = eri
         return eri
 
+    def tag_h2eff_slice_cache (self, h2eff):
+        ''' Attach an empty memo dict for get_h2eff_slice to h2eff. Call this again whenever the
+        active-orbital rows of h2eff change. '''
+        return lib.tag_array (h2eff, eri_sub_cache={})
+
     get_h1eff = get_h1las = h1e_for_las = h1e_for_las
     get_h2eff = ao2mo
     '''
@@ -1275,14 +1373,17 @@ class LASCINoSymm (casci.CASCI):
         smo_coeff = self._scf.get_ovlp () @ mo_coeff
         smoH_coeff = smo_coeff.conjugate ().T
         veff_s = np.zeros_like (veff_c)
+        blksize = get_h2eff_blksize (self, ncas, nfac=2)
         for ix, (ncas_i, casdm1s) in enumerate (zip (self.ncas_sub, casdm1s_sub)):
             i = sum (self.ncas_sub[:ix])
             j = i + ncas_i
-            eri_k = h2eff_sub.reshape (nmo, ncas, -1)[:,i:j,...].reshape (nmo*ncas_i, -1)
-            eri_k = lib.numpy_helper.unpack_tril (eri_k)[:,i:j,:]
-            eri_k = eri_k.reshape (nmo, ncas_i, ncas_i, ncas)
             sdm = casdm1s[0] - casdm1s[1]
-            vk_pa = -np.tensordot (eri_k, sdm, axes=((1,2),(0,1))) / 2
+            vk_pa = np.empty ((nmo, ncas), dtype=veff_s.dtype)
+            for p0, p1 in lib.prange (0, nmo, blksize):
+                eri_k = h2eff_sub.reshape (nmo, ncas, -1)[p0:p1,i:j,...]
+                eri_k = lib.numpy_helper.unpack_tril (eri_k.reshape ((p1-p0)*ncas_i, -1))
+                eri_k = eri_k[:,i:j,:].reshape (p1-p0, ncas_i, ncas_i, ncas)
+                vk_pa[p0:p1] = -np.tensordot (eri_k, sdm, axes=((1,2),(0,1))) / 2
             veff_s[:,ncore:nocc] += vk_pa
             veff_s[ncore:nocc,:] += vk_pa.T
             veff_s[ncore:nocc,ncore:nocc] -= vk_pa[ncore:nocc,:] / 2
@@ -1317,15 +1418,14 @@ class LASCINoSymm (casci.CASCI):
         h1eff = self.get_hcore () + veff_core
         e0 = 2*np.dot (((h1eff-(veff_core/2)) @ mo_core).ravel (), mo_core.conj().ravel ())
         h1eff = mo_cas.conj ().T @ h1eff @ mo_cas
-        eri_cas = lib.numpy_helper.unpack_tril (h2eff.reshape (nmo*ncas, ncas*(ncas+1)//2))
-        eri_cas = eri_cas.reshape (nmo, ncas, ncas, ncas)
-        eri_cas = eri_cas[ncore:nocc]
+        eri_cas = get_h2eff_cas (self, h2eff)
         casdm1rs = self.states_make_casdm1s (ci=ci, ncas_sub=ncas_sub, nelecas_sub=nelecas_sub,
                                              casdm1frs=casdm1frs)
         vj_r = np.tensordot (casdm1rs.sum (1), eri_cas, axes=2)
         vk_rs = np.tensordot (casdm1rs, eri_cas, axes=((2,3),(2,1)))
         veff_rs = vj_r[:,None,:,:] - vk_rs
 
+        eri_sub = [self.get_h2eff_slice (h2eff, isub) for isub in range (len (ncas_sub))]
         energy_elec = []
         for idx, (dm1s, v) in enumerate (zip (casdm1rs, veff_rs)):
             casdm1fs = [dm[idx] for dm in casdm1frs]
@@ -1337,13 +1437,12 @@ class LASCINoSymm (casci.CASCI):
 
             # 2-body cumulant terms
             e2 = 0
-            for isub, (dm1s, dm2) in enumerate (zip (casdm1fs, casdm2f)):
+            for isub, (dm1s, dm2, eri) in enumerate (zip (casdm1fs, casdm2f, eri_sub)):
                 dm1a, dm1b = dm1s[0], dm1s[1]
                 dm1 = dm1a + dm1b
                 cdm2 = dm2 - np.multiply.outer (dm1, dm1)
                 cdm2 += np.multiply.outer (dm1a, dm1a).transpose (0,3,2,1)
                 cdm2 += np.multiply.outer (dm1b, dm1b).transpose (0,3,2,1)
-                eri = self.get_h2eff_slice (h2eff, isub)
                 te2 = np.tensordot (eri, cdm2, axes=4) / 2
                 e2 += te2
             energy_elec.append (e0 + e1 + e2)
@@ -1385,8 +1484,7 @@ class LASCINoSymm (casci.CASCI):
         casdm2 += np.multiply.outer (casdm1s[0], casdm1s[0]).transpose (0,3,2,1)
         casdm2 += np.multiply.outer (casdm1s[1], casdm1s[1]).transpose (0,3,2,1)
         ncore, ncas, nocc = self.ncore, self.ncas, self.ncore + self.ncas
-        eri = lib.numpy_helper.unpack_tril (h2eff[ncore:nocc].reshape (ncas*ncas, -1))
-        eri = eri.reshape ([ncas,]*4)
+        eri = get_h2eff_cas (self, h2eff)
         e2 = np.tensordot (eri, casdm2, axes=4)/2
 
         e0 = self.energy_nuc ()
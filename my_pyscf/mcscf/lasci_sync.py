@@ -11,6 +11,52 @@ import numpy as np
 class MicroIterInstabilityException (Exception):
     pass
 
+class IncrementalVeff (object):
+    ''' Spin-summed effective potential of a sequence of AO-basis 1-RDMs, obtained by contracting
+    the ERIs only with the change in the 1-RDM since the last committed build:
+
+    veff(D_new) = veff(D_old) + veff(D_new - D_old)
+
+    With direct-SCF integral screening, the jk build gets cheaper as D_new - D_old shrinks toward
+    convergence. A full build is done every max_cycle_incr + 1 calls in order to control the
+    accumulation of numerical error. max_cycle_incr=0 disables the incremental builds.
+
+    Args:
+        las : instance of :class:`LASCINoSymm`
+        max_cycle_incr : integer
+            Maximum number of consecutive incremental builds
+    '''
+    def __init__(self, las, max_cycle_incr):
+        self.las = las
+        self.max_cycle_incr = max_cycle_incr
+        self.dm1 = self.veff = None
+        self.nincr = 0
+
+    def __call__(self, dm1):
+        ''' Return veff (spin-summed) for dm1 without committing the result '''
+        dm1 = np.asarray (dm1)
+        if dm1.ndim == 3: dm1 = dm1.sum (0)
+        if self.dm1 is None or self.nincr >= self.max_cycle_incr:
+            return self.las.get_veff (dm1s=dm1)
+        ddm1 = dm1 - self.dm1
+        if np.amax (np.abs (ddm1)) < 1e-14: return self.veff.copy ()
+        return self.veff + self.las.get_veff (dm1s=ddm1)
+
+    def commit (self, dm1, veff):
+        ''' Store dm1 and its veff as the reference for the next incremental build '''
+        dm1 = np.asarray (dm1)
+        if dm1.ndim == 3: dm1 = dm1.sum (0)
+        if self.dm1 is None or self.nincr >= self.max_cycle_incr:
+            self.nincr = 0
+        else:
+            self.nincr += 1
+        self.dm1, self.veff = dm1, veff
+
+    def get_veff (self, dm1):
+        veff = self (dm1)
+        self.commit (dm1, veff)
+        return veff
+
 def kernel (las, mo_coeff=None, ci0=None, casdm0_fr=None, conv_tol_grad=1e-4, 
         assert_no_dupes=False, verbose=lib.logger.NOTE):
     from mrh.my_pyscf.mcscf.lasci import _eig_inactive_virtual
@@ -20,8 +66,10 @@ def kernel (las, mo_coeff=None, ci0=None, casdm0_fr=None, conv_tol_grad=1e-4,
     t0 = (lib.logger.process_clock(), lib.logger.perf_counter())
     log.debug('Start LASCI')
 
-    h2eff_sub = las.get_h2eff (mo_coeff)
+    h2eff_sub = las.tag_h2eff_slice_cache (las.get_h2eff (mo_coeff))
     t1 = log.timer('integral transformation to LAS space', *t0)
+    max_cycle_incr = 0 if isinstance (las, _DFLASCI) else las.max_cycle_incr_veff
+    incr_veff = IncrementalVeff (las, max_cycle_incr)
 
     # In the first cycle, I may pass casdm0_fr instead of ci0.
     # Therefore, I need to work out this get_veff call separately.
@@ -37,7 +85,7 @@ def kernel (las, mo_coeff=None, ci0=None, casdm0_fr=None, conv_tol_grad=1e-4,
                                            axes=((1),(1))).transpose (1,0,2))
         dm1s_sub = np.stack (dm1s_sub, axis=0)
         dm1s = dm1s_sub.sum (0)
-        veff = las.get_veff (dm1s=dm1s.sum (0))
+        veff = incr_veff.get_veff (dm1s.sum (0))
         veff = las.split_veff (veff, h2eff_sub, mo_coeff=mo_coeff, casdm1s_sub=casdm0_sub)
         casdm1s_sub = casdm0_sub
         casdm1frs = casdm0_fr
@@ -48,7 +96,7 @@ def kernel (las, mo_coeff=None, ci0=None, casdm0_fr=None, conv_tol_grad=1e-4,
         if (ci0 is None or any ([c is None for c in ci0]) or
           any ([any ([c2 is None for c2 in c1]) for c1 in ci0])):
             raise RuntimeError ("failed to populate get_init_guess")
-        veff = las.get_veff (dm1s = las.make_rdm1 (mo_coeff=mo_coeff, ci=ci0))
+        veff = incr_veff.get_veff (las.make_rdm1 (mo_coeff=mo_coeff, ci=ci0))
         casdm1s_sub = las.make_casdm1s_sub (ci=ci0)
         casdm1frs = las.states_make_casdm1s_sub (ci=ci0)
         veff = las.split_veff (veff, h2eff_sub, mo_coeff=mo_coeff, ci=ci0, casdm1s_sub=casdm1s_sub)
@@ -75,13 +123,17 @@ def kernel (las, mo_coeff=None, ci0=None, casdm0_fr=None, conv_tol_grad=1e-4,
         mo_coeff = mo_coeff @ umat
         if orbsym is not None:
             mo_coeff = lib.tag_array (mo_coeff, orbsym=orbsym)
+        # umat is the identity in the active-active block, so this leaves the fragment ERIs
+        # cached in h2eff_sub.eri_sub_cache valid
+        ncore, nocc = las.ncore, las.ncore + las.ncas
+        assert (np.allclose (umat[ncore:nocc,ncore:nocc], np.eye (las.ncas)))
         h2eff_sub[:,:] = umat.conj ().T @ h2eff_sub
 
         casdm1s_new = las.make_casdm1s_sub (ci=ci1)
-        if not isinstance (las, _DFLASCI) or las.verbose > lib.logger.DEBUG:
-            #veff = las.get_veff (mo_coeff=mo_coeff, ci=ci1)
+        if not isinstance (las, _DFLASCI):
+            veff = incr_veff.get_veff (las.make_rdm1 (mo_coeff=mo_coeff, ci=ci1))
+        elif las.verbose > lib.logger.DEBUG:
             veff_new = las.get_veff (dm1s = las.make_rdm1 (mo_coeff=mo_coeff, ci=ci1))
-            if not isinstance (las, _DFLASCI): veff = veff_new
         if isinstance (las, _DFLASCI):
             dcasdm1s = [dm_new - dm_old for dm_new, dm_old in zip (casdm1s_new, casdm1s_sub)]
             veff += las.fast_veffa (dcasdm1s, h2eff_sub, mo_coeff=mo_coeff, ci=ci1) 
@@ -179,10 +231,10 @@ def kernel (las, mo_coeff=None, ci0=None, casdm0_fr=None, conv_tol_grad=1e-4,
                                   M=prec_op)[0]
             t1 = log.timer ('LASCI {} microcycles'.format (microit[0]), *t1)
             mo_coeff, ci1, h2eff_sub = H_op.update_mo_ci_eri (x, h2eff_sub)
+            h2eff_sub = las.tag_h2eff_slice_cache (h2eff_sub)
             t1 = log.timer ('LASCI Hessian update', *t1)
 
-            #veff = las.get_veff (mo_coeff=mo_coeff, ci=ci1)
-            veff = las.get_veff (dm1s = las.make_rdm1 (mo_coeff=mo_coeff, ci=ci1))
+            veff = incr_veff.get_veff (las.make_rdm1 (mo_coeff=mo_coeff, ci=ci1))
             veff = las.split_veff (veff, h2eff_sub, mo_coeff=mo_coeff, ci=ci1)
             t1 = log.timer ('LASCI get_veff after secondorder', *t1)
         except MicroIterInstabilityException as e:
@@ -192,8 +244,9 @@ def kernel (las, mo_coeff=None, ci0=None, casdm0_fr=None, conv_tol_grad=1e-4,
             for i in range (3): # Make up to 3 attempts to scale-down x if necessary
                 mo2, ci2, h2eff_sub2 = H_op.update_mo_ci_eri (x, h2eff_sub)
                 t1 = log.timer ('LASCI Hessian update', *t1)
-                veff2 = las.get_veff (dm1s = las.make_rdm1 (mo_coeff=mo2, ci=ci2))
-                veff2 = las.split_veff (veff2, h2eff_sub2, mo_coeff=mo2, ci=ci2)
+                dm1_2 = las.make_rdm1 (mo_coeff=mo2, ci=ci2)
+                veff2_c = incr_veff (dm1_2)
+                veff2 = las.split_veff (veff2_c, h2eff_sub2, mo_coeff=mo2, ci=ci2)
                 t1 = log.timer ('LASCI get_veff after secondorder', *t1)
                 e2 = las.energy_nuc () + las.energy_elec (mo_coeff=mo2, ci=ci2, h2eff=h2eff_sub2,
                                                           veff=veff2)
@@ -203,7 +256,9 @@ def kernel (las, mo_coeff=None, ci0=None, casdm0_fr=None, conv_tol_grad=1e-4,
                     e2, H_op.e_tot))
                 log.info ('Attempt {} of 3 to scale down trial step vector'.format (i+1))
                 x *= .5
+            incr_veff.commit (dm1_2, veff2_c)
             mo_coeff, ci1, h2eff_sub, veff = mo2, ci2, h2eff_sub2, veff2
+            h2eff_sub = las.tag_h2eff_slice_cache (h2eff_sub)
 
 
         casdm1frs = las.states_make_casdm1s_sub (ci=ci1)
@@ -590,8 +645,8 @@ class LASCI_HessianOperator (sparse_linalg.LinearOperator):
             The cumulant of the state-averaged, spin-summed 2-RDM of the active orbitals.
         dm1s : ndarray of shape (2,nmo,nmo)
             State-averaged, spin-separated 1-RDM of the whole molecule in the MO basis.
-        eri_paaa : ndarray of shape (nmo, ncas, ncas, ncas)
-            Same as kwarg h2eff_sub, be reshaped to be more accessible
+        h2eff_sub : ndarray of shape (nmo,ncas**2*(ncas+1)/2)
+            Same as kwarg h2eff_sub. Blocks of rows are unpacked as needed by loop_eri_paaa
         eri_cas : ndarray of shape [ncas,]*4
             ERIs (a1a2|a3a4)
         h1s : ndarray of shape (2,nmo,nmo)
@@ -709,16 +764,16 @@ class LASCI_HessianOperator (sparse_linalg.LinearOperator):
                 veff = las.get_veff (dm1s = np.dot (mo_coeff, 
                                                     np.dot (self.dm1s.sum (0), moH_coeff)))
             veff = las.split_veff (veff, h2eff_sub, mo_coeff=mo_coeff, casdm1s_sub=self.casdm1fs)
-        self.eri_paaa = eri_paaa = lib.numpy_helper.unpack_tril (
-            h2eff_sub.reshape (nmo*ncas, ncas*(ncas+1)//2)).reshape (nmo, ncas,
-            ncas, ncas)
-        self.eri_cas = eri_cas = eri_paaa[ncore:nocc,:,:,:]
+        from mrh.my_pyscf.mcscf.lasci import get_h2eff_cas
+        self.h2eff_sub = h2eff_sub
+        self.eri_cas = eri_cas = get_h2eff_cas (las, h2eff_sub)
         h1s = las.get_hcore ()[None,:,:] + veff
         h1s = np.dot (h1s, mo_coeff)
         self.h1s = np.dot (moH_coeff, h1s).transpose (1,0,2)
         self.h1s_cas = self.h1s[:,:,ncore:nocc].copy ()
-        self.h1s_cas -= np.tensordot (eri_paaa, casdm1, axes=2)[None,:,:]
-        self.h1s_cas += np.tensordot (self.casdm1s, eri_paaa, axes=((1,2),(2,1)))
+        for p0, p1, eri in self.loop_eri_paaa ():
+            self.h1s_cas[:,p0:p1] -= np.tensordot (eri, casdm1, axes=2)[None,:,:]
+            self.h1s_cas[:,p0:p1] += np.tensordot (self.casdm1s, eri, axes=((1,2),(2,1)))
 
         self.h1frs = [np.zeros ((self.nroots, 2, nlas, nlas)) for nlas in ncas_sub]
         for ix, h1rs in enumerate (self.h1frs):
@@ -741,10 +796,28 @@ class LASCI_HessianOperator (sparse_linalg.LinearOperator):
             + np.dot (h1.ravel (), self.dm1s.ravel ())
             + np.tensordot (self.eri_cas, self.cascm2, axes=4) / 2)
 
+    def loop_eri_paaa (self, nfac=2):
+        '''Iterate over blocks of rows of the ERIs (p1a1|a2a3), unpacking only one block at a
+        time. See lasci.loop_h2eff_paaa.'''
+        from mrh.my_pyscf.mcscf.lasci import loop_h2eff_paaa
+        return loop_h2eff_paaa (self.las, self.h2eff_sub, nfac=nfac)
+
+    @property
+    def eri_paaa (self):
+        '''ERIs (p1a1|a2a3) unpacked in full to shape (nmo,ncas,ncas,ncas). Prefer
+        loop_eri_paaa, which does not hold all of them in memory at once.'''
+        ncas = self.ncas
+        eri_paaa = np.empty ((self.nmo, ncas, ncas, ncas), dtype=self.h2eff_sub.dtype)
+        for p0, p1, eri in self.loop_eri_paaa ():
+            eri_paaa[p0:p1] = eri
+        return eri_paaa
+
     def _init_orb_(self):
-        eri_paaa, ncore, nocc = self.eri_paaa, self.ncore, self.nocc
+        ncore, nocc = self.ncore, self.nocc
         self.fock1 = sum ([f @ d for f,d in zip (list (self.h1s), list (self.dm1s))])
-        self.fock1[:,ncore:nocc] += np.tensordot (eri_paaa, self.cascm2, axes=((1,2,3),(1,2,3)))
+        for p0, p1, eri in self.loop_eri_paaa ():
+            self.fock1[p0:p1,ncore:nocc] += np.tensordot (eri, self.cascm2,
+                                                          axes=((1,2,3),(1,2,3)))
 
     def _init_ci_(self):
         ci, ncas_sub, nelecas_sub = self.ci, self.ncas_sub, self.nelecas_sub
@@ -880,7 +953,16 @@ class LASCI_HessianOperator (sparse_linalg.LinearOperator):
 
         return tdm1rs, tcm2    
 
-    def get_veff_Heff (self, odm1s, tdm1rs):
+    def get_dm1s_mo (self, odm1s, tdm1rs):
+        ''' First-order effective spin-separated state-averaged 1-RDM in the MO basis, from which
+        the effective potential of get_veff_Heff is computed. See get_veff_Heff for the args. '''
+        ncore, nocc = self.ncore, self.nocc
+        tdm1s_sa = np.einsum ('rspq,r->spq', tdm1rs, self.weights)
+        dm1s_mo = odm1s + odm1s.transpose (0,2,1)
+        dm1s_mo[:,ncore:nocc,ncore:nocc] += tdm1s_sa
+        return dm1s_mo
+
+    def get_veff_Heff (self, odm1s, tdm1rs, veff_mo=None):
         ''' Compute first-order effective potential (relevant to the orbital-rotation sector of the
         Hessian-vector product) and first-order effective 1-body Hamiltonian operator (relevant to
         the CI-rotation sector of the Hessian-vector product) from first-order effective density
@@ -895,6 +977,11 @@ class LASCI_HessianOperator (sparse_linalg.LinearOperator):
                 Effective spin-separated 1-RDMs from the CI rotation part of the step vector,
                 separated by root
 
+        Kwargs:
+            veff_mo : ndarray of shape (nmo,nmo)
+                Output of self.get_veff for self.get_dm1s_mo (odm1s, tdm1rs), if it has already
+                been computed (i.e., by get_veff_multi).
+
         Returns:
             veff_mo : ndarray of shape (nmo,nmo)
                 Spin-symmetric effective 1-body potential, including the effects of both the
@@ -907,14 +994,10 @@ class LASCI_HessianOperator (sparse_linalg.LinearOperator):
         '''
 
         ncore, nocc, nroots = self.ncore, self.nocc, self.nroots
-        tdm1s_sa = np.einsum ('rspq,r->spq', tdm1rs, self.weights)
-        dm1s_mo = odm1s + odm1s.transpose (0,2,1)
-        dm1s_mo[:,ncore:nocc,ncore:nocc] += tdm1s_sa
-        mo = self.mo_coeff
-        moH = mo.conjugate ().T
+        dm1s_mo = self.get_dm1s_mo (odm1s, tdm1rs)
 
         # Overall veff for gradient: the one and only jk call per microcycle that I will allow.
-        veff_mo = self.get_veff (dm1s_mo=dm1s_mo)
+        if veff_mo is None: veff_mo = self.get_veff (dm1s_mo=dm1s_mo)
         veff_mo = self.split_veff (veff_mo, dm1s_mo)
 
         # Core-orbital-effect only for individual CI problems
@@ -925,9 +1008,11 @@ class LASCI_HessianOperator (sparse_linalg.LinearOperator):
         # Deal with nonsymmetric eri: Coulomb part
         err_dm1s = err_dm1s[:,:,ncore:nocc] * 2.0
         err_dm1s[:,ncore:nocc,:] /= 2.0
-        veff_ci = np.tensordot (err_dm1s, self.eri_paaa, axes=2)
-        veff_ci += veff_ci[::-1,:,:]
-        veff_ci -= np.tensordot (err_dm1s, self.eri_paaa, axes=((1,2),(0,3)))
+        vj_ci = vk_ci = 0
+        for p0, p1, eri in self.loop_eri_paaa ():
+            vj_ci = vj_ci + np.tensordot (err_dm1s[:,p0:p1], eri, axes=2)
+            vk_ci = vk_ci + np.tensordot (err_dm1s[:,p0:p1], eri, axes=((1,2),(0,3)))
+        veff_ci = vj_ci + vj_ci[::-1,:,:] - vk_ci
         # Deal with nonsymmetric eri: exchange part
         veff_ci += veff_ci.transpose (0,2,1)
         veff_ci /= 2.0
@@ -1023,6 +1108,21 @@ class LASCI_HessianOperator (sparse_linalg.LinearOperator):
         #veff_mo[:ncore,nocc:] -= vk_ai.T/2
         return veff_mo
 
+    def get_veff_multi (self, dm1s_mo):
+        ''' Same as get_veff for a stack of 1-RDMs of shape (nvec,2,nmo,nmo). Without density
+        fitting, all of the effective potentials come from a single jk call. '''
+        if getattr (self, 'bPpj', None) is not None:
+            return np.stack ([self.get_veff (dm1s_mo=dm) for dm in dm1s_mo], axis=0)
+        return self._get_veff_multi_ao (dm1s_mo)
+
+    def _get_veff_multi_ao (self, dm1s_mo):
+        mo = self.mo_coeff
+        moH = mo.conjugate ().T
+        nvec, nao = len (dm1s_mo), mo.shape[0]
+        dm1_ao = np.stack ([mo @ dm.sum (0) @ moH for dm in dm1s_mo], axis=0)
+        veff_ao = np.asarray (self.las.get_veff (dm1s=dm1_ao)).reshape (nvec, nao, nao)
+        return np.stack ([moH @ v @ mo for v in veff_ao], axis=0)
+
     def split_veff (self, veff_mo, dm1s_mo):
         # This function seems orphaned? Is it used anywhere?
         veff_c = veff_mo.copy ()
@@ -1038,41 +1138,69 @@ class LASCI_HessianOperator (sparse_linalg.LinearOperator):
         return np.stack ([veffa, veffb], axis=0)
 
     def _matvec (self, x):
+        return self._matmat (np.asarray (x).reshape (-1,1))[:,0]
+
+    def _matmat (self, X):
+        ''' Hessian-vector products for all columns of X at once. Everything except the
+        effective potential is computed column by column, but the effective potentials of all
+        columns come from a single call to get_veff_multi, which shares one jk build across the
+        whole block if possible. '''
         log = lib.logger.new_logger (self.las, self.las.verbose)
         extra_timing = getattr (self.las, '_extra_hessian_timing', False)
         extra_timer = log.timer if extra_timing else log.timer_debug1
         t0 = (lib.logger.process_clock(), lib.logger.perf_counter())
-        kappa1, ci1 = self.ugg.unpack (x)
+        X = np.asarray (X)
+        kappa1, ci1 = [], []
+        for x in X.T:
+            k, c = self.ugg.unpack (x)
+            kappa1.append (k)
+            ci1.append (c)
         t1 = extra_timer ('LASCI sync Hessian operator 1: unpack', *t0)
 
         # Effective density matrices, veffs, and overlaps from linear response
-        odm1s = -np.dot (self.dm1s, kappa1)
-        ocm2 = -np.dot (self.cascm2, kappa1[self.ncore:self.nocc])
-        tdm1rs, tcm2 = self.make_tdm1s2c_sub (ci1)
+        odm1s = [-np.dot (self.dm1s, k) for k in kappa1]
+        ocm2 = [-np.dot (self.cascm2, k[self.ncore:self.nocc]) for k in kappa1]
+        tdm1rs, tcm2 = [], []
+        for c in ci1:
+            tdm1rs_i, tcm2_i = self.make_tdm1s2c_sub (c)
+            tdm1rs.append (tdm1rs_i)
+            tcm2.append (tcm2_i)
         t1 = extra_timer ('LASCI sync Hessian operator 2: effective density matrices', *t1)
-        veff_prime, h1s_prime = self.get_veff_Heff (odm1s, tdm1rs)
+        if X.shape[1] > 1:
+            dm1s_mo = np.stack ([self.get_dm1s_mo (o, t) for o, t in zip (odm1s, tdm1rs)],
+                                axis=0)
+            veff_mo = self.get_veff_multi (dm1s_mo)
+        else:
+            veff_mo = [None,]
+        veff_prime, h1s_prime = [], []
+        for o, t, v in zip (odm1s, tdm1rs, veff_mo):
+            if v is None: v, h = self.get_veff_Heff (o, t)
+            else: v, h = self.get_veff_Heff (o, t, veff_mo=v)
+            veff_prime.append (v)
+            h1s_prime.append (h)
         t1 = extra_timer ('LASCI sync Hessian operator 3: effective potentials', *t1)
 
-        # Responses!
-        kappa2 = self.orbital_response (kappa1, odm1s, ocm2, tdm1rs, tcm2, veff_prime)
-        t1 = extra_timer ('LASCI sync Hessian operator 4: (Hx)_orb', *t1)
-        ci2 = self.ci_response_offdiag (kappa1, h1s_prime)
-        t1 = extra_timer ('LASCI sync Hessian operator 5: (Hx)_CI offdiag', *t1)
-        ci2 = [[x+y for x,y in zip (xr, yr)] for xr, yr in zip (ci2, self.ci_response_diag (ci1))]
-        t1 = extra_timer ('LASCI sync Hessian operator 6: (Hx)_CI diag', *t1)
-
-        # LEVEL SHIFT!!
-        kappa3, ci3 = self.ugg.unpack (self.ah_level_shift * np.abs (x))
-        kappa2 += kappa3
-        ci2 = [[x+y for x,y in zip (xr, yr)] for xr, yr in zip (ci2, ci3)]
-        t1 = extra_timer ('LASCI sync Hessian operator 7: level shift', *t1)
-
-        Hx = self.ugg.pack (kappa2, ci2)
-        t1 = extra_timer ('LASCI sync Hessian operator 8: pack', *t1)
+        HX = []
+        for ix, x in enumerate (X.T):
+            # Responses!
+            kappa2 = self.orbital_response (kappa1[ix], odm1s[ix], ocm2[ix], tdm1rs[ix],
+                                            tcm2[ix], veff_prime[ix])
+            ci2 = self.ci_response_offdiag (kappa1[ix], h1s_prime[ix])
+            ci2 = [[x+y for x,y in zip (xr, yr)]
+                   for xr, yr in zip (ci2, self.ci_response_diag (ci1[ix]))]
+
+            # LEVEL SHIFT!!
+            kappa3, ci3 = self.ugg.unpack (self.ah_level_shift * np.abs (x))
+            kappa2 += kappa3
+            ci2 = [[x+y for x,y in zip (xr, yr)] for xr, yr in zip (ci2, ci3)]
+
+            HX.append (self.ugg.pack (kappa2, ci2))
+        t1 = extra_timer ('LASCI sync Hessian operator 4: responses, level shift, and pack', *t1)
         t0 = log.timer ('LASCI sync Hessian operator total', *t0)
-        return Hx
+        return np.stack (HX, axis=1)
 
     _rmatvec = _matvec # Hessian is Hermitian in this context!
+    _rmatmat = _matmat
 
     def orbital_response (self, kappa, odm1s, ocm2, tdm1rs, tcm2, veff_prime):
         '''Compute the orbital-response sector of the Hessian-vector product. It's conceptually
@@ -1158,7 +1286,9 @@ class LASCI_HessianOperator (sparse_linalg.LinearOperator):
         h1frs = [np.zeros_like (h1) for h1 in h1frs_prime]
         h1_core = -np.tensordot (kappa1_cas, self.h1s_cas, axes=((1),(1))).transpose (1,0,2)
         h1_core += h1_core.transpose (0,2,1)
-        h2 = -np.tensordot (kappa1_cas, self.eri_paaa, axes=1)
+        h2 = 0
+        for p0, p1, eri in self.loop_eri_paaa ():
+            h2 = h2 - np.tensordot (kappa1_cas[:,p0:p1], eri, axes=1)
         h2 += h2.transpose (2,3,0,1)
         h2 += h2.transpose (1,0,3,2)
         # ^ h2 should also include + h.c.
@@ -1215,7 +1345,10 @@ class LASCI_HessianOperator (sparse_linalg.LinearOperator):
         desirable, because a failure of optimization is more likely due to the unsuitability of a
         quadratic power series in fundamentally periodic variables. I.O.W., we can't get too hung
         up on solving Ax=b, because Ax=b is an approximate equation in the first place. The actual
-        goal is to minimize successive keyframe (aka "macrocycle" aka "trial") energies.
+        goal is to minimize successive keyframe (aka "macrocycle" aka "trial") energies. That said,
+        setting las.max_ncsf_prec_block > 0 replaces the diagonal with the exact inverse in the
+        sufficiently small single-fragment, single-state CI blocks (see _get_prec_ci_blocks), which
+        can save many microcycles when the CI vectors of the fragments are strongly coupled.
 
         Returns:
             prec_op : LinearOperator
@@ -1246,13 +1379,78 @@ class LASCI_HessianOperator (sparse_linalg.LinearOperator):
                        ndeg_unstable, ndeg, g_unst)
         else:
             log.warn ('LASCI encountered an unmaskable instability; calculation may not converge')
+        Minv_blocks = self._get_prec_ci_blocks (Hdiag)
         def prec_op (x):
             t0 = (lib.logger.process_clock(), lib.logger.perf_counter())
             Mx = x/Hdiag
+            for i, j, Minv in Minv_blocks:
+                Mx[i:j] = np.dot (Minv, x[i:j])
             log.timer ('LASCI sync preconditioner call', *t0)
             return Mx
         return sparse_linalg.LinearOperator (self.shape,matvec=prec_op,dtype=self.dtype)
 
+    def _get_prec_ci_blocks (self, Hdiag):
+        '''Invert exactly the diagonal blocks of the Hessian belonging to the CI vector of a single
+        fragment in a single state, for those blocks with no more than las.max_ncsf_prec_block CSFs.
+        Couplings between blocks, and between CI and orbital degrees of freedom, are still
+        approximated by the diagonal. Blocks containing degrees of freedom masked by get_prec are
+        skipped.
+
+        Each block is 2 P (H - e0) P + ah_level_shift, where H is the fragment CSF Hamiltonian
+        (obtained from the CSF solver's pspace with npsp = ncsf, so it uses only the same h1frs
+        and eri_cas as _get_Hci_diag and no jk builds) and P projects onto the complement of the
+        fragment CI vector. That complement is exactly the space of steps that _update_ci can
+        take, so the block is inverted in an explicit orthonormal basis of it.
+
+        Args:
+            Hdiag : ndarray of shape (ugg.nvar_tot,)
+                Diagonal of the Hessian as used by the diagonal preconditioner
+
+        Returns:
+            Minv_blocks : list of tuples (i, j, Minv)
+                Minv is an ndarray of shape (j-i,j-i) which replaces 1/Hdiag[i:j]
+        '''
+        max_ncsf = getattr (self.las, 'max_ncsf_prec_block', 0)
+        if not max_ncsf: return []
+        log = lib.logger.new_logger (self.las, self.las.verbose)
+        t0 = (lib.logger.process_clock(), lib.logger.perf_counter())
+        Minv_blocks = []
+        i = self.ugg.nvar_orb
+        for ix, (fcibox, norb, nelec, h1rs, e0r, ncsf_r, ci_r, tf_r) in enumerate (zip (
+          self.fciboxes, self.ncas_sub, self.nelecas_sub, self.h1frs, self.e0, self.ugg.ncsf_sub,
+          self.ci, self.ugg.ci_transformers)):
+            k = sum (self.ncas_sub[:ix])
+            l = k + norb
+            h2 = self.eri_cas[k:l,k:l,k:l,k:l]
+            for solver, h1s, e0, ncsf, c, tf in zip (fcibox.fcisolvers, h1rs, e0r, ncsf_r, ci_r,
+                                                     tf_r):
+                j = i + ncsf
+                if ncsf < 2 or ncsf > max_ncsf or not np.all (np.isfinite (Hdiag[i:j])):
+                    i = j
+                    continue
+                ne = fcibox._get_nelec (solver, nelec)
+                with lib.temporary_env (solver, orbsym=fcibox.orbsym):
+                    addr, h0 = solver.pspace (h1s, h2, norb, ne, npsp=ncsf)
+                # pspace addresses CSFs of all irreps; put h0 in the packed order of the CI vector
+                addr = np.searchsorted (tf.pack_csf (np.arange (tf.econf_csf_mask.size)), addr)
+                Hblk = np.empty_like (h0)
+                Hblk[np.ix_(addr,addr)] = h0
+                Hblk[np.diag_indices (ncsf)] -= e0
+                c = tf.vec_det2csf (c, normalize=True)
+                q = linalg.null_space (c[None,:])
+                Hblk = 2 * (q.T @ Hblk @ q)
+                Hblk[np.diag_indices (ncsf-1)] += self.ah_level_shift
+                evals, evecs = linalg.eigh (Hblk)
+                evals = np.abs (evals)
+                evals[evals<1e-8] = 1e-8
+                evecs = q @ evecs
+                Minv_blocks.append ((i, j, np.dot (evecs / evals[None,:], evecs.T)))
+                i = j
+        log.debug ('%d CI blocks inverted exactly in LASCI sync preconditioner',
+                   len (Minv_blocks))
+        log.timer ('LASCI sync preconditioner CI blocks', *t0)
+        return Minv_blocks
+
     def _get_Horb_diag (self):
         fock = np.stack ([np.diag (h) for h in list (self.h1s)], axis=0)
         num = np.stack ([np.diag (d) for d in list (self.dm1s)], axis=0)
@@ -1318,17 +1516,24 @@ class LASCI_HessianOperator (sparse_linalg.LinearOperator):
         ucas = umat[ncore:nocc, ncore:nocc]
         bmPu = None
         if hasattr (h2eff_sub, 'bmPu'): bmPu = h2eff_sub.bmPu
-        h2eff_sub = h2eff_sub.reshape (nmo*ncas, ncas*(ncas+1)//2)
-        h2eff_sub = lib.numpy_helper.unpack_tril (h2eff_sub)
-        h2eff_sub = h2eff_sub.reshape (nmo, ncas, ncas, ncas)
-        h2eff_sub = np.tensordot (ucas, h2eff_sub, axes=((0),(1))) # bpaa
-        h2eff_sub = np.tensordot (umat, h2eff_sub, axes=((0),(1))) # qbaa
-        h2eff_sub = np.tensordot (h2eff_sub, ucas, axes=((2),(0))) # qbab
-        h2eff_sub = np.tensordot (h2eff_sub, ucas, axes=((2),(0))) # qbbb
+        from mrh.my_pyscf.mcscf.lasci import get_h2eff_blksize
+        ncas_pair = ncas*(ncas+1)//2
+        h2eff_sub = h2eff_sub.reshape (nmo, ncas*ncas_pair)
+        h2eff_new = np.empty ((nmo, ncas*ncas_pair), dtype=h2eff_sub.dtype)
         ix_i, ix_j = np.tril_indices (ncas)
-        h2eff_sub = h2eff_sub.reshape (nmo, ncas, ncas*ncas)
-        h2eff_sub = h2eff_sub[:,:,(ix_i*ncas)+ix_j]
-        h2eff_sub = h2eff_sub.reshape (nmo, -1)
+        # Transform the three active indices one block of rows at a time...
+        blksize = get_h2eff_blksize (self.las, ncas, nfac=4)
+        for p0, p1 in lib.prange (0, nmo, blksize):
+            h2 = h2eff_sub[p0:p1].reshape ((p1-p0)*ncas, ncas_pair)
+            h2 = lib.numpy_helper.unpack_tril (h2).reshape (p1-p0, ncas, ncas, ncas)
+            h2 = np.tensordot (h2, ucas, axes=((1),(0))) # paab
+            h2 = np.tensordot (h2, ucas, axes=((1),(0))) # pabb
+            h2 = np.tensordot (h2, ucas, axes=((1),(0))) # pbbb
+            h2 = h2.reshape (p1-p0, ncas, ncas*ncas)[:,:,(ix_i*ncas)+ix_j]
+            h2eff_new[p0:p1] = h2.reshape (p1-p0, -1)
+        # ...and the general index all at once, which doesn't require unpacking
+        h2eff_sub = np.dot (umat.T, h2eff_new)
+        h2eff_new = None
         if bmPu is not None:
             bmPu = np.dot (bmPu, ucas)
             h2eff_sub = lib.tag_array (h2eff_sub, bmPu = bmPu)
@@ -57,12 +57,14 @@ class LASSCF_HessianOperator (lasci_sync.LASCI_HessianOperator):
                 # want the honest hdiag in get_prec ()
         ncore, ncas = self.ncore, self.ncas
         nocc = ncore + ncas
-        paaa_test = np.zeros_like (self.eri_paaa)
-        for p in range (self.nmo):
-            paaa_test[p] = self.cas_type_eris.ppaa[p][ncore:nocc]
-        if not np.allclose (paaa_test, self.eri_paaa):
-            logger.warn (self.las, 'possible (pa|aa) inconsistency; max err = %e',
-                         np.amax (np.abs (paaa_test-self.eri_paaa)))
+        consistent, maxerr = True, 0
+        for p0, p1, eri in self.loop_eri_paaa ():
+            paaa_test = np.stack ([self.cas_type_eris.ppaa[p][ncore:nocc]
+                                   for p in range (p0, p1)], axis=0)
+            consistent = consistent and np.allclose (paaa_test, eri)
+            maxerr = max (maxerr, np.amax (np.abs (paaa_test-eri)))
+        if not consistent:
+            logger.warn (self.las, 'possible (pa|aa) inconsistency; max err = %e', maxerr)
 
     def get_veff (self, dm1s_mo=None):
         mo = self.mo_coeff
@@ -73,6 +75,8 @@ class LASSCF_HessianOperator (lasci_sync.LASCI_HessianOperator):
         veff_ao = np.squeeze (self.las.get_veff (dm1s=dm1_ao))
         return np.dot (moH, np.dot (veff_ao, mo))
 
+    get_veff_multi = lasci_sync.LASCI_HessianOperator._get_veff_multi_ao
+
     def split_veff (self, veff_mo, dm1s_mo):
         veff_c = veff_mo.copy ()
         ncore = self.ncore
@@ -124,8 +128,11 @@ class LASSCF_HessianOperator (lasci_sync.LASCI_HessianOperator):
         ocm2 = ocm2[:,:,:,ncore:nocc] + ocm2[:,:,:,ncore:nocc].transpose (1,0,3,2)
         ocm2 += ocm2.transpose (2,3,0,1)
         ecm2 = ocm2 + tcm2
-        f1_prime[:ncore,ncore:nocc] += np.tensordot (self.eri_paaa[:ncore], ecm2, axes=((1,2,3),(1,2,3)))
-        f1_prime[nocc:,ncore:nocc] += np.tensordot (self.eri_paaa[nocc:], ecm2, axes=((1,2,3),(1,2,3)))
+        f1_pa = np.zeros ((self.nmo, self.ncas), dtype=f1_prime.dtype)
+        for p0, p1, eri in self.loop_eri_paaa ():
+            f1_pa[p0:p1] = np.tensordot (eri, ecm2, axes=((1,2,3),(1,2,3)))
+        f1_prime[:ncore,ncore:nocc] += f1_pa[:ncore]
+        f1_prime[nocc:,ncore:nocc] += f1_pa[nocc:]
         return gorb + (f1_prime - f1_prime.T)
 
     def _update_h2eff_sub (self, mo1, umat, h2eff_sub):
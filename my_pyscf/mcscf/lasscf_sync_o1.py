@@ -224,7 +224,8 @@ class LASSCF_HessianOperator (lasscf_sync_o0.LASSCF_HessianOperator):
         sdm = dm1s_mo[0] - dm1s_mo[1]
         veff_s = np.zeros_like (veff_c)
         sdm_cas = sdm[ncore:nocc,ncore:nocc]
-        veff_s[:,ncore:nocc] = np.tensordot (self.eri_paaa, sdm_cas, axes=((1,2),(0,1)))
+        for p0, p1, eri in self.loop_eri_paaa ():
+            veff_s[p0:p1,ncore:nocc] = np.tensordot (eri, sdm_cas, axes=((1,2),(0,1)))
         veff_s[ncore:nocc,:] = veff_s[:,ncore:nocc].T
         veff_s[:,:] *= -0.5
         veffa = veff_c + veff_s
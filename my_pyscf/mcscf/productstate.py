@@ -79,12 +79,11 @@ class ProductStateFCISolver (StateAverageNMixFCISolver, lib.StreamObject):
                 ci1_inp = np.asarray (ci1[ix]).reshape (-1,na*nb)
                 ci1_guess = np.asarray (ci1_guess).reshape (-1,na*nb)
                 ovlp = ci1_inp.conj () @ ci1_guess.T
-                ci1_guess -= ovlp @ ci1_guess
-                ovlp = ci1_guess.conj () @ ci1_guess.T
-                Q, R = linalg.qr (ovlp)
-                ci1_guess = Q.T @ ci1_guess
+                ci1_guess -= ovlp.T @ ci1_inp
+                Q, R = linalg.qr (ci1_guess.T, mode='economic')
+                ci1_guess = Q[:,np.abs (np.diag (R)) > 1e-8].T
                 ci1[ix] = np.append (ci1_inp, ci1_guess, axis=0)[:solver.nroots].reshape (
-                    solver.nroots, na, nb)
+                    -1, na, nb)
         return self._check_init_guess (ci1, norb_f, nelec_f)
 
     def _check_init_guess (self, ci0, norb_f, nelec_f):
@@ -16,6 +16,7 @@
 # Copied and modified by MRH 09/26/2023
 
 import unittest
+import os
 from functools import reduce
 import numpy as np
 from pyscf import gto
@@ -122,6 +123,20 @@ class KnownValues(unittest.TestCase):
             hdiag_ref = h2mat[smult-1].diagonal ()
             self.assertAlmostEqual (lib.fp (hdiag), lib.fp (hdiag_ref), 8)
 
+    def test_hdiag_csf_chunked (self):
+        from mrh.my_pyscf.fci.csf import make_hdiag_csf
+        nel = (neleci, nelec)
+        for smult in range (1,8):
+          with self.subTest (smult=smult):
+            ne = nel[smult % 2]
+            sol.norb, sol.nelec, sol.smult = norb, ne, smult
+            sol.check_transformer_cache ()
+            hdiag_ref = make_hdiag_csf (h1e, g2e, norb, ne, sol.transformer, max_memory=100000)
+            # Room for only a few configurations at a time
+            max_memory = lib.current_memory ()[0] + .01
+            hdiag = make_hdiag_csf (h1e, g2e, norb, ne, sol.transformer, max_memory=max_memory)
+            self.assertAlmostEqual (np.amax (np.abs (hdiag - hdiag_ref)), 0, 12)
+
     def test_pspace(self):
         nel = (neleci, nelec)
         for smult in range (1,8):
@@ -131,6 +146,129 @@ class KnownValues(unittest.TestCase):
             h0_ref = h2mat[smult-1][addr,:][:,addr]
             self.assertAlmostEqual (lib.fp (h0), lib.fp (h0_ref), 8)
 
+    def test_pspace_reuse (self):
+        e_ref = csf_solver (mol, smult=1).kernel (h1e, g2e, norb, nelec)[0]
+        sol1 = csf_solver (mol, smult=1)
+        sol1.pspace_size = 20
+        sol1.pspace_reuse_tol = 1e-4
+        addr, h0 = sol1.pspace (h1e, g2e, norb, nelec, npsp=20)
+        self.assertTrue (hasattr (h0, 'pspace_eig'))
+        # Small change: same pspace
+        addr1, h01 = sol1.pspace (h1e + 1e-6*np.eye (norb), g2e, norb, nelec, npsp=20)
+        self.assertIs (h01, h0)
+        e = sol1.kernel (h1e + 1e-6*np.eye (norb), g2e, norb, nelec)[0]
+        self.assertAlmostEqual (e, e_ref + 1e-6*sum (nelec), 8)
+        # Large change: pspace rebuilt
+        addr1, h01 = sol1.pspace (h1e + 1e-2, g2e, norb, nelec, npsp=20)
+        self.assertIsNot (h01, h0)
+        # The kernel answer may not come from a reused pspace
+        sol1.pspace_size = 400
+        e = sol1.kernel (h1e, g2e, norb, nelec)[0]
+        self.assertAlmostEqual (e, e_ref, 8)
+
+    def test_transform_plan (self):
+        from mrh.my_pyscf.fci.csfstring import transform_civec_det2csf, transform_civec_csf2det
+        for smult in range (1,6,2):
+          with self.subTest (smult=smult):
+            t = CSFTransformer (norb, nelec[0], nelec[1], smult)
+            x = np.random.RandomState (smult).rand (3, t.ndet)
+            ref = transform_civec_det2csf (x, norb, nelec[0], nelec[1], smult,
+                                           csd_mask=t.csd_mask, do_normalize=False)[0]
+            out = np.empty_like (ref)
+            test = t.vec_det2csf (x, normalize=False, out=out)
+            self.assertIs (test, out)
+            self.assertAlmostEqual (np.amax (np.abs (test - ref)), 0, 12)
+            ref = transform_civec_csf2det (ref, norb, nelec[0], nelec[1], smult,
+                                           csd_mask=t.csd_mask, do_normalize=False)[0]
+            out = np.empty_like (ref)
+            test = t.vec_csf2det (test, normalize=False, out=out)
+            self.assertIs (test, out)
+            self.assertAlmostEqual (np.amax (np.abs (test - ref)), 0, 12)
+
+    def test_spin_evecs_cache (self):
+        from mrh.my_pyscf.fci.csfstring import SpinEvecsCache, _make_spin_evecs
+        from mrh.my_pyscf.fci.csfstring import LRUCache, CACHE_MAX_MEMORY
+        with self.assertRaises (TypeError):
+            LRUCache ()
+        cache = SpinEvecsCache ()
+        self.assertEqual (cache.max_memory, CACHE_MAX_MEMORY)
+        umat_ref = _make_spin_evecs (4, 2, 2, 1)
+        for i in range (3):
+            umat = cache (4, 2, 2, 1)
+            self.assertAlmostEqual (np.amax (np.abs (umat - umat_ref)), 0, 14)
+        self.assertFalse (umat.flags.writeable)
+        stats = cache.stats ()
+        self.assertEqual ((stats['hits'], stats['misses'], stats['size']), (2, 1, 1))
+        cache.max_memory = 1.5 * umat.nbytes / 1e6
+        cache (4, 3, 1, 3)
+        cache (4, 2, 2, 3)
+        self.assertLessEqual (cache.nbytes, cache.max_memory*1e6)
+        self.assertGreater (cache.evictions, 0)
+        cache.clear ()
+        self.assertEqual (len (cache), 0)
+
+    def test_csdstring_addrs (self):
+        from pyscf.fci import cistring
+        from mrh.my_pyscf.fci import csdstring
+        for norb, neleca, nelecb in ((6,3,2), (5,5,1), (7,2,2)):
+            ndetb = cistring.num_strings (norb, nelecb)
+            ndet = cistring.num_strings (norb, neleca) * ndetb
+            with self.subTest (norb=norb, nelec=(neleca,nelecb)):
+                csdaddrs = np.arange (ndet)
+                ddaddrs = csdstring.csdaddrs2ddaddrs (norb, neleca, nelecb, csdaddrs)
+                self.assertTrue (np.all (csdstring.ddaddrs2csdaddrs (norb, neleca, nelecb, ddaddrs) == csdaddrs))
+                csdstrs = csdstring.csdaddrs2csdstrs (norb, neleca, nelecb, csdaddrs)
+                self.assertTrue (np.all (csdstring.csdstrs2csdaddrs (norb, neleca, nelecb, csdstrs) == csdaddrs))
+                ddstrs = csdstring.csdstrs2ddstrs (norb, neleca, nelecb, csdstrs)
+                self.assertTrue (np.all (ddstrs[0] == cistring.addrs2str (norb, neleca, ddaddrs[0])))
+                self.assertTrue (np.all (ddstrs[1] == cistring.addrs2str (norb, nelecb, ddaddrs[1])))
+                csd_mask = csdstring.make_csd_mask (norb, neleca, nelecb)
+                self.assertTrue (np.all (csd_mask == ddaddrs[0]*ndetb + ddaddrs[1]))
+
+    def test_table_cache (self):
+        import tempfile
+        from mrh.my_pyscf.fci import csfstring
+        orbsym = [0,1,0,2,3,0]
+        ref = CSFTransformer (6, 3, 3, 1, orbsym=orbsym, wfnsym=0)
+        cache_dir0 = csfstring.TABLE_CACHE_DIR
+        with tempfile.TemporaryDirectory () as cache_dir:
+            csfstring.TABLE_CACHE_DIR = cache_dir
+            try:
+                for i in range (2):
+                    t = CSFTransformer (6, 3, 3, 1, orbsym=orbsym, wfnsym=0)
+                    for attr in ('csd_mask', 'econf_det_mask', 'econf_csf_mask', 'confsym'):
+                        with self.subTest (attr, load=bool(i)):
+                            self.assertTrue (np.all (getattr (t, attr) == getattr (ref, attr)))
+                            if i: self.assertIsInstance (getattr (t, attr), np.memmap)
+                self.assertEqual (len (os.listdir (cache_dir)), 4)
+                ci = np.random.RandomState (0).rand (t.ndeta, t.ndetb)
+                self.assertAlmostEqual (np.amax (np.abs (t.vec_det2csf (ci) - ref.vec_det2csf (ci))), 0, 12)
+            finally:
+                csfstring.TABLE_CACHE_DIR = cache_dir0
+
+    def test_table_cache_stale (self):
+        import tempfile
+        from mrh.my_pyscf.fci import csfstring
+        from mrh.my_pyscf.fci.csdstring import make_csd_mask
+        ref = make_csd_mask (6, 3, 3)
+        with tempfile.TemporaryDirectory () as cache_dir:
+            fname = os.path.join (cache_dir, 'csd_mask_v{}_u4_6_3_3.npy'.format (
+                csfstring.TABLE_CACHE_VERSION))
+            # Table of the wrong dtype under the current name
+            np.save (fname, np.zeros (ref.size, dtype=np.float64))
+            test = csfstring.load_or_make_table ('csd_mask', (6,3,3), make_csd_mask, 6, 3, 3,
+                                                 dtype=np.uint32, cache_dir=cache_dir)
+            self.assertEqual (test.dtype, np.uint32)
+            self.assertTrue (np.all (test == ref))
+            self.assertEqual (np.load (fname).dtype, np.uint32)
+            # Table written by an older version of the code
+            np.save (os.path.join (cache_dir, 'csd_mask_v0_u4_6_3_3.npy'),
+                     np.zeros (ref.size, dtype=np.uint32))
+            test = csfstring.load_or_make_table ('csd_mask', (6,3,3), make_csd_mask, 6, 3, 3,
+                                                 dtype=np.uint32, cache_dir=cache_dir)
+            self.assertIsInstance (test, np.memmap)
+            self.assertTrue (np.all (test == ref))
+
 if __name__ == "__main__":
     print("Full Tests for spin1")
     unittest.main()
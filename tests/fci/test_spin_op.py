@@ -1,3 +1,4 @@
+import warnings
 import numpy as np
 import unittest
 from scipy import linalg
@@ -62,6 +63,46 @@ class KnownValues(unittest.TestCase):
                     self.assertAlmostEqual (smult_test, smult, 9)
                     self.assertAlmostEqual (chc_test, chc_ref, 9)
 
+    def test_ladder_batch (self):
+        from mrh.my_pyscf.fci.spin_op import sladder_map_cache
+        from mrh.my_pyscf.fci.csfstring import LRUCache
+        norb, nelec = 6, (4,2)
+        cishape = [cistring.num_strings (norb, ne) for ne in nelec]
+        ci = np.random.default_rng (39).random ((3, *cishape))
+        for op, contract in ((-1, contract_sdown), (1, contract_sup)):
+            with self.subTest (op=op):
+                ref = np.stack ([contract (c, norb, nelec) for c in ci], axis=0)
+                test = contract (ci, norb, nelec)
+                self.assertEqual (test.shape, ref.shape)
+                self.assertAlmostEqual (np.amax (np.abs (test - ref)), 0, 12)
+                self.assertIn ((norb, nelec[0], nelec[1], op), sladder_map_cache)
+        self.assertIsInstance (sladder_map_cache, LRUCache)
+        maps = sladder_map_cache (norb, nelec[0], nelec[1], -1)
+        self.assertEqual (sladder_map_cache._nbytes (maps), sum ([x.nbytes for m in maps for x in m]))
+
+    def test_spin_multiplet (self):
+        from mrh.my_pyscf.fci.spin_op import make_spin_multiplet
+        from mrh.my_pyscf.fci.csfstring import CSFTransformer
+        rng = np.random.default_rng (39)
+        for norb, nelec_tot, smult in ((4,4,3), (5,5,4), (6,6,5), (6,4,5), (6,5,2)):
+            nelec = ((nelec_tot+smult-1)//2, (nelec_tot-smult+1)//2)
+            t = CSFTransformer (norb, nelec[0], nelec[1], smult)
+            ci = t.vec_csf2det (rng.random ((3, t.ncsf)) - .5).reshape (3, t.ndeta, t.ndetb)
+            test = make_spin_multiplet (ci, norb, nelec, smult)
+            self.assertEqual (len (test), smult)
+            ref = ci
+            for k in range (smult):
+                with self.subTest (norb=norb, nelec=nelec_tot, smult=smult, k=k):
+                    self.assertEqual (test[k].shape, ref.shape)
+                    self.assertAlmostEqual (np.amax (np.abs (test[k] - ref)), 0, 10)
+                with warnings.catch_warnings ():
+                    warnings.simplefilter ('error')
+                    ref = contract_sdown (ref, norb, (nelec[0]-k, nelec[1]+k))
+            # Lowering the M_S = -S component is null
+            with self.subTest (norb=norb, nelec=nelec_tot, smult=smult, k=smult):
+                self.assertTrue (np.all (np.isfinite (ref)))
+                self.assertEqual (np.count_nonzero (ref), 0)
+
 if __name__ == "__main__":
     print("Full Tests for fci.spin_op")
     unittest.main()
@@ -1,11 +1,21 @@
 import unittest
+import numpy as np
 from pyscf import gto, scf
+from mrh.my_pyscf.mcscf.lasscf_o0 import LASSCF
 
 def setUpModule():
-    pass
+    global mol, mf, las, mo
+    xyz='''H 0 0 0; H 1 0 0; H 3 0 0; H 4 0 0; H 6 0 0; H 7.1 0 0; H 9 0 0; H 10 0 0'''
+    mol = gto.M (atom=xyz, basis='6-31g', symmetry=False, verbose=0, output='/dev/null')
+    mf = scf.RHF (mol).run ()
+    las = LASSCF (mf, (2,3,2), ((1,1),(1,1),(1,1)))
+    mo = las.localize_init_guess (([0,1],[2,3,4,5],[6,7]), mf.mo_coeff)
+    las.lasci (mo)
 
 def tearDownModule():
-    pass
+    global mol, mf, las, mo
+    mol.stdout.close ()
+    del mol, mf, las, mo
 
 class KnownValues (unittest.TestCase):
 
@@ -30,6 +40,110 @@ class KnownValues (unittest.TestCase):
             las1.kernel ()
             self.assertLessEqual (las1.e_tot, las.e_states[i])
 
+    def test_get_h2eff_slice (self):
+        from pyscf import ao2mo
+        h2eff_sub = las.tag_h2eff_slice_cache (las.get_h2eff (mo))
+        ncore, ncas = las.ncore, las.ncas
+        ix_i, ix_j = np.tril_indices (ncas)
+        eri_cas = h2eff_sub[ncore:ncore+ncas].reshape (ncas*ncas, -1)[(ix_i*ncas)+ix_j]
+        eri_cas = ao2mo.restore (1, eri_cas, ncas)
+        for ifrag in range (las.nfrags):
+            i = sum (las.ncas_sub[:ifrag])
+            j = i + las.ncas_sub[ifrag]
+            eri_ref = eri_cas[i:j,i:j,i:j,i:j]
+            for compact in (None, 4, 8):
+                with self.subTest (ifrag=ifrag, compact=compact):
+                    eri_test = las.get_h2eff_slice (h2eff_sub, ifrag, compact=compact)
+                    # memoized slices are shared, so they must not be writeable
+                    with self.assertRaises (ValueError):
+                        eri_test[(0,)*eri_test.ndim] = 0
+                    if compact: eri_test = ao2mo.restore (1, eri_test, j-i)
+                    self.assertAlmostEqual (np.amax (np.abs (eri_test-eri_ref)), 0, 12)
+        self.assertEqual (len (h2eff_sub.eri_sub_cache), 3*las.nfrags)
+
+    def test_hessian_matmat (self):
+        las_df = LASSCF (mf.density_fit (), (2,3,2), ((1,1),(1,1),(1,1)))
+        las_df.lasci (mo)
+        for my_las in (las, las_df):
+            ugg = my_las.get_ugg (mo)
+            h_op = my_las.get_hop (mo_coeff=mo, ugg=ugg)
+            X = np.random.RandomState (1).rand (ugg.nvar_tot, 3) - .5
+            HX_ref = np.stack ([h_op.matvec (x) for x in X.T], axis=1)
+            with self.subTest (df=hasattr (my_las, 'with_df')):
+                self.assertAlmostEqual (np.amax (np.abs (h_op.matmat (X) - HX_ref)), 0, 9)
+
+    def test_h2eff_row_blocks (self):
+        X = np.random.RandomState (2).rand (las.get_ugg ().nvar_tot) - .5
+        def get_results ():
+            ugg = las.get_ugg ()
+            h2eff_sub = las.get_h2eff (las.mo_coeff)
+            h_op = las.get_hop (ugg=ugg, h2eff_sub=h2eff_sub)
+            h2eff_can = las.canonicalize (h2eff_sub=h2eff_sub)[-1]
+            return (h_op.get_grad (), h_op.matvec (X), las.energy_elec (h2eff=h2eff_sub),
+                    h2eff_can)
+        ref = get_results ()
+        # Only one row of h2eff_sub can be unpacked at a time
+        max_memory = las.max_memory
+        las.max_memory = 0
+        try:
+            test = get_results ()
+        finally:
+            las.max_memory = max_memory
+        for lbl, r, t in zip (('grad', 'hx', 'energy', 'canonicalize'), ref, test):
+            with self.subTest (lbl):
+                self.assertAlmostEqual (np.amax (np.abs (t - r)), 0, 9)
+
+    def test_prec_ci_blocks (self):
+        e_tot = []
+        for max_ncsf_prec_block in (0, 100):
+            las1 = LASSCF (mf, (2,4,2), ((1,1),(2,2),(1,1)))
+            las1.max_ncsf_prec_block = max_ncsf_prec_block
+            las1.max_cycle_micro = 50
+            mo1 = las1.localize_init_guess (([0,1],[2,3,4,5],[6,7]), mf.mo_coeff)
+            las1.kernel (mo1)
+            self.assertTrue (las1.converged)
+            e_tot.append (las1.e_tot)
+        self.assertAlmostEqual (e_tot[1], e_tot[0], 6)
+        # Each block inverts the Hessian in the complement of the CI vector
+        from mrh.my_pyscf.mcscf import lasscf_sync_o1
+        las1 = LASSCF (mf, (2,3,2), ((1,1),(1,1),(1,1)))
+        las1.max_ncsf_prec_block = 100
+        h_op = las1.get_hop (mo_coeff=las.mo_coeff, ci=las.ci)
+        ugg = h_op.ugg
+        Minv_blocks = h_op._get_prec_ci_blocks (h_op._get_Hdiag ())
+        self.assertEqual (len (Minv_blocks), 3)
+        for (i, j, Minv), ci, tf in zip (Minv_blocks, las.ci, ugg.ci_transformers):
+            with self.subTest ('block', i=i):
+                X = np.zeros ((ugg.nvar_tot, j-i))
+                X[i:j,:] = np.eye (j-i)
+                Hblk = h_op._matmat (X)[i:j,:]
+                c = tf[0].vec_det2csf (ci[0], normalize=True).ravel ()
+                proj = np.eye (j-i) - np.multiply.outer (c, c)
+                Hblk = proj @ Hblk @ proj
+                self.assertAlmostEqual (np.amax (np.abs (Hblk @ Minv - proj)), 0, 6)
+        # The sync_o1 Hessian operator calls get_prec before its eris exist
+        las1 = lasscf_sync_o1.LASSCF (mf, (2,3,2), ((1,1),(1,1),(1,1)))
+        las1.max_ncsf_prec_block = 100
+        h_op1 = las1.get_hop (mo_coeff=las.mo_coeff, ci=las.ci)
+        g_vec = h_op.get_grad ()
+        with self.subTest ('sync_o1'):
+            self.assertAlmostEqual (np.amax (np.abs (h_op1.get_prec () (g_vec)
+                                                     - h_op.get_prec () (g_vec))), 0, 9)
+
+    def test_incr_veff (self):
+        results = []
+        for max_cycle_incr_veff in (0, 4):
+            las1 = LASSCF (mf, (2,3,2), ((1,1),(1,1),(1,1)))
+            las1.max_cycle_incr_veff = max_cycle_incr_veff
+            las1.conv_tol_grad = 1e-6
+            las1.max_cycle_micro = 50
+            las1.kernel (mo)
+            self.assertTrue (las1.converged)
+            results.append ((las1.e_tot, las1.get_hop ().get_grad ()))
+        (e_ref, g_ref), (e_test, g_test) = results
+        self.assertAlmostEqual (e_test, e_ref, 9)
+        self.assertAlmostEqual (np.amax (np.abs (g_test - g_ref)), 0, 6)
+
 if __name__ == "__main__":
     print("Full Tests for LASSCF/LASCI miscellaneous")
     unittest.main()
@@ -13,13 +13,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import copy
+import h5py
 import unittest
+from io import StringIO
 import numpy as np
 from scipy import linalg
 from pyscf import lib, gto, scf, mcscf, ao2mo
 from mrh.my_pyscf.mcscf.lasscf_o0 import LASSCF
 from mrh.my_pyscf.lassi import LASSI, LASSIrq, LASSIrqCT
-from mrh.my_pyscf.lassi.lassi import root_make_rdm12s, make_stdm12s
+from mrh.my_pyscf.lassi.lassi import root_make_rdm12s, make_stdm12s, lassi
 from mrh.my_pyscf.lassi.states import all_single_excitations, SingleLASRootspace
 from mrh.my_pyscf.mcscf.lasci import get_space_info
 from mrh.my_pyscf.lassi import op_o0, op_o1, lassis
@@ -74,6 +76,28 @@ class KnownValues(unittest.TestCase):
         u, svals, vh = linalg.svd (ovlp)
         self.assertAlmostEqual (lib.fp (svals), lib.fp (np.ones (len (svals))), 8)
 
+    def test_validate (self):
+        for validate in ('sample', 'full'):
+            with self.subTest (validate=validate):
+                e_roots, si = LASSI (lsi._las, validate=validate).kernel (opt=1)
+                self.assertAlmostEqual (lib.fp (e_roots), lib.fp (lsi.e_roots), 8)
+        with self.assertRaises (RuntimeError):
+            LASSI (lsi._las, validate='some').kernel ()
+        # The sampled rows are reproducible; lassi () of a plain LAS object takes the sample
+        # size and seed as kwargs
+        las1 = copy.copy (lsi._las)
+        las1.verbose = lib.logger.DEBUG
+        logs = []
+        for i in range (2):
+            las1.stdout = StringIO ()
+            e_roots = lassi (las1, validate='sample', validate_nsample=2, validate_seed=7)[0]
+            self.assertAlmostEqual (lib.fp (e_roots), lib.fp (lsi.e_roots), 8)
+            logs.append ([l for l in las1.stdout.getvalue ().splitlines () if 'check rows' in l])
+        self.assertTrue (len (logs[0]))
+        self.assertEqual (logs[0], logs[1])
+        for l in logs[0]:
+            self.assertEqual (len (l.split (':')[-1].strip (' []').split ()), 2)
+
     def test_casci_limit (self):
         # CASCI limit
         casdm1, casdm2 = mc.fcisolver.make_rdm12 (mc.ci, mc.ncas, mc.nelecas)
@@ -104,6 +128,23 @@ class KnownValues(unittest.TestCase):
         lsi1 = LASSIrq (las, 2, 3).run ()
         self.assertAlmostEqual (lsi1.e_roots[0], mc.e_tot, 8)
 
+    def test_lassirq_extend (self):
+        lsi1 = LASSIrq (las, 1, 1)
+        e_rq = lsi1.scan_rq ([(1,1),(1,2),(2,3)])
+        lsi2 = LASSIrq (las, 2, 3).run ()
+        self.assertAlmostEqual (e_rq[-1], lsi2.e_roots[0], 8)
+        self.assertAlmostEqual (lsi1.e_roots[0], mc.e_tot, 8)
+        self.assertLessEqual (e_rq[1], e_rq[0]+1e-8)
+        # r grows at fixed q: every rootspace of (1,1) is reused, with its Hamiltonian blocks
+        lsi1 = LASSIrq (las, 1, 1).run ()
+        nroots1 = lsi1.nroots
+        lsi1.extend (r=2)
+        self.assertEqual (np.count_nonzero (~lsi1._rq_prev['todo']), nroots1)
+        self.assertLess (nroots1, lsi1.nroots)
+        lsi2 = LASSIrq (las, 2, 1).run ()
+        self.assertAlmostEqual (lsi1.e_roots[0], lsi2.e_roots[0], 8)
+        self.assertAlmostEqual (lib.fp (lsi1.si.ham_mat), lib.fp (lsi2.si.ham_mat), 8)
+
     def test_lassirqct (self):
         lsi1 = LASSIrqCT (las, 2, 3).run ()
         self.assertAlmostEqual (lsi1.e_roots[0], -4.2879945248402445, 8)
@@ -147,9 +188,11 @@ class KnownValues(unittest.TestCase):
                             self.assertAlmostEqual (lib.fp (hket_pq_s), lib.fp (hket_ref_s), 8)
 
     def test_lassis (self):
-        for opt in (0,1):
-            with self.subTest (opt=opt):
-                lsis = lassis.LASSIS (las).run (opt=opt)
+        for opt, max_workers in ((0,1), (1,1), (1,2)):
+            with self.subTest (opt=opt, max_workers=max_workers):
+                lsis = lassis.LASSIS (las)
+                lsis.max_workers = max_workers
+                lsis.run (opt=opt)
                 e_upper = las.e_states[0]
                 e_lower = lsi.e_roots[0]
                 self.assertLessEqual (e_lower, lsis.e_roots[0])
@@ -158,6 +201,74 @@ class KnownValues(unittest.TestCase):
                 # Reference depends on rng seed obviously b/c this is not casci limit
                 self.assertAlmostEqual (lsis.e_roots[0], -4.134472877702426, 8)
 
+    def test_run_tasks_log_order (self):
+        import io, time
+        from mrh.my_pyscf.lassi.citools import _run_tasks
+        def make_task (k):
+            def task (stdout):
+                log = lib.logger.Logger (stdout, lib.logger.INFO)
+                log.info ('task %d start', k)
+                time.sleep (.01 * (4-k)) # later tasks finish first
+                log.note ('task %d end', k)
+                return k
+            return task
+        out = []
+        logger_flush = lib.logger.flush
+        for max_workers in (1, 4):
+            buf = io.StringIO ()
+            tasks = [make_task (k) for k in range (4)]
+            self.assertEqual (_run_tasks (tasks, costs=[0,1,2,3], max_workers=max_workers,
+                                          stdout=buf), list (range (4)))
+            self.assertIs (lib.logger.flush, logger_flush)
+            out.append (buf.getvalue ())
+        self.assertEqual (out[1], out[0])
+
+    def test_lassis_chkfile (self):
+        import tempfile
+        with tempfile.NamedTemporaryFile (suffix='.chk') as chk:
+            lsis = lassis.LASSIS (las)
+            lsis.chkfile = chk.name
+            e_ref = lsis.kernel ()[0][0]
+            # Not saved unless asked for
+            if h5py.is_hdf5 (chk.name):
+                with h5py.File (chk.name, 'r') as fh5:
+                    self.assertNotIn ('lsis_excitations', fh5)
+            lsis.dump_chk_excitations = True
+            e_ref = lsis.kernel ()[0][0]
+            lsis1 = lassis.LASSIS (las).load_excitations_(chk.name)
+        for name in ('ci_spin_flips', 'ci_charge_hops'):
+            ci_ref, ci_test = getattr (lsis, name), getattr (lsis1, name)
+            self.assertEqual (set (ci_ref.keys ()), set (ci_test.keys ()))
+            for key in ci_ref:
+                for c_ref, c_test in zip (ci_ref[key], ci_test[key]):
+                    self.assertAlmostEqual (lib.fp (c_test), lib.fp (c_ref), 12)
+        # Cached vectors in a different orbital basis are projected
+        mo0 = lsis1._ci_cache_basis[1].copy ()
+        mo0[:,las.ncore] *= -1
+        lsis1._ci_cache_basis = (lsis1._ci_cache_basis[0], mo0)
+        self.assertAlmostEqual (lsis1.kernel ()[0][0], e_ref, 8)
+        self.assertIsNone (lsis1._ci_cache_old)
+
+    def test_lassis_scanner (self):
+        def build (d):
+            return gto.M (atom='H 0 0 0; H 1 0 0; H {} 0 0; H {} 0 0'.format (1+d, 2+d),
+                          basis='6-31g', verbose=0, output='/dev/null')
+        def run_las (my_mol):
+            my_las = LASSCF (scf.RHF (my_mol).run (), (2,2), (2,2))
+            my_las.kernel (my_las.localize_init_guess (([0,1],[2,3])))
+            return my_las
+        scanner = lassis.LASSIS (run_las (build (1.5))).run ().as_scanner ()
+        psexc0 = {i: step['psexc'] for i, step in scanner._hop_plan.items ()
+                  if isinstance (step, dict) and 'psexc' in step}
+        self.assertTrue (len (psexc0))
+        for d in (1.6, 1.7):
+            e_test = scanner (build (d))
+            e_ref = lassis.LASSIS (run_las (build (d))).kernel ()[0][0]
+            with self.subTest (d=d):
+                self.assertAlmostEqual (e_test, e_ref, 6)
+                for i, psexc in psexc0.items ():
+                    self.assertIs (scanner._hop_plan[i]['psexc'], psexc)
+
 if __name__ == "__main__":
     print("Full Tests for LASSI of random 2,2 system")
     unittest.main()
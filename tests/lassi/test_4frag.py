@@ -113,6 +113,15 @@ class KnownValues(unittest.TestCase):
         for lbl, mat, fp in zip (lbls, mats_o1, fps_o0):
             with self.subTest(matrix=lbl):
                 self.assertAlmostEqual (lib.fp (mat), fp, 9)
+        mats_o0 = op_o0.ham (las, h1, h2, las.ci, nelec_frs, max_workers=2, max_memory=1e-3)
+        for lbl, mat, fp in zip (lbls, mats_o0, fps_o0):
+            with self.subTest('batched', matrix=lbl):
+                self.assertAlmostEqual (lib.fp (mat), fp, 12)
+        ikets = [len (mats_o0[0])-1, 0, len (mats_o0[0])//2]
+        mats_rows = op_o0.ham (las, h1, h2, las.ci, nelec_frs, ikets=ikets)
+        for lbl, mat, mat_ref in zip (lbls, mats_rows, mats_o0):
+            with self.subTest('rows', matrix=lbl):
+                self.assertAlmostEqual (lib.fp (mat), lib.fp (mat_ref[ikets]), 12)
 
     def test_rdm12s (self):
         d12_o0 = op_o0.roots_make_rdm12s (las, las.ci, nelec_frs, si)#, orbsym=orbsym, wfnsym=wfnsym)
@@ -134,6 +134,21 @@ class KnownValues(unittest.TestCase):
         # 5 + 4 + 12 + 4 + 8 = 33
         self.assertEqual (las2.nroots, 33)
 
+    def test_rootspace_table (self):
+        from mrh.my_pyscf.lassi.states import get_rootspace_table
+        for my_las in (lsi._las, las):
+            tab = get_rootspace_table (my_las)
+            for lbl, tab1, fn in (('singles', tab.get_singles (), 'get_singles'),
+                                  ('shuffles', tab.get_spin_shuffles (), 'gen_spin_shuffles')):
+                ref = [sp for i in range (len (tab)) for sp in getattr (tab[i], fn) ()]
+                with self.subTest (lbl, nfrag=tab.nfrag):
+                    self.assertEqual (len (tab1), len (ref))
+                    for i, sp in enumerate (ref):
+                        self.assertEqual (tab1[i], sp)
+                    self.assertEqual (len (tab1.unique ()), len (set (ref)))
+        self.assertTrue (np.all (tab.isin (tab)))
+        self.assertFalse (np.any (tab.is_orthogonal_by_smult (tab)))
+
     def test_spin_shuffle (self):
         from mrh.my_pyscf.lassi.states import spin_shuffle, spin_shuffle_ci
         mf = lsi._las._scf
@@ -157,6 +172,41 @@ class KnownValues(unittest.TestCase):
         with self.subTest ("CI vector rotation"):
             self.assertLess (np.amax (np.abs (errvec)), 1e-8)
 
+    def test_spin_shuffle_lazy (self):
+        from mrh.my_pyscf.lassi.states import spin_shuffle, spin_shuffle_ci, szrot_cache
+        from mrh.my_pyscf.lassi.states import SingleLASRootspace, SzRotatedCI, LazyCIList
+        from mrh.my_pyscf.mcscf.lasci import get_space_info
+        las3 = spin_shuffle (las)
+        ci = spin_shuffle_ci (las3, las3.ci)
+        charges, spins, smults = get_space_info (las3)[:3]
+        ref = SingleLASRootspace (las3, spins[0], smults[0], charges[0], 0,
+                                  ci=[c[0] for c in ci])
+        ci_sz = ref.get_ci_szrot ()
+        max_memory = szrot_cache.max_memory
+        try:
+            for mem in (max_memory, 0):
+                szrot_cache.max_memory = mem
+                szrot_cache.clear ()
+                for ifrag, c in enumerate (ci):
+                    self.assertIsInstance (c, LazyCIList)
+                    for ix in range (las3.nroots):
+                        with self.subTest (max_memory=mem, ifrag=ifrag, rootspace=ix):
+                            c_ix = c[ix]
+                            self.assertIsInstance (c_ix, np.ndarray)
+                            c_ref = ci_sz[ifrag][spins[ix,ifrag]]
+                            self.assertAlmostEqual (lib.fp (c_ix), lib.fp (c_ref), 9)
+                            if isinstance (c.get_raw (ix), SzRotatedCI):
+                                self.assertEqual (c_ix.ndim, 3)
+                                if not c.get_raw (ix).is_identity:
+                                    self.assertEqual (c.get_raw (ix)._ci1 is not None, mem > 0)
+                                # The result is a copy: the reference is unchanged
+                                c_ix[:] = 0
+                                self.assertAlmostEqual (lib.fp (c[0]), lib.fp (ci_sz[ifrag][spins[0,ifrag]]), 12)
+                                self.assertAlmostEqual (lib.fp (c[ix]), lib.fp (c_ref), 9)
+                self.assertEqual (szrot_cache.nbytes > 0, mem > 0)
+        finally:
+            szrot_cache.max_memory = max_memory
+
     def test_lassis (self):
         for opt in (0,1):
             with self.subTest (opt=opt):
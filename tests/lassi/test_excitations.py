@@ -235,6 +235,32 @@ class KnownValues(unittest.TestCase):
             self.assertAlmostEqual (energy_tot, e_roots1[idx_match], 6)
             self.assertEqual (idx_match, 0) # local minimum problems
 
+    def test_vrv_contract (self):
+        from mrh.my_pyscf.lassi.excitations import vrv_fcisolver
+        rng = np.random.RandomState (0)
+        q, p, na, nb = 5, 2, 6, 4
+        v_qpab = rng.rand (q, p, na, nb) - .5
+        v_qpab[3] = v_qpab[0] + 2*v_qpab[1] # rank-deficient
+        e_q = rng.rand (q)
+        s = csf_solver (mol, smult=1).set (nelec=(2,2), norb=4)
+        s = vrv_fcisolver (s, 0.0, e_q, v_qpab)
+        ket = rng.rand (3, na, nb)
+        # The SVD truncates the rank-deficient V_PQ only if q*p >= vrv_svd_min_size
+        for min_size, rank in ((0, 8), (q*p+1, q*p)):
+            s.vrv_svd_min_size = min_size
+            s.v_qpab = v_qpab
+            self.assertEqual (s._vrv_w.shape[0], rank)
+            self.assertAlmostEqual (np.amax (np.abs (s.v_qpab - v_qpab)), 0, 12)
+            for denom_q in (0.0, e_q[2] - e_q):
+                with self.subTest (vrv_svd_min_size=min_size, denom_q=denom_q):
+                    s.denom_q = denom_q
+                    ref = np.stack ([s._contract_vrv_dense (k, v_qpab,
+                                                            np.broadcast_to (denom_q, q))
+                                     for k in ket], axis=0)
+                    self.assertAlmostEqual (np.amax (np.abs (s.contract_vrv (ket) - ref)), 0, 12)
+                    self.assertAlmostEqual (np.amax (np.abs (s.contract_vrv (ket[0]) - ref[0])),
+                                            0, 12)
+
 if __name__ == "__main__":
     print("Full Tests for LASSI excitation constructor")
     unittest.main()